@@ -52,6 +52,22 @@ class Settings(BaseSettings):
     CARTESIA_MODEL_ID: str = "sonic-english"
     CARTESIA_VOICE_ID: str = "694f9389-aac1-45b6-b726-9d9369183238"  # Child-friendly voice
     USE_CARTESIA_TTS: bool = True  # Use Cartesia instead of Azure
+    TTS_SPEED: float = 1.0  # Cartesia speech speed (0.6-1.5)
+    TTS_CHUNKED: bool = False  # Synthesize sentence/paragraph chunks concurrently
+    TTS_STREAMING: bool = False  # Stream single-request renders straight to the WAV file
+    TTS_CACHE_ENABLED: bool = True  # Reuse renders of identical text and voice settings
+    TTS_CACHE_DIR: str = "./cache/tts"
+    TTS_CACHE_MAX_MB: int = 2048
+    TTS_CHUNK_MAX_CHARS: int = 600
+    TTS_CHUNK_CONCURRENCY: int = 4  # Concurrent Cartesia requests per story
+    TTS_CHUNK_RETRIES: int = 2  # Retries per failed chunk
+    TTS_CHUNK_GAP_MS: int = 150  # Silence between sentence chunks (doubled at paragraph breaks)
+
+    # Provider HTTP connection pool
+    HTTP_TIMEOUT_SECONDS: float = 60.0
+    HTTP_MAX_CONNECTIONS: int = 20
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
 
     # Story Configuration
     STORY_MIN_LENGTH: int = 400
@@ -61,13 +77,73 @@ class Settings(BaseSettings):
 
     # Audio Configuration
     AUDIO_FORMAT: str = "mp3"
-    AUDIO_BITRATE: str = "128k"
+    AUDIO_BITRATE: str = "128k"  # MP3, the primary rendition
+    AUDIO_RENDITIONS: str = "mp3,aac,opus"  # Formats each story is encoded into (mp3 is always included; add "hls" for segmented playback)
+    AUDIO_AAC_BITRATE: str = "64k"
+    AUDIO_OPUS_BITRATE: str = "40k"  # Speech over a music bed stays clear at 32-48 kbps
+    HLS_SEGMENT_SECONDS: int = 6
+    HLS_SEGMENT_TYPE: str = "fmp4"  # "fmp4" or "mpegts"
     AUDIO_SAMPLE_RATE: int = 44100
+    MIX_ENGINE: str = "numpy"  # "numpy" (vectorized, in place), "stream" (constant memory, blocks piped to ffmpeg), "ffmpeg" (one filter graph, no Python DSP) or "pydub"
+    AUDIO_PROCESS_WORKERS: int = 2  # Processes for mixing/encoding (0 runs audio jobs in a thread instead)
+    MUSIC_DURATION_MARGIN: float = 1.15  # Headroom on the estimated narration length for the music bed
+
+    # Background Music Library
+    MUSIC_SOURCE_POLICY: str = "library_then_live"  # "library_only", "library_then_live" or "live_only"
+    MUSIC_LIBRARY_DIR: str = "./stories/music_library"
+    MUSIC_LIBRARY_WARMER_ENABLED: bool = False  # Pre-render beds in the background (set True on one node only)
+    MUSIC_LIBRARY_BEDS_PER_MOOD: int = 3
+    MUSIC_LIBRARY_BED_SECONDS: int = 90  # Beds are looped by the mixer
+    MUSIC_LIBRARY_REFRESH_HOURS: float = 24.0  # Replace beds older than this (0 disables rotation)
+    MUSIC_LIBRARY_RETIRED_GRACE_HOURS: float = 6.0  # Keep replaced beds this long for stories that picked them
+    MUSIC_LIBRARY_WARM_INTERVAL_SECONDS: int = 600
+
+    # Lyria RealTime Sessions
+    LYRIA_MAX_SESSIONS: int = 4  # Sessions streaming at the same time; further requests wait
+    LYRIA_POOL_MAX_IDLE: int = 2  # Paused sessions kept for reuse (0 connects fresh every time)
+    LYRIA_SESSION_MAX_AGE_SECONDS: int = 600  # Recycle sessions older than this
+    LYRIA_SESSION_IDLE_TIMEOUT_SECONDS: int = 120  # Close paused sessions unused this long
+
+    # Generation Scheduler
+    GENERATION_MAX_CONCURRENCY: int = 4  # Stories generated at the same time
+    GENERATION_QUEUE_MAX_SIZE: int = 100  # Stories allowed to wait; beyond this POSTs get 503
+    GENERATION_RETRY_AFTER_SECONDS: int = 30
+    GENERATION_BACKEND: str = "inprocess"  # "inprocess" or "worker" (stories claimed by `python -m app.worker`)
+
+    # Generation Workers (leases and attempts also apply to the in-process scheduler)
+    WORKER_LEASE_SECONDS: int = 60  # Claim validity without a heartbeat
+    WORKER_POLL_INTERVAL_SECONDS: float = 2.0
+    WORKER_MAX_ATTEMPTS: int = 3  # Interrupted runs before a story is marked failed
 
     # File Storage
     STORIES_DIR: str = "./stories"
+    BLOB_STORE_DIR: str = "./stories/blobs"  # Generated audio stored by content hash, reference counted
     MAX_STORY_FILE_SIZE_MB: int = 50
 
+    # Storage Backend for finished audio
+    STORAGE_BACKEND: str = "local"  # "local" (BLOB_STORE_DIR) or "s3" (any S3-compatible store, needs boto3)
+    STORAGE_S3_BUCKET: str = ""
+    STORAGE_S3_PREFIX: str = "storymagic"
+    STORAGE_S3_ENDPOINT_URL: str = ""  # e.g. http://localhost:9000 for MinIO; empty for AWS
+    STORAGE_S3_REGION: str = ""
+    STORAGE_S3_ACCESS_KEY_ID: str = ""  # Empty uses boto3's default credential chain
+    STORAGE_S3_SECRET_ACCESS_KEY: str = ""
+    STORAGE_MULTIPART_THRESHOLD_MB: int = 8
+    STORAGE_MULTIPART_CHUNK_MB: int = 8
+    STORAGE_MAX_CONCURRENCY: int = 4  # Parts transferred in parallel per file
+    STORAGE_REDIRECT: bool = True  # Redirect audio requests to presigned URLs (s3 only)
+    STORAGE_PRESIGN_EXPIRES_SECONDS: int = 3600
+    STORAGE_CACHE_MAX_MB: int = 2048  # Read-through cache of remote audio in BLOB_STORE_DIR (0 for unbounded)
+
+    # Orphaned Artifact GC (also `python -m app.gc`)
+    GC_ENABLED: bool = False  # Collect periodically in this process (enable on one node)
+    GC_INTERVAL_HOURS: float = 6.0
+    GC_GRACE_HOURS: float = 24.0  # Unreferenced files younger than this are kept
+    GC_BATCH_SIZE: int = 500
+    GC_MAX_FILES_PER_SECOND: float = 50.0  # 0 for unlimited
+    GC_MAX_MB_PER_SECOND: float = 100.0  # 0 for unlimited
+    GC_ARCHIVE_DIR: str = ""  # Move artifacts here instead of deleting them
+
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 10
     RATE_LIMIT_PER_HOUR: int = 100
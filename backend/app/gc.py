@@ -0,0 +1,84 @@
+"""
+Orphaned artifact garbage collector
+
+Removes (or archives) files in STORIES_DIR that no story or saved version
+references and that are older than the grace period:
+
+    python -m app.gc --dry-run
+    python -m app.gc --grace-hours 48 --archive-dir /mnt/archive/stories
+
+Set GC_ENABLED=True to run the same pass periodically inside one API or
+worker process instead.
+"""
+
+import argparse
+import logging
+import signal
+import sys
+from app.core.config import settings
+from app.core.database import init_db
+from app.services.artifact_gc import build_collector
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="StoryMagic orphaned artifact garbage collector")
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Report what would be removed without touching any file"
+    )
+    parser.add_argument(
+        "--grace-hours", type=float, default=None,
+        help=f"Keep unreferenced files younger than this (default {settings.GC_GRACE_HOURS:g})"
+    )
+    parser.add_argument(
+        "--archive-dir", default=None,
+        help="Move artifacts here instead of deleting them"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=None,
+        help="Directory entries and rows handled per batch"
+    )
+    parser.add_argument(
+        "--max-files-per-second", type=float, default=None,
+        help="Removal rate limit (0 for unlimited)"
+    )
+    parser.add_argument(
+        "--max-mb-per-second", type=float, default=None,
+        help="Removed or archived MB per second (0 for unlimited)"
+    )
+    parser.add_argument(
+        "--list", action="store_true",
+        help="Print every artifact removed (or that would be)"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    init_db()
+
+    collector = build_collector(
+        dry_run=args.dry_run,
+        grace_hours=args.grace_hours,
+        archive_dir=args.archive_dir,
+        batch_size=args.batch_size,
+        max_files_per_second=args.max_files_per_second,
+        max_mb_per_second=args.max_mb_per_second
+    )
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: collector.cancel())
+
+    report = collector.collect()
+
+    if args.list:
+        for path in report.removed_paths:
+            print(path)
+    print(report.summary())
+    return 1 if report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,19 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from app.core.config import settings
-from app.core.database import init_db
+from app.core.database import SessionLocal, init_db
 from app.routes import stories, auth
+from app.services.audio_etags import IMMUTABLE_CACHE_CONTROL, cache_control_for, etag_index
+from app.services.blob_store import blob_store
+from app.services.container import services
+from app.services.renditions import HLS_MEDIA_TYPES, available_renditions, hls_directory, media_type_for, negotiate
+from app.services.story_scheduler import story_scheduler
 from app.models.schemas import HealthCheckResponse
+from app.utils.http_files import RangeFileResponse
 from datetime import datetime
+from typing import Optional
 import logging
 import os
 
@@ -54,6 +61,13 @@ async def startup_event():
     init_db()
     logger.info("Database initialized")
 
+    # Build provider clients and the workflow once for the whole process
+    await services.start()
+
+    # Start in-process generation workers (external workers claim from the database otherwise)
+    if settings.GENERATION_BACKEND == "inprocess":
+        await story_scheduler.start()
+
     logger.info(f"StoryMagic API started on {settings.API_HOST}:{settings.API_PORT}")
 
 
@@ -61,6 +75,8 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down StoryMagic API...")
+    await story_scheduler.stop()
+    await services.aclose()
 
 
 @app.get("/")
@@ -83,40 +99,165 @@ async def health_check():
     )
 
 
-@app.get("/api/v1/stories/audio/{filename}")
-async def serve_audio(filename: str):
-    """Serve audio files for streaming"""
-    file_path = os.path.join(settings.STORIES_DIR, filename)
+@app.get("/api/metrics")
+async def metrics():
+    """Generation pipeline metrics"""
+    orchestrator = services.get_orchestrator()
+    return {
+        "scheduler": story_scheduler.stats(),
+        "tts_cache": orchestrator.tts_cache.stats() if orchestrator.tts_cache else None,
+        "music_library": orchestrator.music_service.library.stats(orchestrator.music_service.MOOD_PROMPTS),
+        "lyria_sessions": orchestrator.music_service.sessions.stats(),
+        "audio_workers": services.audio_workers.stats(),
+        "audio_etags": etag_index.stats()
+    }
+
+
+@app.get("/api/storage")
+def storage_usage():
+    """Disk usage of the audio blob store and the last artifact GC pass"""
+    db = SessionLocal()
+    try:
+        usage = blob_store.usage(db)
+        usage["artifact_gc"] = services.artifact_gc.stats() if services.artifact_gc else None
+        return usage
+    finally:
+        db.close()
+
+
+async def resolve_audio(filename: str, audio_format: Optional[str], accept: Optional[str]) -> tuple[str, str]:
+    """
+    Pick the file to send for an audio URL
+
+    The URL names the primary (MP3) file, either a content-addressed blob
+    (in the sharded or the earlier one-level layout) or a file in
+    STORIES_DIR; a ?format= parameter or the Accept header can select one of
+    its other renditions instead. With remote storage a blob need not be on
+    this node yet (see audio_response). STORIES_DIR names that were migrated
+    into the blob store are redirected to their blob.
+
+    Returns:
+        Tuple of (file_path, filename)
+    """
+    blob_path = await blob_store.locate(filename)
+    file_path = blob_path or os.path.join(settings.STORIES_DIR, filename)
+
+    if blob_path:
+        renditions = await blob_store.renditions_of(filename)
+        if not (blob_store.storage.remote or os.path.exists(file_path)):
+            raise HTTPException(status_code=404, detail="Audio file not found")
+    else:
+        if not os.path.exists(file_path):
+            target = await blob_store.alias_for(filename)
+            if target:
+                location = f"/api/v1/stories/audio/{target}"
+                if audio_format:
+                    location += f"?format={audio_format}"
+                raise HTTPException(status_code=301, detail="Audio file moved", headers={"Location": location})
+            raise HTTPException(status_code=404, detail="Audio file not found")
+        renditions = available_renditions(file_path)
+    chosen = negotiate(accept, renditions, requested=audio_format)
+    if chosen:
+        file_path = renditions[chosen]
+        filename = os.path.basename(file_path)
+
+    return file_path, filename
 
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Audio file not found")
 
-    return FileResponse(
+async def audio_response(file_path: str, filename: str, download_name: Optional[str] = None) -> Response:
+    """
+    Send an audio file, or redirect to it in remote storage
+
+    Blobs in remote storage are answered with a redirect to a presigned URL
+    (the store handles ranges and caching), or read through the local cache
+    when STORAGE_REDIRECT is off.
+    """
+    headers = {"Vary": "Accept"}
+    if download_name:
+        headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+
+    if blob_store.is_blob(file_path):
+        url = blob_store.url_for(file_path, download_name=download_name)
+        if url:
+            # Cached for less than the URL's lifetime, so a cached redirect still works
+            max_age = settings.STORAGE_PRESIGN_EXPIRES_SECONDS // 2
+            return RedirectResponse(
+                url, status_code=307,
+                headers={"Cache-Control": f"private, max-age={max_age}", "Vary": "Accept"}
+            )
+        if not await blob_store.fetch_async(file_path):
+            raise HTTPException(status_code=404, detail="Audio file not found")
+
+    return RangeFileResponse(
         file_path,
-        media_type="audio/mpeg",
-        filename=filename
+        etag=await etag_index.get(file_path),
+        cache_control=cache_control_for(filename),
+        media_type=media_type_for(file_path),
+        filename=download_name or filename,
+        headers=headers
     )
 
 
+@app.get("/api/v1/stories/audio/{filename}")
+async def serve_audio(
+    filename: str,
+    format: Optional[str] = None,
+    accept: Optional[str] = Header(None)
+):
+    """Serve audio files for streaming, in the rendition the client prefers"""
+    file_path, filename = await resolve_audio(filename, format, accept)
+    return await audio_response(file_path, filename)
+
+
 @app.get("/api/v1/stories/audio/{filename}/download")
-async def download_audio(filename: str):
+async def download_audio(
+    filename: str,
+    format: Optional[str] = None,
+    accept: Optional[str] = Header(None)
+):
     """Download audio files with proper headers"""
-    file_path = os.path.join(settings.STORIES_DIR, filename)
-
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Audio file not found")
+    file_path, filename = await resolve_audio(filename, format, accept)
 
     # Clean filename for download
     clean_filename = filename.replace(" ", "_")
+    return await audio_response(file_path, filename, download_name=clean_filename)
+
+
+@app.get("/api/v1/stories/hls/{rendition}/{filename}")
+async def serve_hls(rendition: str, filename: str):
+    """Serve HLS playlists and segments"""
+    extension = os.path.splitext(filename)[1].lower()
+    if not rendition.endswith("_hls") or extension not in HLS_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    # Sharded directory, or the flat STORIES_DIR one of older stories
+    file_path = None
+    for directory in (hls_directory(settings.STORIES_DIR, rendition), os.path.join(settings.STORIES_DIR, rendition)):
+        if os.path.exists(os.path.join(directory, filename)):
+            file_path = os.path.join(directory, filename)
+            break
+    if file_path is None:
+        # Encoded on another node: read through the cache of remote storage
+        file_path = (
+            await blob_store.fetch_async(blob_store.hls_cache_path(rendition, filename))
+            or await blob_store.fetch_async(blob_store.hls_cache_path(rendition, filename, legacy=True))
+        )
+        if not file_path:
+            raise HTTPException(status_code=404, detail="Audio file not found")
+
+    # Segments never change once written, and neither does a finished playlist;
+    # one still being encoded grows, so clients must revalidate it
+    cache_control = IMMUTABLE_CACHE_CONTROL
+    if extension == ".m3u8":
+        with open(file_path, "r") as playlist:
+            if "#EXT-X-ENDLIST" not in playlist.read():
+                cache_control = "no-cache"
 
-    return FileResponse(
+    return RangeFileResponse(
         file_path,
-        media_type="audio/mpeg",
-        filename=clean_filename,
-        headers={
-            "Content-Disposition": f'attachment; filename="{clean_filename}"',
-            "Cache-Control": "no-cache"
-        }
+        etag=await etag_index.get(file_path, recorded=False),
+        cache_control=cache_control,
+        media_type=HLS_MEDIA_TYPES[extension]
     )
 
 
@@ -2,5 +2,6 @@
 
 from app.models.user import User
 from app.models.story import Story
+from app.models.audio_blob import AudioAlias, AudioBlob
 
-__all__ = ["User", "Story"]
+__all__ = ["User", "Story", "AudioBlob", "AudioAlias"]
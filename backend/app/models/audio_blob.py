@@ -0,0 +1,39 @@
+"""Content-addressed audio blob models"""
+
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class AudioBlob(Base):
+    """One stored audio file, shared by every story row that references it"""
+    __tablename__ = "audio_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    digest = Column(String(64), unique=True, index=True, nullable=False)  # SHA-256 of the content
+    path = Column(String(500), unique=True, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    extension = Column(String(10), nullable=False)
+
+    # Story and StoryVersion rows pointing at this file; deleted at zero
+    ref_count = Column(Integer, default=0, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_referenced_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"<AudioBlob(digest='{self.digest[:12]}', refs={self.ref_count})>"
+
+
+class AudioAlias(Base):
+    """Name of a STORIES_DIR file that was moved into the blob store"""
+    __tablename__ = "audio_aliases"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(255), unique=True, index=True, nullable=False)  # Old file name in audio URLs
+    target = Column(String(255), nullable=False)  # Blob file name it is served under now
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<AudioAlias(name='{self.name}', target='{self.target[:12]}')>"
@@ -32,6 +32,7 @@ class StoryResponse(BaseModel):
     story_text_html: Optional[str]
     story_title: Optional[str]
     audio_url: Optional[str]
+    hls_url: Optional[str] = None
     status: StoryStatus
     word_count: Optional[int]
     duration_seconds: Optional[float]
@@ -58,7 +59,9 @@ class StoryStatusResponse(BaseModel):
     status: StoryStatus
     progress_message: str
     audio_url: Optional[str]
+    hls_url: Optional[str] = None
     error_message: Optional[str]
+    queue_position: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -77,6 +80,7 @@ class StoryVersionResponse(BaseModel):
     story_text_html: Optional[str]
     story_title: Optional[str]
     audio_url: Optional[str]
+    hls_url: Optional[str] = None
     word_count: Optional[int]
     duration_seconds: Optional[float]
     created_at: datetime
@@ -3,6 +3,19 @@ from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
 import enum
+import json
+import os
+
+
+def hls_playlist_url(audio_renditions: str | None) -> str | None:
+    """URL of the HLS playlist recorded in an audio_renditions column, if any"""
+    if not audio_renditions:
+        return None
+    playlist_path = json.loads(audio_renditions).get("hls")
+    if not playlist_path:
+        return None
+    rendition = os.path.basename(os.path.dirname(playlist_path))
+    return f"/api/v1/stories/hls/{rendition}/{os.path.basename(playlist_path)}"
 
 
 class StoryStatus(str, enum.Enum):
@@ -15,6 +28,14 @@ class StoryStatus(str, enum.Enum):
     FAILED = "failed"
 
 
+# Statuses a story passes through while it is being generated
+IN_PROGRESS_STATUSES = (
+    StoryStatus.GENERATING_TEXT,
+    StoryStatus.GENERATING_AUDIO,
+    StoryStatus.ADDING_MUSIC,
+)
+
+
 class Story(Base):
     """Story model"""
     __tablename__ = "stories"
@@ -35,8 +56,10 @@ class Story(Base):
     # File paths and URLs
     audio_file_path = Column(String(500), nullable=True)
     music_file_path = Column(String(500), nullable=True)
-    final_audio_path = Column(String(500), nullable=True)
+    final_audio_path = Column(String(500), nullable=True, index=True)  # Indexed for ETag lookups
     audio_url = Column(String(500), nullable=True)
+    audio_renditions = Column(Text, nullable=True)  # JSON: encoded format -> file path
+    audio_etags = Column(Text, nullable=True)  # JSON: file name -> strong ETag (content hash)
 
     # Metadata
     status = Column(Enum(StoryStatus), default=StoryStatus.PENDING)
@@ -46,6 +69,15 @@ class Story(Base):
     # Error tracking
     error_message = Column(Text, nullable=True)
 
+    # Output of completed workflow stages (JSON), used to resume interrupted runs
+    generation_checkpoint = Column(Text, nullable=True)
+
+    # Job queue (claimed by worker processes with a renewable lease)
+    queued_at = Column(DateTime, nullable=True, index=True)
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)
+    attempts = Column(Integer, default=0)
+
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -58,6 +90,11 @@ class Story(Base):
     user = relationship("User", back_populates="stories")
     versions = relationship("StoryVersion", back_populates="story", cascade="all, delete-orphan")
 
+    @property
+    def hls_url(self) -> str | None:
+        """HLS playlist URL, when the story was also rendered as HLS"""
+        return hls_playlist_url(self.audio_renditions)
+
     def __repr__(self):
         return f"<Story(id={self.id}, title='{self.story_title}', status='{self.status}')>"
 
@@ -81,8 +118,10 @@ class StoryVersion(Base):
     # Audio files for this version
     audio_file_path = Column(String(500), nullable=True)
     music_file_path = Column(String(500), nullable=True)
-    final_audio_path = Column(String(500), nullable=True)
+    final_audio_path = Column(String(500), nullable=True, index=True)  # Indexed for ETag lookups
     audio_url = Column(String(500), nullable=True)
+    audio_renditions = Column(Text, nullable=True)  # JSON: encoded format -> file path
+    audio_etags = Column(Text, nullable=True)  # JSON: file name -> strong ETag (content hash)
 
     # Metadata
     word_count = Column(Integer, nullable=True)
@@ -94,5 +133,10 @@ class StoryVersion(Base):
     # Relationships
     story = relationship("Story", back_populates="versions")
 
+    @property
+    def hls_url(self) -> str | None:
+        """HLS playlist URL, when this version was also rendered as HLS"""
+        return hls_playlist_url(self.audio_renditions)
+
     def __repr__(self):
         return f"<StoryVersion(id={self.id}, story_id={self.story_id}, version={self.version_number})>"
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
 from typing import Optional
 from app.core.database import get_db
@@ -13,9 +14,12 @@ from app.models.schemas import (
     StoryVersionResponse,
     StoryVersionListResponse
 )
-from app.services.story_orchestrator import StoryOrchestrator
+from app.services.blob_store import blob_store, referenced_paths
+from app.services.renditions import delete_renditions
+from app.services.story_scheduler import story_scheduler, GenerationJob
 from app.core.config import settings
 from datetime import datetime
+import json
 import logging
 import os
 
@@ -24,64 +28,59 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/stories", tags=["stories"])
 
 
-async def generate_story_background(story_id: int, theme: str, character_name: str | None, age_group: str, db: Session):
-    """Background task to generate story"""
-    try:
-        # Get story from database
-        story = db.query(Story).filter(Story.id == story_id).first()
-        if not story:
-            logger.error(f"Story {story_id} not found")
-            return
-
-        # Update status
-        story.status = StoryStatus.GENERATING_TEXT
-        db.commit()
-
-        # Initialize orchestrator
-        orchestrator = StoryOrchestrator()
+def ensure_scheduler_capacity(db: Session):
+    """Reject new generation work with 503 when the queue is full"""
+    if settings.GENERATION_BACKEND == "worker":
+        queued = db.query(Story).filter(Story.status == StoryStatus.PENDING).count()
+        has_capacity = queued < settings.GENERATION_QUEUE_MAX_SIZE
+    else:
+        has_capacity = story_scheduler.has_capacity()
 
-        # Generate complete story
-        result = await orchestrator.generate_complete_story(
-            story_id=story_id,
-            theme=theme,
-            character_name=character_name,
-            age_group=age_group
+    if not has_capacity:
+        raise HTTPException(
+            status_code=503,
+            detail="Story generation is busy right now. Please try again shortly.",
+            headers={"Retry-After": str(settings.GENERATION_RETRY_AFTER_SECONDS)}
         )
 
-        # Update database with results
-        if result.get("error"):
-            story.status = StoryStatus.FAILED
-            story.error_message = result["error"]
-        else:
-            story.status = StoryStatus.COMPLETED
-            story.story_text = result["story_text"]
-            story.story_text_html = result.get("story_text_html", result["story_text"])
-            story.story_title = result["story_title"]
-            story.word_count = result["word_count"]
-            story.final_audio_path = result["final_audio_path"]
-            story.duration_seconds = result["duration_seconds"]
-            story.completed_at = datetime.now()
-
-            # Generate URL for frontend
-            filename = os.path.basename(result["final_audio_path"])
-            story.audio_url = f"/api/v1/stories/audio/{filename}"
 
-        db.commit()
-        logger.info(f"Story {story_id} generation completed: {story.status}")
+def enqueue_story(story: Story):
+    """Hand a PENDING story to the in-process scheduler (workers poll the table otherwise)"""
+    if settings.GENERATION_BACKEND == "worker":
+        return
 
-    except Exception as e:
-        logger.error(f"Error in background story generation: {str(e)}")
-        story = db.query(Story).filter(Story.id == story_id).first()
-        if story:
-            story.status = StoryStatus.FAILED
-            story.error_message = str(e)
-            db.commit()
+    story_scheduler.submit(GenerationJob(
+        story_id=story.id,
+        theme=story.theme,
+        character_name=story.character_name,
+        age_group=story.age_group
+    ))
+
+
+def get_queue_position(story: Story, db: Session) -> int | None:
+    """1-based position of a PENDING story in the generation queue"""
+    if settings.GENERATION_BACKEND != "worker":
+        return story_scheduler.get_queue_position(story.id)
+
+    if story.queued_at is None:
+        return None
+    ahead = (
+        db.query(Story)
+        .filter(
+            Story.status == StoryStatus.PENDING,
+            or_(
+                Story.queued_at < story.queued_at,
+                and_(Story.queued_at == story.queued_at, Story.id < story.id)
+            )
+        )
+        .count()
+    )
+    return ahead + 1
 
 
 @router.post("/", response_model=StoryResponse, status_code=202)
 async def create_story(
     request: StoryCreateRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_optional_user)
 ):
@@ -92,7 +91,10 @@ async def create_story(
     Use GET /stories/{id}/status to check progress.
 
     If authenticated, the story will be associated with the user.
+    Returns 503 if the generation queue is full.
     """
+    ensure_scheduler_capacity(db)
+
     try:
         # Create story record
         story = Story(
@@ -100,6 +102,7 @@ async def create_story(
             character_name=request.character_name,
             age_group=request.age_group,
             status=StoryStatus.PENDING,
+            queued_at=datetime.utcnow(),
             user_id=current_user.id if current_user else None
         )
         db.add(story)
@@ -108,19 +111,8 @@ async def create_story(
 
         logger.info(f"Story {story.id} created, starting generation...")
 
-        # Start background generation
-        # Note: We need to create a new db session for background task
-        from app.core.database import SessionLocal
-        bg_db = SessionLocal()
-
-        background_tasks.add_task(
-            generate_story_background,
-            story_id=story.id,
-            theme=request.theme,
-            character_name=request.character_name,
-            age_group=request.age_group,
-            db=bg_db
-        )
+        # Queue generation (the worker opens its own db session)
+        enqueue_story(story)
 
         return story
 
@@ -181,12 +173,21 @@ def get_story_status(story_id: int, db: Session = Depends(get_db)):
         StoryStatus.FAILED: "Oh no! Something went wrong."
     }
 
+    progress_message = progress_messages.get(story.status, "Processing...")
+    queue_position = None
+    if story.status == StoryStatus.PENDING:
+        queue_position = get_queue_position(story, db)
+        if queue_position:
+            progress_message = f"Your story is in the queue (position {queue_position})..."
+
     return StoryStatusResponse(
         id=story.id,
         status=story.status,
-        progress_message=progress_messages.get(story.status, "Processing..."),
+        progress_message=progress_message,
         audio_url=story.audio_url,
-        error_message=story.error_message
+        hls_url=story.hls_url,
+        error_message=story.error_message,
+        queue_position=queue_position
     )
 
 
@@ -215,16 +216,31 @@ def delete_story(story_id: int, db: Session = Depends(get_db)):
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
 
-    # Delete audio files if they exist
-    if story.final_audio_path and os.path.exists(story.final_audio_path):
-        os.remove(story.final_audio_path)
-    if story.audio_file_path and os.path.exists(story.audio_file_path):
-        os.remove(story.audio_file_path)
-    if story.music_file_path and os.path.exists(story.music_file_path):
-        os.remove(story.music_file_path)
+    # Drop the story's and its versions' blob references; blobs nothing else
+    # uses are deleted once the rows are gone
+    rows = [story, *story.versions]
+    released = []
+    for row in rows:
+        released += blob_store.release(db, referenced_paths(row))
+
+    # HLS segment directories and files from before the blob store belong to this story alone
+    for row in rows:
+        if row.audio_renditions:
+            renditions = json.loads(row.audio_renditions)
+            delete_renditions({
+                audio_format: path
+                for audio_format, path in renditions.items()
+                if not blob_store.is_blob(path)
+            })
+            if renditions.get("hls"):
+                blob_store.delete_hls(renditions["hls"])
+    for path in (story.final_audio_path, story.audio_file_path):
+        if path and not blob_store.is_blob(path) and os.path.exists(path):
+            os.remove(path)
 
     db.delete(story)
     db.commit()
+    blob_store.delete_files(released)
 
     return {"message": "Story deleted successfully"}
 
@@ -244,14 +260,16 @@ def save_story_version(story: Story, db: Session):
         story_text=story.story_text,
         story_text_html=story.story_text_html,
         story_title=story.story_title,
-        audio_file_path=story.audio_file_path,
-        music_file_path=story.music_file_path,
+        # The narration and music a story was mixed from are not kept with versions
         final_audio_path=story.final_audio_path,
         audio_url=story.audio_url,
+        audio_renditions=story.audio_renditions,
+        audio_etags=story.audio_etags,
         word_count=story.word_count,
         duration_seconds=story.duration_seconds
     )
     db.add(version)
+    blob_store.acquire(db, referenced_paths(version))
     db.commit()
     logger.info(f"Saved version {version.version_number} for story {story.id}")
 
@@ -259,7 +277,6 @@ def save_story_version(story: Story, db: Session):
 @router.post("/{story_id}/regenerate", response_model=StoryResponse, status_code=202)
 async def regenerate_story(
     story_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -274,6 +291,8 @@ async def regenerate_story(
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
 
+    ensure_scheduler_capacity(db)
+
     try:
         # Save current version before regenerating
         save_story_version(story, db)
@@ -282,22 +301,15 @@ async def regenerate_story(
         story.current_version += 1
         story.status = StoryStatus.PENDING
         story.error_message = None
+        story.queued_at = datetime.utcnow()
+        story.attempts = 0
+        story.generation_checkpoint = None  # a regenerated story starts from scratch
         db.commit()
 
         logger.info(f"Regenerating story {story_id}, new version: {story.current_version}")
 
-        # Start background generation with same parameters
-        from app.core.database import SessionLocal
-        bg_db = SessionLocal()
-
-        background_tasks.add_task(
-            generate_story_background,
-            story_id=story.id,
-            theme=story.theme,
-            character_name=story.character_name,
-            age_group=story.age_group,
-            db=bg_db
-        )
+        # Queue generation with same parameters
+        enqueue_story(story)
 
         db.refresh(story)
         return story
@@ -307,6 +319,41 @@ async def regenerate_story(
         raise HTTPException(status_code=500, detail=f"Failed to regenerate story: {str(e)}")
 
 
+@router.post("/{story_id}/retry", response_model=StoryResponse, status_code=202)
+async def retry_story(story_id: int, db: Session = Depends(get_db)):
+    """
+    Retry a failed story
+
+    Stages that completed before the failure (story text, narration, music)
+    are reused from the story's checkpoint instead of being generated again.
+    """
+    story = db.query(Story).filter(Story.id == story_id).first()
+    if not story:
+        raise HTTPException(status_code=404, detail="Story not found")
+
+    if story.status != StoryStatus.FAILED:
+        raise HTTPException(status_code=409, detail="Only failed stories can be retried")
+
+    ensure_scheduler_capacity(db)
+
+    try:
+        story.status = StoryStatus.PENDING
+        story.error_message = None
+        story.queued_at = datetime.utcnow()
+        story.attempts = 0
+        db.commit()
+
+        logger.info(f"Retrying story {story_id}")
+        enqueue_story(story)
+
+        db.refresh(story)
+        return story
+
+    except Exception as e:
+        logger.error(f"Error retrying story: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to retry story: {str(e)}")
+
+
 @router.get("/{story_id}/versions", response_model=StoryVersionListResponse)
 def get_story_versions(story_id: int, db: Session = Depends(get_db)):
     """Get all versions of a story"""
@@ -0,0 +1,526 @@
+"""
+Garbage collection of orphaned audio artifacts
+
+Stories that failed, were regenerated or were deleted before the blob store
+existed leave narration WAVs, music WAVs, `.part` captures and HLS
+directories in STORIES_DIR that no row points at. The collector walks
+STORIES_DIR (and the blob store) in batches, cross-references every file
+with the paths recorded on `stories` and `story_versions` (including the
+checkpoints of unfinished stories), and deletes or archives whatever is
+unreferenced and older than a grace period.
+
+The grace period protects files of stories that are still being generated:
+they are written before any row records them. The music library, the TTS
+cache and the archive directory are never touched; blobs are only removed
+once their reference count is zero, from remote storage as well.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from sqlalchemy import func
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.audio_blob import AudioBlob
+from app.models.story import Story, StoryVersion
+from app.services.blob_store import blob_digest, blob_store, referenced_paths
+from app.services.renditions import HLS_DIR_SUFFIX, RENDITION_PROFILES
+from app.utils.sharding import SHARD_LEVELS, SHARD_WIDTH
+
+logger = logging.getLogger(__name__)
+
+# Checkpoint fields that name files on disk
+CHECKPOINT_PATH_FIELDS = ("narration_path", "music_path", "final_audio_path")
+
+
+@dataclass
+class CollectionReport:
+    """Outcome of one collection pass"""
+    dry_run: bool
+    scanned: int = 0
+    referenced: int = 0
+    too_recent: int = 0
+    removed: int = 0
+    bytes_reclaimed: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    removed_paths: list[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        """One-line summary for logs and the CLI"""
+        action = "Would reclaim" if self.dry_run else "Reclaimed"
+        return (
+            f"{action} {self.bytes_reclaimed / 1024 / 1024:.1f} MB from {self.removed} artifacts "
+            f"({self.scanned} scanned, {self.referenced} referenced, {self.too_recent} within grace period, "
+            f"{self.errors} errors) in {self.seconds:.1f}s"
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "dry_run": self.dry_run,
+            "scanned": self.scanned,
+            "referenced": self.referenced,
+            "too_recent": self.too_recent,
+            "removed": self.removed,
+            "bytes_reclaimed": self.bytes_reclaimed,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 2)
+        }
+
+
+def _tree_stats(path: str) -> tuple[int, float]:
+    """Total size and newest modification time of a directory tree"""
+    size, newest = 0, os.stat(path).st_mtime
+    for root, _, files in os.walk(path):
+        for name in files:
+            stat = os.stat(os.path.join(root, name))
+            size += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    return size, newest
+
+
+def _shard_tree(root: str) -> list[str]:
+    """Shard directories of both levels of a sharded tree (missing root: none)"""
+    found, level = [], [root]
+    for _ in range(SHARD_LEVELS):
+        children = []
+        for directory in level:
+            try:
+                with os.scandir(directory) as entries:
+                    children += [
+                        entry.path for entry in entries
+                        if entry.is_dir(follow_symlinks=False) and len(entry.name) == SHARD_WIDTH
+                    ]
+            except FileNotFoundError:
+                continue
+        found += sorted(children)
+        level = children
+    return found
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    # SQLite hands back naive datetimes for timezone-aware columns
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class ArtifactCollector:
+    """Finds and removes audio files in STORIES_DIR that no story references"""
+
+    def __init__(
+        self,
+        stories_dir: str,
+        grace_hours: float,
+        batch_size: int = 500,
+        max_files_per_second: float = 0,
+        max_mb_per_second: float = 0,
+        archive_dir: str | None = None,
+        dry_run: bool = False
+    ):
+        """
+        Args:
+            stories_dir: Directory to collect
+            grace_hours: Files modified more recently than this are kept
+            batch_size: Directory entries (and rows) handled per batch
+            max_files_per_second: Removal rate limit (0 for unlimited)
+            max_mb_per_second: Removed or archived bytes per second (0 for unlimited)
+            archive_dir: Move artifacts here instead of deleting them
+            dry_run: Only report what would be removed
+        """
+        self.stories_dir = os.path.abspath(stories_dir)
+        self.grace_seconds = grace_hours * 3600
+        self.batch_size = max(1, batch_size)
+        self.max_files_per_second = max_files_per_second
+        self.max_bytes_per_second = max_mb_per_second * 1024 * 1024
+        self.archive_dir = os.path.abspath(archive_dir) if archive_dir else None
+        self.dry_run = dry_run
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Stop a running pass after the current artifact"""
+        self._cancelled.set()
+
+    def _excluded_dirs(self) -> set[str]:
+        """Directories under STORIES_DIR with their own lifecycle"""
+        excluded = {
+            os.path.abspath(settings.MUSIC_LIBRARY_DIR),
+            os.path.abspath(settings.TTS_CACHE_DIR),
+            os.path.abspath(blob_store.root)
+        }
+        if self.archive_dir:
+            excluded.add(self.archive_dir)
+        return excluded
+
+    def _referenced(self) -> set[str]:
+        """Absolute paths of every file and HLS directory a row points at"""
+        referenced = set()
+
+        def add(path: str | None):
+            if path:
+                referenced.add(os.path.abspath(path))
+
+        def add_renditions(renditions: dict):
+            for audio_format, path in renditions.items():
+                add(path)
+                if path and RENDITION_PROFILES.get(audio_format, {}).get("segmented"):
+                    add(os.path.dirname(path))
+
+        db = SessionLocal()
+        try:
+            for model in (Story, StoryVersion):
+                for row in db.query(model).yield_per(self.batch_size):
+                    for path in referenced_paths(row):
+                        add(path)
+                    if row.audio_renditions:
+                        add_renditions(json.loads(row.audio_renditions))
+
+            # Unfinished stories resume from files their checkpoint names
+            checkpoints = db.query(Story.generation_checkpoint).filter(
+                Story.generation_checkpoint.isnot(None)
+            ).yield_per(self.batch_size)
+            for (checkpoint,) in checkpoints:
+                try:
+                    fields = json.loads(checkpoint)
+                except ValueError:
+                    continue
+                for name in CHECKPOINT_PATH_FIELDS:
+                    add(fields.get(name))
+                add_renditions(fields.get("audio_renditions") or {})
+        finally:
+            db.close()
+
+        return referenced
+
+    def _throttle(self, size: int):
+        """Sleep as needed to stay under the configured removal rates"""
+        self._done_files += 1
+        self._done_bytes += size
+        target = 0.0
+        if self.max_files_per_second > 0:
+            target = self._done_files / self.max_files_per_second
+        if self.max_bytes_per_second > 0:
+            target = max(target, self._done_bytes / self.max_bytes_per_second)
+        wait = target - (time.monotonic() - self._io_started)
+        if wait > 0:
+            self._cancelled.wait(wait)
+
+    def _remove(self, path: str, size: int, report: CollectionReport):
+        """Delete or archive one file or directory and account for it"""
+        report.removed += 1
+        report.bytes_reclaimed += size
+        report.removed_paths.append(path)
+        if self.dry_run:
+            logger.debug(f"Would remove {path} ({size} bytes)")
+            return
+
+        try:
+            if self.archive_dir:
+                relative = os.path.relpath(path, self.stories_dir)
+                if relative.startswith(os.pardir):
+                    # Blob store configured outside STORIES_DIR
+                    relative = os.path.join("blobs", os.path.basename(path))
+                target = os.path.join(self.archive_dir, relative)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            report.removed -= 1
+            report.bytes_reclaimed -= size
+            report.removed_paths.pop()
+            report.errors += 1
+            logger.warning(f"Could not remove {path}: {str(e)}")
+            return
+        self._throttle(size)
+
+    def _iter_batches(self, directory: str):
+        """Entries of a directory, batch_size at a time"""
+        batch = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _collect_loose(self, referenced: set[str], cutoff: float, report: CollectionReport):
+        """Unreferenced files in STORIES_DIR and HLS directories (flat or sharded)"""
+        excluded = self._excluded_dirs()
+        directories = [self.stories_dir, *_shard_tree(os.path.join(self.stories_dir, "hls"))]
+        for directory in directories:
+            for batch in self._iter_batches(directory):
+                if not self._collect_entries(batch, excluded, referenced, cutoff, report):
+                    return
+
+    def _collect_entries(
+        self,
+        batch: list,
+        excluded: set[str],
+        referenced: set[str],
+        cutoff: float,
+        report: CollectionReport
+    ) -> bool:
+        """Handle one batch of _collect_loose(); False once cancelled"""
+        for entry in batch:
+            if self._cancelled.is_set():
+                return False
+            path = os.path.abspath(entry.path)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # Other directories are not ours to collect
+                    if path in excluded or not entry.name.endswith(HLS_DIR_SUFFIX):
+                        continue
+                    size, modified = _tree_stats(path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    size, modified = stat.st_size, stat.st_mtime
+                else:
+                    continue
+            except FileNotFoundError:
+                continue
+
+            report.scanned += 1
+            if path in referenced:
+                report.referenced += 1
+            elif modified > cutoff:
+                report.too_recent += 1
+            else:
+                self._remove(path, size, report)
+        return True
+
+    def _release_row(self, db, blob: AudioBlob, cutoff_time: datetime) -> bool:
+        """
+        Delete an unreferenced blob's row, unless it was acquired since it was read
+
+        The grace period is checked again in the DELETE, so a blob acquired
+        and released again since it was read is not collected early either.
+        Callers leave the blob's files alone when this returns False.
+        """
+        if self.dry_run:
+            return True
+        deleted = db.query(AudioBlob).filter(
+            AudioBlob.id == blob.id,
+            AudioBlob.ref_count <= 0,
+            func.coalesce(AudioBlob.last_referenced_at, AudioBlob.created_at) < cutoff_time
+        ).delete(synchronize_session=False)
+        db.commit()
+        return bool(deleted)
+
+    def _remove_stored(self, path: str, size: int, report: CollectionReport):
+        """Delete (or archive) a blob's object in remote storage"""
+        if not blob_store.storage.remote:
+            return
+        key = blob_store.key_for(path)
+        if self.dry_run:
+            return
+        try:
+            if self.archive_dir and not os.path.exists(path):
+                blob_store.storage.download(key, os.path.join(self.archive_dir, "blobs", os.path.basename(path)))
+                self._throttle(size)
+            blob_store.storage.delete(key)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            report.errors += 1
+            logger.warning(f"Could not remove stored blob {os.path.basename(path)}: {str(e)}")
+
+    def _collect_blobs(self, cutoff: float, report: CollectionReport) -> set[str]:
+        """
+        Blobs without references, or without a row at all
+
+        Returns:
+            Digests of the blobs found on disk
+        """
+        seen = set()
+        root = os.path.abspath(blob_store.root)
+        if not os.path.isdir(root):
+            return seen
+        cutoff_time = datetime.fromtimestamp(cutoff, tz=timezone.utc)
+
+        # Second-level shards, and first-level ones for blobs in the earlier layout
+        for shard in _shard_tree(root):
+            for batch in self._iter_batches(shard):
+                if self._cancelled.is_set():
+                    return seen
+                files = {}
+                for entry in batch:
+                    digest = blob_digest(entry.name)
+                    if digest and entry.is_file(follow_symlinks=False):
+                        files[digest] = entry
+                seen.update(files)
+
+                db = SessionLocal()
+                try:
+                    rows = {
+                        blob.digest: blob
+                        for blob in db.query(AudioBlob).filter(AudioBlob.digest.in_(list(files)))
+                    }
+                    for digest, entry in files.items():
+                        if self._cancelled.is_set():
+                            return seen
+                        try:
+                            stat = entry.stat(follow_symlinks=False)
+                        except FileNotFoundError:
+                            continue
+                        report.scanned += 1
+                        blob = rows.get(digest)
+
+                        if (blob is not None and blob_store.is_current(blob.path)
+                                and os.path.abspath(blob.path) != os.path.abspath(entry.path)):
+                            # One-level copy left by an interrupted layout migration
+                            if stat.st_mtime > cutoff:
+                                report.too_recent += 1
+                            else:
+                                self._remove(entry.path, stat.st_size, report)
+                                self._remove_stored(entry.path, stat.st_size, report)
+                            continue
+                        if blob is not None and blob.ref_count > 0:
+                            report.referenced += 1
+                            continue
+                        touched = _as_utc(blob.last_referenced_at or blob.created_at) if blob is not None else None
+                        if stat.st_mtime > cutoff or (touched is not None and touched > cutoff_time):
+                            report.too_recent += 1
+                            continue
+
+                        if blob is not None and not self._release_row(db, blob, cutoff_time):
+                            report.referenced += 1
+                            continue
+                        self._remove(entry.path, stat.st_size, report)
+                        self._remove_stored(entry.path, stat.st_size, report)
+                finally:
+                    db.close()
+        return seen
+
+    def _collect_blob_rows(self, cutoff: float, seen: set[str], report: CollectionReport):
+        """Unreferenced blobs that are not on this node's disk (remote or already gone)"""
+        cutoff_time = datetime.fromtimestamp(cutoff, tz=timezone.utc)
+        last_id = 0
+        db = SessionLocal()
+        try:
+            while not self._cancelled.is_set():
+                batch = db.query(AudioBlob).filter(
+                    AudioBlob.id > last_id, AudioBlob.ref_count <= 0
+                ).order_by(AudioBlob.id).limit(self.batch_size).all()
+                if not batch:
+                    return
+                last_id = batch[-1].id
+
+                for blob in batch:
+                    if blob.digest in seen:
+                        continue
+                    report.scanned += 1
+                    touched = _as_utc(blob.last_referenced_at or blob.created_at)
+                    if touched is not None and touched > cutoff_time:
+                        report.too_recent += 1
+                        continue
+                    if not self._release_row(db, blob, cutoff_time):
+                        report.referenced += 1
+                        continue
+
+                    report.removed += 1
+                    if blob_store.storage.remote:
+                        # Without remote storage the file was already gone
+                        report.bytes_reclaimed += blob.size_bytes
+                    report.removed_paths.append(blob.path)
+                    self._remove_stored(blob.path, blob.size_bytes, report)
+        finally:
+            db.close()
+
+    def collect(self) -> CollectionReport:
+        """
+        Run one collection pass
+
+        Returns:
+            Counts of scanned, kept and removed artifacts and bytes reclaimed
+        """
+        self._cancelled.clear()
+        self._io_started = time.monotonic()
+        self._done_files = 0
+        self._done_bytes = 0
+        report = CollectionReport(dry_run=self.dry_run)
+
+        if not os.path.isdir(self.stories_dir):
+            return report
+
+        # Anything modified after this may belong to a story still being generated
+        cutoff = time.time() - self.grace_seconds
+        referenced = self._referenced()
+        self._collect_loose(referenced, cutoff, report)
+        seen = self._collect_blobs(cutoff, report)
+        self._collect_blob_rows(cutoff, seen, report)
+
+        report.seconds = time.monotonic() - self._io_started
+        logger.info(f"Artifact GC: {report.summary()}")
+        return report
+
+
+class ArtifactCollectorTask:
+    """Background task running a collection pass at a fixed interval"""
+
+    def __init__(self, collector: ArtifactCollector, interval_hours: float):
+        """
+        Args:
+            collector: Collector to run (its blocking work runs in a thread)
+            interval_hours: Pause between passes
+        """
+        self.collector = collector
+        self.interval_seconds = interval_hours * 3600
+        self.last_report: CollectionReport | None = None
+        self._task = None
+
+    def start(self):
+        """Start collecting in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="artifact-gc")
+            logger.info(
+                f"Artifact GC started: every {self.interval_seconds / 3600:g}h, "
+                f"grace {self.collector.grace_seconds / 3600:g}h"
+            )
+
+    async def stop(self):
+        """Stop collecting (a running pass stops after its current artifact)"""
+        if self._task is not None:
+            self.collector.cancel()
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.last_report = await asyncio.to_thread(self.collector.collect)
+            except Exception as e:
+                logger.error(f"Artifact GC pass failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def stats(self) -> dict:
+        """Outcome of the last pass"""
+        return self.last_report.as_dict() if self.last_report else {}
+
+
+def build_collector(dry_run: bool = False, **overrides) -> ArtifactCollector:
+    """Collector configured from settings, with keyword overrides"""
+    options = {
+        "stories_dir": settings.STORIES_DIR,
+        "grace_hours": settings.GC_GRACE_HOURS,
+        "batch_size": settings.GC_BATCH_SIZE,
+        "max_files_per_second": settings.GC_MAX_FILES_PER_SECOND,
+        "max_mb_per_second": settings.GC_MAX_MB_PER_SECOND,
+        "archive_dir": settings.GC_ARCHIVE_DIR or None,
+        "dry_run": dry_run
+    }
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return ArtifactCollector(**options)
@@ -0,0 +1,141 @@
+"""
+Strong ETags and cache policy for generated audio
+
+ETags are content hashes. Blob store names already are one; other files'
+tags are recorded on the story row (audio_etags, file name -> ETag). The
+audio routes look them up through a small in-process index, finding the
+row by its (indexed) final_audio_path. Files without a recorded tag (older
+stories, HLS segments) are hashed on first request; every entry is keyed
+by modification time and size, so a rewritten file is never served with a
+stale tag.
+"""
+
+import asyncio
+import json
+import os
+import re
+from collections import OrderedDict
+from app.core.database import SessionLocal
+from app.models.story import Story, StoryVersion
+from app.services.blob_store import blob_digest, file_digest
+from app.services.renditions import PRIMARY_FORMAT, RENDITION_PROFILES
+
+# Generated files get a unique timestamped name and are never rewritten in place
+GENERATED_AUDIO_NAME = re.compile(r"^story_\d+_\d{8}_\d{6}_")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+
+def digest_etag(digest: str) -> str:
+    """Strong ETag for content with a given SHA-256: a quoted prefix of it"""
+    return f'"{digest[:32]}"'
+
+
+def content_etag(path: str) -> str:
+    """Strong ETag for a file"""
+    return digest_etag(file_digest(path))
+
+
+def compute_etags(paths: list[str]) -> dict[str, str]:
+    """
+    ETags for a story's audio files
+
+    Returns:
+        File name -> ETag
+    """
+    return {os.path.basename(path): content_etag(path) for path in paths}
+
+
+def cache_control_for(filename: str) -> str:
+    """Cache-Control for an audio file: immutable if the name is never reused"""
+    if blob_digest(filename) or GENERATED_AUDIO_NAME.match(filename):
+        return IMMUTABLE_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+
+class ETagIndex:
+    """In-process cache of audio ETags, filled from story rows or by hashing"""
+
+    def __init__(self, max_entries: int = 4096):
+        """
+        Args:
+            max_entries: File names to remember (least recently used are evicted)
+        """
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[int, int, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, path: str, stat: os.stat_result, etag: str):
+        self._entries[path] = (stat.st_mtime_ns, stat.st_size, etag)
+        self._entries.move_to_end(path)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _recorded_etag(path: str) -> str | None:
+        """ETag stored on the story or version that owns the file, if any"""
+        # The file is the row's final audio, or a rendition named after it
+        base, _ = os.path.splitext(path)
+        candidates = list(dict.fromkeys([path, base + RENDITION_PROFILES[PRIMARY_FORMAT]["extension"]]))
+        filename = os.path.basename(path)
+
+        db = SessionLocal()
+        try:
+            for model in (Story, StoryVersion):
+                rows = db.query(model.audio_etags).filter(
+                    model.final_audio_path.in_(candidates), model.audio_etags.isnot(None)
+                ).limit(5).all()
+                for (audio_etags,) in rows:
+                    etag = json.loads(audio_etags).get(filename)
+                    if etag:
+                        return etag
+            return None
+        finally:
+            db.close()
+
+    async def get(self, path: str, recorded: bool = True) -> str:
+        """
+        Strong ETag for an audio file
+
+        Args:
+            path: File about to be served (must exist)
+            recorded: Look for a tag stored on a story before hashing
+                (False for files that are never recorded, e.g. HLS segments)
+
+        Returns:
+            Quoted ETag
+        """
+        # Content-addressed names carry their own tag
+        digest = blob_digest(os.path.basename(path))
+        if digest:
+            self.hits += 1
+            return digest_etag(digest)
+
+        stat = os.stat(path)
+        entry = self._entries.get(path)
+        if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        etag = await asyncio.to_thread(self._recorded_etag, path) if recorded and entry is None else None
+        if etag is None:
+            # Not recorded (older story) or the file changed since: hash it once
+            etag = await asyncio.to_thread(content_etag, path)
+
+        self._remember(path, stat, etag)
+        return etag
+
+    def stats(self) -> dict:
+        """Cache size and hit counts"""
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# Global index shared by the audio routes
+etag_index = ETagIndex()
@@ -1,5 +1,13 @@
 from pydub import AudioSegment
 from pydub.effects import normalize
+from app.core.config import settings
+from app.services.audio_workers import AudioWorkerPool
+from app.services.blob_store import blob_store
+from app.services.ffmpeg_mixer import render_mix_ffmpeg
+from app.services.numpy_mixer import NUMPY_AVAILABLE, render_mix
+from app.services.renditions import encode_file, encode_segment, rendition_paths
+from app.services.stream_mixer import render_mix_streaming
+from app.utils.audio_probe import probe_duration
 import logging
 import os
 
@@ -9,9 +17,24 @@ logger = logging.getLogger(__name__)
 class AudioMixerService:
     """Service for mixing narration and background music"""
 
-    def __init__(self):
-        """Initialize audio mixer"""
-        pass
+    LOOP_CROSSFADE_MS = 1500  # Crossfade at each seam when a music bed is looped
+    MUSIC_FADE_IN_MS = 2000
+    MUSIC_FADE_OUT_MS = 3000
+
+    def __init__(self, workers: AudioWorkerPool | None = None):
+        """
+        Initialize audio mixer
+
+        Args:
+            workers: Process pool for the CPU-bound work (None runs it inline)
+        """
+        self.workers = workers
+
+    async def _run(self, kind: str, job, *args):
+        """Run a module-level job in the worker pool, or inline without one"""
+        if self.workers is None:
+            return job(*args)
+        return await self.workers.run(kind, job, *args)
 
     async def mix_audio(
         self,
@@ -19,76 +42,239 @@ class AudioMixerService:
         music_path: str,
         output_path: str,
         music_volume_reduction_db: int = 20
-    ) -> tuple[str, float]:
+    ) -> tuple[str, float, dict[str, str]]:
+        """
+        Mix narration with background music (in the worker pool)
+
+        Args:
+            narration_path: Path to narration audio file
+            music_path: Path to background music file
+            output_path: Path where to save final mixed audio (MP3)
+            music_volume_reduction_db: How much to reduce music volume (dB)
+
+        Returns:
+            Tuple of (output_path, duration_seconds, renditions), where
+            renditions maps each encoded format to its file
+        """
+        return await self._run(
+            "mix", mix_audio_job,
+            narration_path, music_path, output_path, music_volume_reduction_db
+        )
+
+    def mix_audio_sync(
+        self,
+        narration_path: str,
+        music_path: str,
+        output_path: str,
+        music_volume_reduction_db: int = 20
+    ) -> tuple[str, float, dict[str, str]]:
         """
         Mix narration with background music
 
+        The mix is encoded into every configured rendition (MP3 at
+        output_path, plus e.g. AAC and Opus beside it) by one ffmpeg run.
+
         Args:
             narration_path: Path to narration audio file
             music_path: Path to background music file
-            output_path: Path where to save final mixed audio
+            output_path: Path where to save final mixed audio (MP3)
             music_volume_reduction_db: How much to reduce music volume (dB)
 
         Returns:
-            Tuple of (output_path, duration_seconds)
+            Tuple of (output_path, duration_seconds, renditions)
         """
         try:
-            logger.info("Mixing narration with background music")
+            engine = settings.MIX_ENGINE
+            if engine in ("numpy", "stream") and not NUMPY_AVAILABLE:
+                logger.warning("numpy is not installed, mixing with pydub")
+                engine = "pydub"
 
-            # Load audio files
-            narration = AudioSegment.from_file(narration_path)
-            music = AudioSegment.from_file(music_path)
+            logger.info(f"Mixing narration with background music ({engine})")
 
-            # Get narration duration
-            narration_duration_ms = len(narration)
-            duration_seconds = narration_duration_ms / 1000.0
+            # Ensure output directory exists
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            renditions = rendition_paths(output_path)
+
+            if engine == "ffmpeg":
+                # One ffmpeg filter graph from the source files to the renditions
+                duration_seconds = render_mix_ffmpeg(
+                    narration_path,
+                    music_path,
+                    output_path,
+                    music_gain_db=-music_volume_reduction_db,
+                    crossfade_ms=self.LOOP_CROSSFADE_MS,
+                    fade_in_ms=self.MUSIC_FADE_IN_MS,
+                    fade_out_ms=self.MUSIC_FADE_OUT_MS,
+                    sample_rate=settings.AUDIO_SAMPLE_RATE,
+                    renditions=renditions
+                )
+                logger.info(f"Audio mixed successfully: {output_path} ({duration_seconds:.2f}s, {', '.join(renditions)})")
+                return output_path, duration_seconds, renditions
+
+            if engine == "stream":
+                # Mixed block by block and encoded as it goes; nothing left to export
+                duration_seconds = render_mix_streaming(
+                    narration_path,
+                    music_path,
+                    output_path,
+                    music_gain_db=-music_volume_reduction_db,
+                    crossfade_ms=self.LOOP_CROSSFADE_MS,
+                    fade_in_ms=self.MUSIC_FADE_IN_MS,
+                    fade_out_ms=self.MUSIC_FADE_OUT_MS,
+                    renditions=renditions
+                )
+                logger.info(f"Audio mixed successfully: {output_path} ({duration_seconds:.2f}s, {', '.join(renditions)})")
+                return output_path, duration_seconds, renditions
+
+            if engine == "numpy":
+                mixed, duration_seconds = render_mix(
+                    narration_path,
+                    music_path,
+                    music_gain_db=-music_volume_reduction_db,
+                    crossfade_ms=self.LOOP_CROSSFADE_MS,
+                    fade_in_ms=self.MUSIC_FADE_IN_MS,
+                    fade_out_ms=self.MUSIC_FADE_OUT_MS
+                )
+            else:
+                mixed, duration_seconds = self._render_pydub(
+                    narration_path, music_path, music_volume_reduction_db
+                )
 
             logger.info(f"Narration duration: {duration_seconds:.2f} seconds")
 
-            # Adjust music length to match narration
-            if len(music) < narration_duration_ms:
-                # Loop music if it's shorter than narration
-                loops_needed = (narration_duration_ms // len(music)) + 1
-                music = music * loops_needed
+            # Encode every rendition from the one decoded mix
+            renditions = encode_segment(mixed, output_path)
 
-            # Trim music to match narration length
-            music = music[:narration_duration_ms]
+            logger.info(f"Audio mixed successfully: {output_path} ({', '.join(renditions)})")
+            return output_path, duration_seconds, renditions
 
-            # Reduce music volume to keep it in background
-            music = music - music_volume_reduction_db
+        except Exception as e:
+            logger.error(f"Error mixing audio: {str(e)}")
+            raise Exception(f"Failed to mix audio: {str(e)}")
 
-            # Apply fade in/out to music for smooth transitions
-            music = music.fade_in(2000).fade_out(3000)  # 2s fade in, 3s fade out
+    def _render_pydub(
+        self,
+        narration_path: str,
+        music_path: str,
+        music_volume_reduction_db: int
+    ) -> tuple[AudioSegment, float]:
+        """Mix with pydub (one full-length copy per step)"""
+        # Load audio files
+        narration = AudioSegment.from_file(narration_path)
+        music = AudioSegment.from_file(music_path)
+
+        # Get narration duration
+        narration_duration_ms = len(narration)
+
+        if len(music) == 0:
+            # Nothing to loop; an empty bed would never grow past the narration
+            logger.warning("Music track is empty, mixing narration only")
+            return normalize(narration), narration_duration_ms / 1000.0
+
+        # Adjust music length to match narration
+        if len(music) < narration_duration_ms:
+            # Loop music if it's shorter than narration, crossfading the seams
+            crossfade_ms = min(self.LOOP_CROSSFADE_MS, len(music) // 2)
+            looped = music
+            while len(looped) < narration_duration_ms:
+                looped = looped.append(music, crossfade=crossfade_ms)
+            music = looped
+
+        # Trim music to match narration length
+        music = music[:narration_duration_ms]
+
+        # Reduce music volume to keep it in background
+        music = music - music_volume_reduction_db
+
+        # Apply fade in/out to music for smooth transitions
+        music = music.fade_in(self.MUSIC_FADE_IN_MS).fade_out(self.MUSIC_FADE_OUT_MS)
+
+        # Overlay music under narration
+        mixed = narration.overlay(music)
+
+        # Normalize audio to prevent clipping
+        return normalize(mixed), narration_duration_ms / 1000.0
+
+    async def encode_renditions(self, source_path: str, output_path: str) -> dict[str, str]:
+        """
+        Encode an existing audio file into every configured rendition
+        (in the worker pool), e.g. narration when there is no music to mix
 
-            # Overlay music under narration
-            mixed = narration.overlay(music)
+        Args:
+            source_path: Audio file to encode
+            output_path: Path of the primary (MP3) rendition
 
-            # Normalize audio to prevent clipping
-            mixed = normalize(mixed)
+        Returns:
+            Rendition format -> file path
+        """
+        return await self._run("encode", encode_renditions_job, source_path, output_path)
 
-            # Ensure output directory exists
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    def encode_renditions_sync(self, source_path: str, output_path: str) -> dict[str, str]:
+        """
+        Encode an existing audio file into every configured rendition
 
-            # Export final mixed audio
-            mixed.export(
-                output_path,
-                format="mp3",
-                bitrate="128k",
-                parameters=["-q:a", "2"]  # High quality
-            )
+        Args:
+            source_path: Audio file to encode
+            output_path: Path of the primary (MP3) rendition
 
-            logger.info(f"Audio mixed successfully: {output_path}")
-            return output_path, duration_seconds
+        Returns:
+            Rendition format -> file path
+        """
+        try:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            renditions = encode_file(source_path, output_path)
+            logger.info(f"Encoded {os.path.basename(source_path)} as {', '.join(renditions)}")
+            return renditions
 
         except Exception as e:
-            logger.error(f"Error mixing audio: {str(e)}")
-            raise Exception(f"Failed to mix audio: {str(e)}")
+            logger.error(f"Error encoding renditions: {str(e)}")
+            raise Exception(f"Failed to encode renditions: {str(e)}")
+
+    async def store_audio(self, paths: list[str]) -> dict[str, tuple[str, str | None]]:
+        """
+        Move finished audio into the content-addressed blob store (in the
+        worker pool, since every file is hashed)
+
+        Args:
+            paths: Files to store (None entries and files outside STORIES_DIR
+                are skipped or left in place)
+
+        Returns:
+            Original path -> (stored path, content digest or None)
+        """
+        return await self._run("store", store_audio_job, [path for path in paths if path])
+
+    async def publish_hls(self, playlist_path: str):
+        """Upload an HLS rendition to remote storage (no-op for local storage)"""
+        await self._run("publish", publish_hls_job, playlist_path)
 
     async def add_sound_effects(
         self,
         base_audio_path: str,
         sound_effects: list[dict],
         output_path: str
+    ) -> str:
+        """
+        Add sound effects to audio at specific timestamps (in the worker pool)
+
+        Args:
+            base_audio_path: Path to base audio file
+            sound_effects: List of dicts with 'path' and 'timestamp_ms' keys
+            output_path: Path where to save audio with effects
+
+        Returns:
+            Path to output file
+        """
+        return await self._run(
+            "sound_effects", add_sound_effects_job,
+            base_audio_path, sound_effects, output_path
+        )
+
+    def add_sound_effects_sync(
+        self,
+        base_audio_path: str,
+        sound_effects: list[dict],
+        output_path: str
     ) -> str:
         """
         Add sound effects to audio at specific timestamps
@@ -128,6 +314,22 @@ class AudioMixerService:
             logger.error(f"Error adding sound effects: {str(e)}")
             raise Exception(f"Failed to add sound effects: {str(e)}")
 
+    async def measure_duration(self, audio_path: str) -> float:
+        """
+        Duration of an audio file in seconds
+
+        Read from the file headers; only formats the probe does not
+        understand are decoded, in the worker pool.
+        """
+        try:
+            duration = probe_duration(audio_path, decode_fallback=False)
+        except OSError as e:
+            logger.error(f"Error getting audio duration: {str(e)}")
+            return 0.0
+        if duration is not None:
+            return duration
+        return await self._run("duration", audio_duration_job, audio_path)
+
     def get_audio_duration(self, audio_path: str) -> float:
         """
         Get duration of audio file in seconds
@@ -139,8 +341,34 @@ class AudioMixerService:
             Duration in seconds
         """
         try:
-            audio = AudioSegment.from_file(audio_path)
-            return len(audio) / 1000.0
+            return probe_duration(audio_path)
         except Exception as e:
             logger.error(f"Error getting audio duration: {str(e)}")
             return 0.0
+
+
+# Entry points for the worker pool: module-level so they pickle by reference,
+# and taking paths so no audio crosses the process boundary
+
+def mix_audio_job(narration_path: str, music_path: str, output_path: str, music_volume_reduction_db: int) -> tuple[str, float, dict[str, str]]:
+    return AudioMixerService().mix_audio_sync(narration_path, music_path, output_path, music_volume_reduction_db)
+
+
+def encode_renditions_job(source_path: str, output_path: str) -> dict[str, str]:
+    return AudioMixerService().encode_renditions_sync(source_path, output_path)
+
+
+def store_audio_job(paths: list[str]) -> dict[str, tuple[str, str | None]]:
+    return blob_store.put_many(paths)
+
+
+def publish_hls_job(playlist_path: str):
+    blob_store.publish_hls(playlist_path)
+
+
+def add_sound_effects_job(base_audio_path: str, sound_effects: list[dict], output_path: str) -> str:
+    return AudioMixerService().add_sound_effects_sync(base_audio_path, sound_effects, output_path)
+
+
+def audio_duration_job(audio_path: str) -> float:
+    return AudioMixerService().get_audio_duration(audio_path)
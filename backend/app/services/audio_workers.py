@@ -0,0 +1,123 @@
+"""
+Process pool for CPU-bound audio work
+
+Decoding, DSP and encoding hold the GIL (or block on ffmpeg) for seconds
+per story. Running them in worker processes keeps the event loop free for
+status polling and downloads, and lets several stories mix in parallel on
+multi-core machines. Jobs take and return file paths, never audio data,
+so nothing large is pickled between processes.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(job, args):
+    """Run a job in the worker and report how long it took there"""
+    start = time.perf_counter()
+    result = job(*args)
+    return result, time.perf_counter() - start
+
+
+class AudioWorkerPool:
+    """Runs audio jobs in a dedicated process pool and keeps per-job-kind metrics"""
+
+    def __init__(self, max_workers: int):
+        """
+        Args:
+            max_workers: Worker processes (0 runs jobs in a thread of this process)
+        """
+        self.max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self._durations: dict[str, deque] = {}
+        self._waits: dict[str, deque] = {}
+        self.failures = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs an event loop and open sockets is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Audio worker pool started with {self.max_workers} processes")
+        return self._executor
+
+    async def run(self, kind: str, job, *args):
+        """
+        Run a job off the event loop and wait for its result
+
+        Args:
+            kind: Metrics label (e.g. "mix", "duration")
+            job: Module-level function (it is pickled by reference)
+            *args: Picklable arguments, e.g. file paths
+
+        Returns:
+            The job's return value
+        """
+        submitted = time.perf_counter()
+        self._pending += 1
+        try:
+            if self.max_workers <= 0:
+                result, run_seconds = await asyncio.to_thread(_timed, job, args)
+            else:
+                loop = asyncio.get_running_loop()
+                try:
+                    result, run_seconds = await loop.run_in_executor(self._get_executor(), _timed, job, args)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM killed); start a fresh pool for later jobs
+                    logger.error("Audio worker pool broke, restarting it")
+                    self._executor = None
+                    raise
+        except BaseException:
+            self.failures += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        self._durations.setdefault(kind, deque(maxlen=200)).append(run_seconds)
+        self._waits.setdefault(kind, deque(maxlen=200)).append(
+            max(0.0, time.perf_counter() - submitted - run_seconds)
+        )
+        return result
+
+    async def aclose(self):
+        """Stop the worker processes (queued jobs are cancelled)"""
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """Queue depth and job durations per kind"""
+        def summarize(samples):
+            ordered = sorted(samples)
+            return {
+                "count": len(ordered),
+                "p50_seconds": round(statistics.median(ordered), 3),
+                "max_seconds": round(ordered[-1], 3)
+            }
+
+        jobs = {}
+        for kind, durations in self._durations.items():
+            jobs[kind] = {
+                "run": summarize(durations),
+                "queue_wait": summarize(self._waits[kind])
+            }
+
+        return {
+            "workers": self.max_workers,
+            "mode": "process" if self.max_workers > 0 else "thread",
+            "in_flight": self._pending,
+            "queued": max(0, self._pending - self.max_workers) if self.max_workers > 0 else 0,
+            "failures": self.failures,
+            "jobs": jobs
+        }
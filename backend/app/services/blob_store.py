@@ -0,0 +1,613 @@
+"""
+Content-addressed store for generated audio
+
+Finished renditions are moved out of the flat STORIES_DIR into
+BLOB_STORE_DIR under the SHA-256 of their content (sharded two levels deep
+by digest prefix), so identical renders are stored once. The narration and
+music they were mixed from are deleted after the mix. Each blob counts the
+Story and StoryVersion rows that reference it and is deleted when the last
+of them lets go; disk use then follows unique audio rather than request
+count.
+
+Only files written directly into STORIES_DIR are taken over. Music library
+beds, caches and anything else keep their own lifecycle.
+
+With a remote storage backend (see storage.py) every blob is uploaded
+before it enters BLOB_STORE_DIR, which then only caches blobs read back
+on this node; the least recently used are evicted past STORAGE_CACHE_MAX_MB.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.audio_blob import AudioAlias, AudioBlob
+from app.models.story import Story, StoryVersion
+from app.services.renditions import HLS_PLAYLIST, RENDITION_PROFILES, single_file_renditions
+from app.services.storage import StorageBackend, storage
+from app.utils.sharding import shard_path
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+# <sha256>.<extension>, as used in audio URLs
+BLOB_NAME = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,8})$")
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's content (hex)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_BYTES):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def blob_digest(filename: str) -> str | None:
+    """Content digest encoded in a blob file name (None for other names)"""
+    match = BLOB_NAME.match(filename)
+    return match.group(1) if match else None
+
+
+def content_type_for(extension: str) -> str:
+    """Content type stored with a blob, by extension"""
+    for profile in RENDITION_PROFILES.values():
+        if profile["extension"] == extension:
+            return profile["media_type"]
+    return mimetypes.types_map.get(extension, "application/octet-stream")
+
+
+def referenced_paths(row: Story | StoryVersion) -> set[str]:
+    """Audio files a story or version row points at"""
+    paths = {row.final_audio_path, row.audio_file_path, row.music_file_path}
+    if row.audio_renditions:
+        paths.update(single_file_renditions(json.loads(row.audio_renditions)).values())
+    paths.discard(None)
+    return paths
+
+
+class BlobStore:
+    """Stores audio by content hash and reference-counts it in audio_blobs"""
+
+    def __init__(self, root: str, source_dir: str, storage: StorageBackend, cache_max_mb: int = 0):
+        """
+        Args:
+            root: Directory holding the blobs (a cache of them with remote storage)
+            source_dir: Directory whose files are taken over by put()
+            storage: Backend blobs are published to
+            cache_max_mb: Size limit of root with remote storage (0 for unbounded)
+        """
+        self.root = root
+        self.source_dir = source_dir
+        self.storage = storage
+        self.cache_max_bytes = cache_max_mb * 1024 * 1024
+        self._renditions: OrderedDict[str, dict[str, str]] = OrderedDict()
+        self._locations: OrderedDict[str, str] = OrderedDict()
+        self._cache_bytes: int | None = None
+        self._cache_lock = threading.Lock()
+        self._fetch_locks: dict[str, threading.Lock] = {}
+
+    def path_for(self, digest: str, extension: str) -> str:
+        """Blob file path, sharded by digest prefix (root/ab/cd/<digest>.ext)"""
+        return shard_path(self.root, f"{digest}{extension}", digest)
+
+    def legacy_path_for(self, digest: str, extension: str) -> str:
+        """Path in the earlier one-level layout (root/ab/<digest>.ext)"""
+        return os.path.join(self.root, digest[:2], f"{digest}{extension}")
+
+    def resolve(self, filename: str) -> str | None:
+        """Path of a blob named in a URL (None if the name is not a blob name)"""
+        match = BLOB_NAME.match(filename)
+        if not match:
+            return None
+        return self.path_for(match.group(1), match.group(2))
+
+    def _recorded_path(self, digest: str) -> str | None:
+        db = SessionLocal()
+        try:
+            row = db.query(AudioBlob.path).filter(AudioBlob.digest == digest).first()
+            return row[0] if row else None
+        finally:
+            db.close()
+
+    async def locate(self, filename: str) -> str | None:
+        """
+        Path of a blob named in a URL, in whichever layout holds it
+
+        Blobs stored before the sharded layout stay in the one-level layout
+        until migrate_sharded_layout.py moves them; remote blobs that are not
+        cached here are looked up on their row.
+
+        Returns:
+            The path (which may not exist), or None if the name is not a blob name
+        """
+        match = BLOB_NAME.match(filename)
+        if not match:
+            return None
+        digest, extension = match.groups()
+        path = self.path_for(digest, extension)
+        legacy_path = self.legacy_path_for(digest, extension)
+        for candidate in (path, legacy_path):
+            if os.path.isfile(candidate):
+                return candidate
+        if not self.storage.remote:
+            return path
+
+        recorded = self._locations.get(filename)
+        if recorded is None:
+            recorded = await asyncio.to_thread(self._recorded_path, digest) or path
+            # Legacy locations change when migrated, so only sharded ones are cached
+            if recorded == path:
+                self._locations[filename] = recorded
+                while len(self._locations) > 4096:
+                    self._locations.popitem(last=False)
+        return recorded
+
+    def key_for(self, path: str) -> str:
+        """Storage key of a file under root"""
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def is_blob(self, path: str) -> bool:
+        """Whether a path is a file inside the store (in either layout)"""
+        digest = blob_digest(os.path.basename(path))
+        if digest is None:
+            return False
+        extension = os.path.splitext(path)[1]
+        return os.path.abspath(path) in (
+            os.path.abspath(self.path_for(digest, extension)),
+            os.path.abspath(self.legacy_path_for(digest, extension))
+        )
+
+    def is_current(self, path: str) -> bool:
+        """Whether a blob path is in the sharded layout"""
+        digest = blob_digest(os.path.basename(path))
+        return digest is not None and os.path.abspath(path) == os.path.abspath(
+            self.path_for(digest, os.path.splitext(path)[1])
+        )
+
+    @contextmanager
+    def _digest_lock(self, digest: str):
+        """
+        Serialize put() and delete_files() for a digest across this node's processes
+
+        One lock file per first-level shard under root/.locks, which the
+        cache accounting and the garbage collector skip.
+        """
+        lock_dir = os.path.join(self.root, ".locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, f"{digest[:2]}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _register(self, digest: str, path: str, size: int, extension: str) -> bool:
+        """Record a stored blob; returns False if it already had a row"""
+        db = SessionLocal()
+        try:
+            # Reused just now: keep the garbage collector's grace period from
+            # expiring before the caller acquires it (a row released meanwhile
+            # matches nothing and is recreated below)
+            touched = db.query(AudioBlob).filter(AudioBlob.digest == digest).update(
+                {AudioBlob.last_referenced_at: func.now()}, synchronize_session=False
+            )
+            if touched:
+                db.commit()
+                return False
+            db.add(AudioBlob(digest=digest, path=path, size_bytes=size, extension=extension, ref_count=0))
+            db.commit()
+            return True
+        except IntegrityError:
+            # Another process stored the same content at the same moment
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def put(self, path: str, keep_source: bool = False) -> tuple[str, str | None]:
+        """
+        Move a generated file into the store
+
+        An identical blob already stored is reused and the new copy removed.
+        New blobs start unreferenced; acquire() counts the rows that use them.
+
+        Args:
+            path: File directly inside STORIES_DIR (other paths are left alone)
+            keep_source: Leave the file in place and store a hard link or copy
+                (the layout migration deletes sources once its rows commit)
+
+        Returns:
+            Tuple of (path to use from now on, content digest or None if the
+            file was not taken over)
+        """
+        if self.is_blob(path):
+            return path, blob_digest(os.path.basename(path))
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.source_dir):
+            return path, None
+
+        digest = file_digest(path)
+        extension = os.path.splitext(path)[1].lower()
+        size = os.path.getsize(path)
+
+        # Held until the file is in place, so delete_files() cannot remove the
+        # blob between the existence check below and the caller's use of it
+        with self._digest_lock(digest):
+            # An identical blob keeps its recorded path, even in the one-level layout
+            target = self._recorded_path(digest) or self.path_for(digest, extension)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+
+            # The row goes in first: delete_files() keeps any blob that has one
+            created = self._register(digest, target, size, extension)
+
+            # Upload first, so every file in a remote store's cache can be evicted.
+            # A new row means the blob was released (or never stored), so its
+            # stored object may be on its way out on another node: upload anyway
+            if self.storage.remote and (created or not self.storage.exists(self.key_for(target))):
+                self.storage.upload(path, self.key_for(target), content_type_for(extension))
+
+            if os.path.exists(target):
+                if not keep_source:
+                    os.remove(path)
+                logger.info(f"Deduplicated {os.path.basename(path)} into blob {digest[:12]}")
+            else:
+                if keep_source:
+                    try:
+                        os.link(path, target)
+                    except OSError:
+                        shutil.copy2(path, target)
+                else:
+                    os.replace(path, target)
+                self._cached(target, size)
+
+        return target, digest
+
+    def put_many(self, paths: list[str]) -> dict[str, tuple[str, str | None]]:
+        """put() each distinct path; returns original path -> (path, digest)"""
+        return {path: self.put(path) for path in dict.fromkeys(paths) if path}
+
+    def _digests(self, paths: set[str]) -> list[str]:
+        return list({blob_digest(os.path.basename(path)) for path in paths if self.is_blob(path)})
+
+    def acquire(self, db: Session, paths: set[str]):
+        """Count one more reference to each blob among paths (caller commits)"""
+        # By digest, so rows still naming the one-level layout count too
+        digests = self._digests(paths)
+        if not digests:
+            return
+        db.query(AudioBlob).filter(AudioBlob.digest.in_(digests)).update(
+            {AudioBlob.ref_count: AudioBlob.ref_count + 1, AudioBlob.last_referenced_at: func.now()},
+            synchronize_session=False
+        )
+
+    def release(self, db: Session, paths: set[str]) -> list[str]:
+        """
+        Drop one reference to each blob among paths (caller commits)
+
+        Blobs left without references lose their row here; delete their
+        files with delete_files() once the transaction has committed.
+
+        Returns:
+            Files of blobs that are no longer referenced
+        """
+        digests = self._digests(paths)
+        if not digests:
+            return []
+        db.query(AudioBlob).filter(AudioBlob.digest.in_(digests)).update(
+            {AudioBlob.ref_count: AudioBlob.ref_count - 1},
+            synchronize_session=False
+        )
+        unreferenced = db.query(AudioBlob).filter(
+            AudioBlob.digest.in_(digests), AudioBlob.ref_count <= 0
+        ).all()
+        for blob in unreferenced:
+            db.delete(blob)
+        return [blob.path for blob in unreferenced]
+
+    def delete_files(self, paths: list[str]):
+        """
+        Remove blob files released by release() (and their stored objects)
+
+        A blob put() again since its row was deleted has a row once more and
+        is kept.
+        """
+        for path in paths:
+            name = os.path.basename(path)
+            digest = blob_digest(name)
+            with self._digest_lock(digest):
+                if self._recorded_path(digest) is not None:
+                    logger.info(f"Blob {name} was stored again after its release, keeping it")
+                    continue
+
+                if self.storage.remote:
+                    try:
+                        self.storage.delete(self.key_for(path))
+                    except Exception as e:
+                        # The garbage collector retries blobs whose row is gone
+                        logger.warning(f"Could not delete stored blob {name}: {str(e)}")
+                    if self._recorded_path(digest) is not None:
+                        # Stored again on another node while we deleted it
+                        if os.path.exists(path):
+                            self.storage.upload(path, self.key_for(path), content_type_for(os.path.splitext(path)[1]))
+                        else:
+                            logger.warning(f"Blob {name} was stored again while being deleted and is not cached here")
+                        continue
+
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            logger.info(f"Deleted unreferenced blob {name}")
+            self._renditions.pop(name, None)
+
+    def _cached(self, path: str, size: int):
+        """Account for a file added to a remote store's cache and trim it"""
+        if not self.storage.remote or not self.cache_max_bytes:
+            return
+        with self._cache_lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(size for _, size, _ in self._cache_files())
+            else:
+                self._cache_bytes += size
+            if self._cache_bytes > self.cache_max_bytes:
+                self._evict(keep=path)
+
+    def _cache_files(self):
+        """(path, size, last access) of every cached file"""
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith((".part", ".lock")):
+                    continue  # Download in progress, or a put()/delete_files() lock
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_atime
+
+    def _evict(self, keep: str):
+        """Drop least recently read cache files (but keep) until 90% of the limit is left"""
+        files = sorted(self._cache_files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total <= self.cache_max_bytes * 0.9:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+        self._cache_bytes = total
+
+    def fetch(self, path: str) -> str | None:
+        """
+        Local copy of a file under root, downloaded from storage if needed
+
+        Returns:
+            The path, or None if neither the cache nor storage has it
+        """
+        if os.path.isfile(path):
+            if self.storage.remote:
+                # Record the read for LRU eviction (noatime mounts skip it)
+                stat = os.stat(path)
+                os.utime(path, (time.time(), stat.st_mtime))
+            return path
+        if not self.storage.remote:
+            return None
+
+        key = self.key_for(path)
+        with self._cache_lock:
+            lock = self._fetch_locks.setdefault(key, threading.Lock())
+        with lock:
+            # Concurrent readers of the same file wait for one download
+            try:
+                if not os.path.isfile(path):
+                    self.storage.download(key, path)
+                    self._cached(path, os.path.getsize(path))
+            except FileNotFoundError:
+                return None
+            finally:
+                with self._cache_lock:
+                    self._fetch_locks.pop(key, None)
+        return path
+
+    async def fetch_async(self, path: str) -> str | None:
+        """fetch() off the event loop"""
+        if os.path.isfile(path) and not self.storage.remote:
+            return path
+        return await asyncio.to_thread(self.fetch, path)
+
+    def url_for(self, path: str, download_name: str | None = None) -> str | None:
+        """Presigned URL clients can be redirected to (None to serve it here)"""
+        if not (self.storage.remote and settings.STORAGE_REDIRECT):
+            return None
+        return self.storage.url_for(
+            self.key_for(path),
+            content_type=content_type_for(os.path.splitext(path)[1].lower()),
+            download_name=download_name
+        )
+
+    def hls_cache_path(self, rendition: str, filename: str, legacy: bool = False) -> str:
+        """
+        Where an HLS file from remote storage is cached (its key under root)
+
+        Args:
+            legacy: The unsharded path renditions were first published under
+        """
+        hls_root = os.path.join(self.root, "hls")
+        directory = os.path.join(hls_root, rendition) if legacy else shard_path(hls_root, rendition)
+        return os.path.join(directory, filename)
+
+    def publish_hls(self, playlist_path: str):
+        """
+        Upload an HLS rendition directory to remote storage
+
+        Args:
+            playlist_path: Playlist inside the rendition directory
+        """
+        if not self.storage.remote:
+            return
+        directory = os.path.dirname(playlist_path)
+        rendition = os.path.basename(directory)
+        # The playlist goes last, so a published playlist never names a missing segment
+        names = sorted(os.listdir(directory), key=lambda name: (name.endswith(".m3u8"), name))
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                self.storage.upload(path, self.key_for(self.hls_cache_path(rendition, name)), mimetypes.guess_type(name)[0])
+
+    def delete_hls(self, playlist_path: str):
+        """Remove an HLS rendition's stored objects and cached files"""
+        rendition = os.path.basename(os.path.dirname(playlist_path))
+        for legacy in (False, True):
+            cache_dir = os.path.dirname(self.hls_cache_path(rendition, HLS_PLAYLIST, legacy=legacy))
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            if self.storage.remote:
+                self.storage.delete_prefix(self.key_for(cache_dir) + "/")
+
+    def relocate(self, db: Session, path: str) -> str:
+        """
+        Copy a blob from the one-level layout into the sharded one and repoint
+        its row (caller commits, then drops the old copy with discard())
+
+        Returns:
+            The blob's sharded path
+        """
+        digest = blob_digest(os.path.basename(path))
+        target = self.path_for(digest, os.path.splitext(path)[1])
+        if self.is_current(path):
+            return path
+
+        if os.path.exists(path) and not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copy2(path, target)
+        if self.storage.remote and not self.storage.exists(self.key_for(target)):
+            self.storage.copy(self.key_for(path), self.key_for(target))
+
+        db.query(AudioBlob).filter(AudioBlob.digest == digest).update(
+            {AudioBlob.path: target}, synchronize_session=False
+        )
+        return target
+
+    def discard(self, paths: list[str]):
+        """Remove superseded copies of blobs (and their objects) after relocate()"""
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            if self.storage.remote:
+                self.storage.delete(self.key_for(path))
+        # Cached lookups may name the old copies
+        self._renditions.clear()
+        self._locations.clear()
+
+    def _recorded_alias(self, filename: str) -> str | None:
+        db = SessionLocal()
+        try:
+            row = db.query(AudioAlias.target).filter(AudioAlias.name == filename).first()
+            return row[0] if row else None
+        finally:
+            db.close()
+
+    async def alias_for(self, filename: str) -> str | None:
+        """Blob name a migrated STORIES_DIR file is now served under, if any"""
+        return await asyncio.to_thread(self._recorded_alias, filename)
+
+    def _recorded_renditions(self, filename: str) -> dict[str, str]:
+        url = f"/api/v1/stories/audio/{filename}"
+        db = SessionLocal()
+        try:
+            for model in (Story, StoryVersion):
+                row = db.query(model.audio_renditions).filter(
+                    model.audio_url == url, model.audio_renditions.isnot(None)
+                ).first()
+                if row:
+                    return json.loads(row[0])
+            return {}
+        finally:
+            db.close()
+
+    async def renditions_of(self, filename: str) -> dict[str, str]:
+        """
+        Renditions recorded for a primary blob (format -> path)
+
+        Blob renditions are not siblings on disk, so they are looked up on the
+        story row; content never changes under a blob name, so found entries
+        are cached.
+        """
+        renditions = self._renditions.get(filename)
+        if renditions is None:
+            renditions = await asyncio.to_thread(self._recorded_renditions, filename)
+            if renditions and all(map(self.is_current, single_file_renditions(renditions).values())):
+                self._renditions[filename] = renditions
+                while len(self._renditions) > 4096:
+                    self._renditions.popitem(last=False)
+        available = {}
+        for audio_format, path in single_file_renditions(renditions).items():
+            # Rows not migrated yet may still name a relocated blob's old copy
+            if self.is_blob(path) and not self.is_current(path):
+                path = await self.locate(os.path.basename(path))
+            # Remote renditions were uploaded before the row recorded them
+            if self.storage.remote or os.path.exists(path):
+                available[audio_format] = path
+        return available
+
+    def usage(self, db: Session) -> dict:
+        """Disk usage of the store and of files still loose in STORIES_DIR"""
+        def totals(query):
+            count, size = query.with_entities(func.count(AudioBlob.id), func.coalesce(func.sum(AudioBlob.size_bytes), 0)).one()
+            return {"count": count, "bytes": int(size)}
+
+        blobs = db.query(AudioBlob)
+        by_extension = {
+            extension: {"count": count, "bytes": int(size or 0)}
+            for extension, count, size in db.query(
+                AudioBlob.extension, func.count(AudioBlob.id), func.sum(AudioBlob.size_bytes)
+            ).group_by(AudioBlob.extension)
+        }
+        # Bytes that would be on disk without deduplication
+        deduplicated = db.query(
+            func.coalesce(func.sum(AudioBlob.size_bytes * (AudioBlob.ref_count - 1)), 0)
+        ).filter(AudioBlob.ref_count > 1).scalar()
+
+        loose = {"count": 0, "bytes": 0}
+        if os.path.isdir(self.source_dir):
+            with os.scandir(self.source_dir) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        loose["count"] += 1
+                        loose["bytes"] += entry.stat().st_size
+
+        return {
+            "blobs": totals(blobs),
+            "referenced": totals(blobs.filter(AudioBlob.ref_count > 0)),
+            "unreferenced": totals(blobs.filter(AudioBlob.ref_count <= 0)),
+            "by_extension": by_extension,
+            "bytes_saved_by_dedup": int(deduplicated),
+            "loose_files": loose
+        }
+
+
+# Global store used by the scheduler, routes and orchestrator
+blob_store = BlobStore(settings.BLOB_STORE_DIR, settings.STORIES_DIR, storage, settings.STORAGE_CACHE_MAX_MB)
@@ -0,0 +1,107 @@
+"""
+Per-story workflow checkpoints
+
+The orchestrator records the output of every completed stage on the story
+row, so a retried or resumed job can skip stages that already succeeded.
+"""
+
+import json
+import logging
+import os
+from app.core.database import SessionLocal
+from app.models.story import IN_PROGRESS_STATUSES, Story
+from app.services.blob_store import blob_store
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    """Stores workflow checkpoints as JSON in stories.generation_checkpoint"""
+
+    # Checkpoint fields that point at files which must still exist to be reused
+    ARTIFACT_FIELDS = ("narration_path", "music_path", "final_audio_path")
+
+    def load(self, story_id: int) -> dict:
+        """
+        Load the checkpoint for a story
+
+        Artifact paths whose files have gone missing are dropped, so the
+        stages that produced them run again.
+
+        Returns:
+            Checkpointed state fields (empty if there is no checkpoint)
+        """
+        db = SessionLocal()
+        try:
+            story = db.query(Story).filter(Story.id == story_id).first()
+            if not story or not story.generation_checkpoint:
+                return {}
+            checkpoint = json.loads(story.generation_checkpoint)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"[Story {story_id}] Ignoring unreadable checkpoint: {str(e)}")
+            return {}
+        finally:
+            db.close()
+
+        for field in self.ARTIFACT_FIELDS:
+            path = checkpoint.get(field)
+            if path and not self.artifact_exists(path):
+                logger.warning(f"[Story {story_id}] Checkpointed {field} is missing on disk: {path}")
+                checkpoint.pop(field)
+                if field == "final_audio_path":
+                    checkpoint.pop("audio_renditions", None)
+                    checkpoint.pop("audio_etags", None)
+                    checkpoint.pop("duration_seconds", None)
+
+        return checkpoint
+
+    def save(self, story_id: int, fields: dict, owner: str | None = None):
+        """
+        Merge stage output into the story's checkpoint
+
+        With an owner, the checkpoint is only written while the story is
+        still in progress and leased to it; a superseded run cannot bring
+        back a checkpoint that regeneration cleared.
+
+        Returns:
+            False if the story is gone or no longer owned
+        """
+        db = SessionLocal()
+        try:
+            story = db.query(Story).filter(Story.id == story_id).first()
+            if not story:
+                return False
+            checkpoint = json.loads(story.generation_checkpoint or "{}")
+            checkpoint.update(fields)
+
+            # Compare-and-set, so ownership cannot change between the read and the write
+            conditions = [Story.id == story_id]
+            if owner is not None:
+                conditions += [Story.status.in_(IN_PROGRESS_STATUSES), Story.lease_owner == owner]
+            saved = db.query(Story).filter(*conditions).update(
+                {Story.generation_checkpoint: json.dumps(checkpoint)}, synchronize_session=False
+            )
+            db.commit()
+            return saved == 1
+        finally:
+            db.close()
+
+    def clear(self, story_id: int):
+        """Forget a story's checkpoint (e.g. before regenerating from scratch)"""
+        db = SessionLocal()
+        try:
+            story = db.query(Story).filter(Story.id == story_id).first()
+            if story and story.generation_checkpoint:
+                story.generation_checkpoint = None
+                db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def artifact_exists(path: str) -> bool:
+        """Whether a checkpointed file is still usable (blobs are fetched from storage)"""
+        if blob_store.is_blob(path):
+            path = blob_store.fetch(path)
+            if path is None:
+                return False
+        return os.path.isfile(path) and os.path.getsize(path) > 0
@@ -0,0 +1,108 @@
+"""
+Process-wide service container
+
+Holds the long-lived objects the generation pipeline needs (compiled
+workflow, provider clients, a shared HTTP connection pool and the audio
+worker processes) so they are built once at startup instead of once per
+story.
+"""
+
+import httpx
+import logging
+from app.core.config import settings
+from app.services.artifact_gc import ArtifactCollectorTask, build_collector
+from app.services.audio_workers import AudioWorkerPool
+from app.services.music_library import MusicLibraryWarmer
+from app.services.story_orchestrator import StoryOrchestrator
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """Owns the shared HTTP client, audio worker pool and StoryOrchestrator for this process"""
+
+    def __init__(self):
+        self.http_client: httpx.AsyncClient | None = None
+        self._orchestrator: StoryOrchestrator | None = None
+        self.music_warmer: MusicLibraryWarmer | None = None
+        self.artifact_gc: ArtifactCollectorTask | None = None
+        self.audio_workers = AudioWorkerPool(settings.AUDIO_PROCESS_WORKERS)
+
+    async def start(self):
+        """Create the shared clients and compile the workflow"""
+        orchestrator = self.get_orchestrator()
+
+        # Keep the music library stocked so stories rarely wait for live Lyria
+        if settings.MUSIC_LIBRARY_WARMER_ENABLED and settings.MUSIC_SOURCE_POLICY != "live_only":
+            self.music_warmer = MusicLibraryWarmer(
+                library=orchestrator.music_service.library,
+                music_service=orchestrator.music_service,
+                beds_per_mood=settings.MUSIC_LIBRARY_BEDS_PER_MOOD,
+                bed_seconds=settings.MUSIC_LIBRARY_BED_SECONDS,
+                refresh_hours=settings.MUSIC_LIBRARY_REFRESH_HOURS,
+                retired_grace_hours=settings.MUSIC_LIBRARY_RETIRED_GRACE_HOURS,
+                interval_seconds=settings.MUSIC_LIBRARY_WARM_INTERVAL_SECONDS
+            )
+            self.music_warmer.start()
+
+        # Reclaim narration, music and partial files no story references
+        if settings.GC_ENABLED:
+            self.artifact_gc = ArtifactCollectorTask(build_collector(), settings.GC_INTERVAL_HOURS)
+            self.artifact_gc.start()
+
+        logger.info(f"Services started (HTTP/2: {HTTP2_AVAILABLE})")
+
+    def get_http_client(self) -> httpx.AsyncClient:
+        """Shared keep-alive connection pool for provider APIs"""
+        if self.http_client is None or self.http_client.is_closed:
+            if not HTTP2_AVAILABLE:
+                logger.warning("h2 is not installed, provider requests will use HTTP/1.1")
+            self.http_client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=settings.HTTP_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS
+                )
+            )
+        return self.http_client
+
+    def get_orchestrator(self) -> StoryOrchestrator:
+        """The process-wide orchestrator, built on first use"""
+        if self._orchestrator is None:
+            self._orchestrator = StoryOrchestrator(
+                http_client=self.get_http_client(),
+                audio_workers=self.audio_workers
+            )
+        return self._orchestrator
+
+    async def aclose(self):
+        """Close provider clients and the connection pool"""
+        if self.music_warmer is not None:
+            await self.music_warmer.stop()
+            self.music_warmer = None
+
+        if self.artifact_gc is not None:
+            await self.artifact_gc.stop()
+            self.artifact_gc = None
+
+        if self._orchestrator is not None:
+            await self._orchestrator.aclose()
+            self._orchestrator = None
+
+        await self.audio_workers.aclose()
+
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+        logger.info("Services closed")
+
+
+services = ServiceContainer()
@@ -0,0 +1,144 @@
+"""
+Single-pass ffmpeg mixing engine
+
+Builds one filter graph that loops the music bed (crossfading each seam),
+trims it to the narration, applies gain and fades, mixes it under the
+narration and limits the peaks, then runs it as one ffmpeg process from
+the source files straight to the final renditions. No audio passes through
+Python at all.
+
+Unlike the other engines this does not peak-normalize (that needs a second
+pass over the mix); a limiter keeps the output below the same ceiling.
+"""
+
+import logging
+import math
+import os
+import subprocess
+from pydub import AudioSegment
+from app.services.numpy_mixer import NORMALIZE_HEADROOM_DB
+from app.services.renditions import output_args, rendition_paths, split_outputs
+from app.utils.audio_probe import probe_duration
+
+logger = logging.getLogger(__name__)
+
+
+def build_filter_graph(
+    narration_seconds: float,
+    music_seconds: float,
+    music_gain_db: float,
+    crossfade_ms: int,
+    fade_in_ms: int,
+    fade_out_ms: int,
+    sample_rate: int
+) -> str:
+    """
+    Filter graph mixing input 0 (narration) over input 1 (music)
+
+    With music_seconds 0 there is no music input and the graph only limits
+    the narration.
+
+    Returns:
+        filter_complex string whose output pad is [out]
+    """
+    ceiling = 10 ** (-NORMALIZE_HEADROOM_DB / 20)
+    audio_format = f"aformat=sample_fmts=fltp:sample_rates={sample_rate}:channel_layouts=stereo"
+    # Narration is mono speech: copy it to both channels at full level like the
+    # other engines do (ffmpeg's default mono upmix is 3 dB quieter)
+    filters = [
+        f"[0:a]aformat=sample_fmts=fltp:sample_rates={sample_rate}:channel_layouts=mono,"
+        "pan=stereo|c0=c0|c1=c0[voice]"
+    ]
+    if not music_seconds:
+        filters.append(f"[voice]alimiter=limit={ceiling:.4f}:level=0[out]")
+        return ";".join(filters)
+
+    crossfade = min(crossfade_ms / 1000, music_seconds / 2)
+    if music_seconds >= narration_seconds:
+        copies = 1
+    elif crossfade <= 0:
+        copies = math.ceil(narration_seconds / music_seconds)
+    else:
+        # n copies overlapping by one crossfade each cover n*M - (n-1)*X seconds
+        copies = math.ceil((narration_seconds - crossfade) / (music_seconds - crossfade))
+
+    if copies == 1:
+        bed = "music"
+        filters.append(f"[1:a]{audio_format}[{bed}]")
+    elif crossfade <= 0:
+        bed = "music"
+        filters.append(f"[1:a]{audio_format},aloop=loop={copies - 1}:size={int(music_seconds * sample_rate) + 1}[{bed}]")
+    else:
+        pads = "".join(f"[m{i}]" for i in range(copies))
+        filters.append(f"[1:a]{audio_format},asplit={copies}{pads}")
+        bed = "m0"
+        for i in range(1, copies):
+            filters.append(f"[{bed}][m{i}]acrossfade=d={crossfade:.3f}:c1=tri:c2=tri[x{i}]")
+            bed = f"x{i}"
+
+    fade_in = min(fade_in_ms / 1000, narration_seconds)
+    fade_out = min(fade_out_ms / 1000, narration_seconds)
+    filters.append(
+        f"[{bed}]atrim=end={narration_seconds:.6f},asetpts=PTS-STARTPTS,"
+        f"volume={music_gain_db}dB,"
+        f"afade=t=in:st=0:d={fade_in:.3f},"
+        f"afade=t=out:st={narration_seconds - fade_out:.6f}:d={fade_out:.3f}[bed]"
+    )
+
+    filters.append(
+        "[voice][bed]amix=inputs=2:duration=first:dropout_transition=0:normalize=0,"
+        f"alimiter=limit={ceiling:.4f}:level=0[out]"
+    )
+    return ";".join(filters)
+
+
+def render_mix_ffmpeg(
+    narration_path: str,
+    music_path: str,
+    output_path: str,
+    music_gain_db: float,
+    crossfade_ms: int,
+    fade_in_ms: int,
+    fade_out_ms: int,
+    sample_rate: int,
+    renditions: dict[str, str] | None = None
+) -> float:
+    """
+    Mix narration over looped background music in a single ffmpeg run
+
+    The mixed signal is split inside the graph and encoded into every
+    rendition by the same run.
+
+    Args:
+        renditions: Rendition format -> output file (defaults to every
+            configured rendition next to output_path)
+
+    Returns:
+        Narration duration in seconds
+    """
+    narration_seconds = probe_duration(narration_path)
+    if not narration_seconds:
+        raise Exception("Could not determine narration duration")
+    music_seconds = (probe_duration(music_path) or 0.0) if os.path.getsize(music_path) else 0.0
+    if not music_seconds:
+        # Same as the other engines: an empty bed is no reason to fail the story
+        logger.warning("Music track is empty, mixing narration only")
+
+    graph = build_filter_graph(
+        narration_seconds, music_seconds, music_gain_db,
+        crossfade_ms, fade_in_ms, fade_out_ms, sample_rate
+    )
+    renditions = renditions or rendition_paths(output_path)
+    graph, labels = split_outputs(graph, "out", len(renditions))
+    inputs = ["-i", narration_path] + (["-i", music_path] if music_seconds else [])
+    command = [
+        AudioSegment.converter, "-y", "-loglevel", "error", "-nostdin",
+        *inputs,
+        "-filter_complex", graph
+    ] + output_args(renditions, labels)
+
+    result = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg mix failed: {result.stderr.decode(errors='replace').strip()}")
+
+    return narration_seconds
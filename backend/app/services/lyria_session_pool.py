@@ -0,0 +1,282 @@
+"""
+Pool of reusable Lyria RealTime sessions
+
+Opening a Lyria session (websocket connect, setup handshake, prompts,
+config, play) costs more than the first seconds of audio. The pool keeps
+finished sessions paused and hands them to the next story, re-prompting
+them when the mood differs, so most stories skip the connect entirely.
+"""
+
+import asyncio
+import contextlib
+import logging
+import statistics
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession:
+    """A live Lyria session plus the bookkeeping the pool needs"""
+
+    def __init__(self, session, exit_stack: contextlib.AsyncExitStack):
+        self.session = session
+        self.exit_stack = exit_stack
+        self.mood: str | None = None
+        self.created_at = time.monotonic()
+        self.uses = 0
+        # Set when the session is leased; read by receive() for time-to-first-chunk
+        self.leased_at = 0.0
+        self.reused = False
+        self.first_chunk_seconds: float | None = None
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    def is_open(self) -> bool:
+        """Whether the underlying websocket is still connected"""
+        websocket = getattr(self.session, "_ws", None)
+        return websocket is None or getattr(websocket, "close_code", None) is None
+
+    async def receive(self):
+        """Session messages, timing the first one that carries audio"""
+        async for message in self.session.receive():
+            if self.first_chunk_seconds is None:
+                server_content = getattr(message, "server_content", None)
+                if getattr(server_content, "audio_chunks", None):
+                    self.first_chunk_seconds = time.monotonic() - self.leased_at
+            yield message
+
+
+class LyriaSessionPool:
+    """Hands out configured, playing Lyria sessions and takes them back"""
+
+    # How long to wait for in-flight audio after pausing a returned session
+    DRAIN_QUIET_SECONDS = 0.25
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        configure,
+        max_sessions: int,
+        max_idle: int,
+        max_age_seconds: float,
+        idle_timeout_seconds: float
+    ):
+        """
+        Args:
+            client: genai.Client used to connect
+            model: Lyria model name
+            configure: async callable(session, mood) that sets prompts and config
+            max_sessions: Sessions streaming at the same time (others wait)
+            max_idle: Paused sessions kept for reuse (0 disables reuse)
+            max_age_seconds: Sessions older than this are closed instead of reused
+            idle_timeout_seconds: Paused sessions unused this long are closed
+        """
+        self.client = client
+        self.model = model
+        self.configure = configure
+        self.max_sessions = max_sessions
+        self.max_idle = max_idle
+        self.max_age_seconds = max_age_seconds
+        self.idle_timeout_seconds = idle_timeout_seconds
+
+        self._slots = asyncio.Semaphore(max_sessions)
+        self._idle: list[tuple[float, PooledSession]] = []  # (paused_at, session)
+        self._leased = 0
+        self._waiting = 0
+
+        self.connects = 0
+        self.reuses = 0
+        self.reprompts = 0
+        self.discarded = 0
+        self._first_chunk = {"fresh": deque(maxlen=100), "reused": deque(maxlen=100)}
+
+    @contextlib.asynccontextmanager
+    async def session(self, mood: str):
+        """
+        Lease a playing session configured for a mood
+
+        The session goes back to the pool when the block exits normally and
+        is closed if the block raised (its stream state is unknown).
+
+        Yields:
+            PooledSession (use its receive() to read audio)
+        """
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._leased += 1
+        pooled = None
+        try:
+            pooled = await self._checkout(mood)
+            yield pooled
+        except BaseException:
+            if pooled is not None:
+                await self._close(pooled)
+                pooled = None
+            raise
+        finally:
+            if pooled is not None:
+                self._record_first_chunk(pooled)
+                await self._checkin(pooled)
+            self._leased -= 1
+            self._slots.release()
+
+    async def _checkout(self, mood: str) -> PooledSession:
+        """Reuse a healthy idle session if there is one, else connect"""
+        await self._prune()
+
+        while self._idle:
+            pooled = self._take_idle(mood)
+            leased_at = time.monotonic()
+            try:
+                if pooled.mood != mood:
+                    await self.configure(pooled.session, mood)
+                    await pooled.session.reset_context()
+                    self.reprompts += 1
+                await pooled.session.play()
+            except Exception as e:
+                # Health check failed: the server dropped the session while it was idle
+                logger.info(f"Discarding unhealthy Lyria session: {str(e)}")
+                await self._close(pooled)
+                continue
+
+            pooled.mood = mood
+            self._lease(pooled, leased_at, reused=True)
+            self.reuses += 1
+            return pooled
+
+        leased_at = time.monotonic()
+        pooled = await self._connect()
+        try:
+            await self.configure(pooled.session, mood)
+            await pooled.session.play()
+        except BaseException:
+            await self._close(pooled)
+            raise
+
+        pooled.mood = mood
+        self._lease(pooled, leased_at, reused=False)
+        return pooled
+
+    def _take_idle(self, mood: str) -> PooledSession:
+        """Most recently paused session for the mood, else the oldest idle one"""
+        for index in range(len(self._idle) - 1, -1, -1):
+            if self._idle[index][1].mood == mood:
+                return self._idle.pop(index)[1]
+        return self._idle.pop(0)[1]
+
+    @staticmethod
+    def _lease(pooled: PooledSession, leased_at: float, reused: bool):
+        pooled.leased_at = leased_at
+        pooled.reused = reused
+        pooled.first_chunk_seconds = None
+        pooled.uses += 1
+
+    async def _connect(self) -> PooledSession:
+        exit_stack = contextlib.AsyncExitStack()
+        try:
+            session = await exit_stack.enter_async_context(
+                self.client.aio.live.music.connect(model=self.model)
+            )
+        except BaseException:
+            await exit_stack.aclose()
+            raise
+        self.connects += 1
+        return PooledSession(session, exit_stack)
+
+    async def _checkin(self, pooled: PooledSession):
+        """Pause a returned session and keep it if the pool has room"""
+        if len(self._idle) >= self.max_idle or pooled.age > self.max_age_seconds:
+            await self._close(pooled)
+            return
+
+        try:
+            await pooled.session.pause()
+            await self._drain(pooled)
+        except Exception as e:
+            logger.info(f"Closing Lyria session that failed to pause: {str(e)}")
+            await self._close(pooled)
+            return
+
+        # Another session may have been checked in while this one drained
+        if len(self._idle) >= self.max_idle:
+            await self._close(pooled)
+            return
+
+        self._idle.append((time.monotonic(), pooled))
+
+    async def _drain(self, pooled: PooledSession):
+        """Discard audio already in flight so the next lease starts clean"""
+        messages = pooled.session.receive()
+        try:
+            while True:
+                await asyncio.wait_for(messages.__anext__(), self.DRAIN_QUIET_SECONDS)
+        except (asyncio.TimeoutError, StopAsyncIteration):
+            pass
+
+    async def _prune(self):
+        """Close idle sessions that are too old, idle too long or disconnected"""
+        now = time.monotonic()
+        keep = []
+        for paused_at, pooled in self._idle:
+            if (
+                pooled.age > self.max_age_seconds
+                or now - paused_at > self.idle_timeout_seconds
+                or not pooled.is_open()
+            ):
+                await self._close(pooled)
+            else:
+                keep.append((paused_at, pooled))
+        self._idle = keep
+
+    async def _close(self, pooled: PooledSession):
+        self.discarded += 1
+        try:
+            await pooled.exit_stack.aclose()
+        except Exception as e:
+            logger.debug(f"Error closing Lyria session: {str(e)}")
+
+    def _record_first_chunk(self, pooled: PooledSession):
+        if pooled.first_chunk_seconds is not None:
+            kind = "reused" if pooled.reused else "fresh"
+            self._first_chunk[kind].append(pooled.first_chunk_seconds)
+
+    async def aclose(self):
+        """Close every idle session"""
+        idle, self._idle = self._idle, []
+        for _, pooled in idle:
+            await self._close(pooled)
+
+    def stats(self) -> dict:
+        """Pool occupancy, reuse counters and time-to-first-chunk for fresh vs. reused sessions"""
+        def summarize(samples):
+            if not samples:
+                return None
+            ordered = sorted(samples)
+            return {
+                "count": len(ordered),
+                "p50_seconds": round(statistics.median(ordered), 3),
+                "max_seconds": round(ordered[-1], 3)
+            }
+
+        return {
+            "max_sessions": self.max_sessions,
+            "leased": self._leased,
+            "idle": len(self._idle),
+            "waiting": self._waiting,
+            "connects": self.connects,
+            "reuses": self.reuses,
+            "reprompts": self.reprompts,
+            "closed": self.discarded,
+            "time_to_first_chunk": {
+                kind: summarize(samples) for kind, samples in self._first_chunk.items()
+            }
+        }
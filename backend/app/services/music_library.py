@@ -0,0 +1,233 @@
+"""
+Pre-rendered background music library
+
+Keeps a few loopable beds per mood on disk so stories can pick music
+instantly instead of waiting for a live Lyria session. A background warmer
+fills missing beds and rotates old ones; a rotated-out bed is only deleted
+after a grace period, since stories that picked it mix it after narration.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+import wave
+
+logger = logging.getLogger(__name__)
+
+
+class MusicLibrary:
+    """Beds stored as <library_dir>/<mood>/<bed_id>.wav with a .json sidecar"""
+
+    def __init__(self, library_dir: str):
+        self.library_dir = library_dir
+
+    def _mood_dir(self, mood: str) -> str:
+        return os.path.join(self.library_dir, mood)
+
+    def list_beds(self, mood: str) -> list[dict]:
+        """
+        Beds available for a mood, oldest first
+
+        Returns:
+            Metadata dicts including 'path', 'mood', 'duration' and 'created_at'
+        """
+        mood_dir = self._mood_dir(mood)
+        if not os.path.isdir(mood_dir):
+            return []
+
+        beds = []
+        for name in os.listdir(mood_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(mood_dir, name)) as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if os.path.isfile(metadata.get("path", "")):
+                beds.append(metadata)
+
+        return sorted(beds, key=lambda bed: bed["created_at"])
+
+    def pick_bed(self, mood: str) -> dict | None:
+        """A random bed for the mood, or None if the library has none yet"""
+        beds = self.list_beds(mood)
+        return random.choice(beds) if beds else None
+
+    def new_bed_path(self, mood: str) -> tuple[str, str]:
+        """Reserve an id and audio path for a bed about to be generated"""
+        bed_id = uuid.uuid4().hex[:12]
+        os.makedirs(self._mood_dir(mood), exist_ok=True)
+        return bed_id, os.path.join(self._mood_dir(mood), f"{bed_id}.wav")
+
+    def add_bed(self, mood: str, bed_id: str, path: str, duration: float, **metadata) -> dict:
+        """Register a generated bed (the sidecar is written last, so half-written beds stay invisible)"""
+        bed = {
+            "id": bed_id,
+            "mood": mood,
+            "path": path,
+            "duration": duration,
+            "created_at": time.time(),
+            **metadata
+        }
+        sidecar = os.path.join(self._mood_dir(mood), f"{bed_id}.json")
+        with open(f"{sidecar}.tmp", "w") as f:
+            json.dump(bed, f)
+        os.replace(f"{sidecar}.tmp", sidecar)
+        return bed
+
+    def remove_bed(self, bed: dict):
+        """Delete a bed and its metadata"""
+        sidecar = os.path.join(self._mood_dir(bed["mood"]), f"{bed['id']}.json")
+        for path in (sidecar, bed["path"]):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def retire_bed(self, bed: dict):
+        """Stop offering a bed; its audio stays until purge_retired() removes it"""
+        mood_dir = self._mood_dir(bed["mood"])
+        marker = os.path.join(mood_dir, f"{bed['id']}.retired")
+        os.replace(os.path.join(mood_dir, f"{bed['id']}.json"), marker)
+        os.utime(marker)  # The grace period runs from retirement
+
+    def purge_retired(self, mood: str, grace_seconds: float) -> int:
+        """
+        Delete beds retired more than grace_seconds ago
+
+        Returns:
+            Number of beds deleted
+        """
+        mood_dir = self._mood_dir(mood)
+        if not os.path.isdir(mood_dir):
+            return 0
+
+        purged = 0
+        for name in os.listdir(mood_dir):
+            if not name.endswith(".retired"):
+                continue
+            marker = os.path.join(mood_dir, name)
+            try:
+                if time.time() - os.path.getmtime(marker) <= grace_seconds:
+                    continue
+                with open(marker) as f:
+                    bed = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for path in (bed.get("path"), marker):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            purged += 1
+        return purged
+
+    def stats(self, moods) -> dict:
+        """Bed count per mood"""
+        return {mood: len(self.list_beds(mood)) for mood in moods}
+
+
+class MusicLibraryWarmer:
+    """Background task that keeps every mood stocked with fresh beds"""
+
+    def __init__(
+        self,
+        library: MusicLibrary,
+        music_service,
+        beds_per_mood: int,
+        bed_seconds: int,
+        refresh_hours: float,
+        interval_seconds: float,
+        retired_grace_hours: float = 6.0
+    ):
+        """
+        Args:
+            library: Library to fill
+            music_service: MusicService used to render beds live
+            beds_per_mood: Beds kept per mood
+            bed_seconds: Length of each bed (the mixer loops it)
+            refresh_hours: Age after which a bed is replaced (0 disables rotation)
+            interval_seconds: Pause between passes over all moods
+            retired_grace_hours: How long a replaced bed's audio is kept for
+                stories that picked it before it was replaced
+        """
+        self.library = library
+        self.music_service = music_service
+        self.beds_per_mood = beds_per_mood
+        self.bed_seconds = bed_seconds
+        self.refresh_hours = refresh_hours
+        self.interval_seconds = interval_seconds
+        self.retired_grace_hours = retired_grace_hours
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        """Start warming in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="music-library-warmer")
+            logger.info(
+                f"Music library warmer started: {self.beds_per_mood} beds/mood, "
+                f"{self.bed_seconds}s each"
+            )
+
+    async def stop(self):
+        """Stop warming (a bed being rendered is discarded)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.warm_once()
+            except Exception as e:
+                logger.error(f"Music library warm pass failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def warm_once(self):
+        """Fill missing beds and replace the oldest stale bed of each mood"""
+        for mood in self.music_service.MOOD_PROMPTS:
+            self.library.purge_retired(mood, self.retired_grace_hours * 3600)
+            beds = self.library.list_beds(mood)
+
+            for _ in range(self.beds_per_mood - len(beds)):
+                await self._render_bed(mood)
+
+            if self.refresh_hours and len(beds) >= self.beds_per_mood:
+                oldest = beds[0]
+                if time.time() - oldest["created_at"] > self.refresh_hours * 3600:
+                    # Render the replacement first so the mood is never empty
+                    if await self._render_bed(mood):
+                        self.library.retire_bed(oldest)
+                        logger.info(f"Rotated music bed {oldest['id']} ({mood})")
+
+    async def _render_bed(self, mood: str) -> bool:
+        """Render one bed live; returns False if Lyria failed"""
+        bed_id, path = self.library.new_bed_path(mood)
+        try:
+            await self.music_service.generate_music(
+                duration=self.bed_seconds,
+                mood=mood,
+                output_path=path
+            )
+        except Exception as e:
+            logger.warning(f"Could not render {mood} music bed: {str(e)}")
+            if os.path.exists(path):
+                os.remove(path)
+            return False
+        except asyncio.CancelledError:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+
+        with wave.open(path, 'rb') as wav_file:
+            duration = wav_file.getnframes() / wav_file.getframerate()
+
+        prompt = self.music_service.MOOD_PROMPTS[mood]
+        self.library.add_bed(
+            mood, bed_id, path, duration,
+            prompt=prompt["primary"], bpm=prompt["bpm"], source="lyria"
+        )
+        logger.info(f"Added {mood} music bed {bed_id} to library")
+        return True
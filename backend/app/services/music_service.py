@@ -2,6 +2,8 @@ import asyncio
 from google import genai
 from google.genai import types
 from app.core.config import settings
+from app.services.lyria_session_pool import LyriaSessionPool
+from app.services.music_library import MusicLibrary
 import logging
 import os
 import wave
@@ -13,6 +15,56 @@ logger = logging.getLogger(__name__)
 class MusicService:
     """Service for generating background music using Google Gemini Lyria RealTime"""
 
+    # Lyria output format: 48 kHz, 16-bit, stereo PCM
+    SAMPLE_RATE = 48000
+    SAMPLE_WIDTH = 2
+    CHANNELS = 2
+    FRAME_BYTES = SAMPLE_WIDTH * CHANNELS
+
+    # Give up if Lyria delivers slower than this multiple of real time (plus grace)
+    CAPTURE_TIMEOUT_FACTOR = 2.0
+    CAPTURE_TIMEOUT_GRACE_SECONDS = 30.0
+
+    # Map story moods to music generation prompts
+    MOOD_PROMPTS = {
+        "calm": {
+            "primary": "peaceful ambient background music, soft piano and strings, gentle flowing melodies",
+            "weight": 1.0,
+            "bpm": 70,
+            "temperature": 0.8
+        },
+        "happy": {
+            "primary": "cheerful upbeat background music, bright acoustic guitar and light percussion, joyful melodies",
+            "weight": 1.0,
+            "bpm": 120,
+            "temperature": 0.9
+        },
+        "dreamy": {
+            "primary": "ethereal magical background music, soft synths and bells, dreamy floating melodies",
+            "weight": 1.0,
+            "bpm": 60,
+            "temperature": 1.0
+        },
+        "playful": {
+            "primary": "playful bouncy background music, xylophone and light drums, fun energetic melodies",
+            "weight": 1.0,
+            "bpm": 130,
+            "temperature": 1.1
+        },
+        "adventure": {
+            "primary": "adventurous epic background music, orchestral strings and brass, heroic uplifting melodies",
+            "weight": 1.0,
+            "bpm": 110,
+            "temperature": 0.9
+        },
+        "bedtime": {
+            "primary": "soothing lullaby background music, soft music box and gentle humming, sleepy calming melodies",
+            "weight": 1.0,
+            "bpm": 50,
+            "temperature": 0.7
+        }
+    }
+
     def __init__(self):
         """Initialize Gemini Lyria client"""
         self.client = genai.Client(
@@ -20,6 +72,16 @@ class MusicService:
             http_options={'api_version': 'v1alpha'}
         )
         self.model = 'models/lyria-realtime-exp'
+        self.library = MusicLibrary(settings.MUSIC_LIBRARY_DIR)
+        self.sessions = LyriaSessionPool(
+            client=self.client,
+            model=self.model,
+            configure=self._configure_mood,
+            max_sessions=settings.LYRIA_MAX_SESSIONS,
+            max_idle=settings.LYRIA_POOL_MAX_IDLE,
+            max_age_seconds=settings.LYRIA_SESSION_MAX_AGE_SECONDS,
+            idle_timeout_seconds=settings.LYRIA_SESSION_IDLE_TIMEOUT_SECONDS
+        )
 
     async def generate_music(
         self,
@@ -41,47 +103,8 @@ class MusicService:
         try:
             logger.info(f"Generating {duration}s background music with mood: {mood}")
 
-            # Map story moods to music generation prompts
-            mood_prompts = {
-                "calm": {
-                    "primary": "peaceful ambient background music, soft piano and strings, gentle flowing melodies",
-                    "weight": 1.0,
-                    "bpm": 70,
-                    "temperature": 0.8
-                },
-                "happy": {
-                    "primary": "cheerful upbeat background music, bright acoustic guitar and light percussion, joyful melodies",
-                    "weight": 1.0,
-                    "bpm": 120,
-                    "temperature": 0.9
-                },
-                "dreamy": {
-                    "primary": "ethereal magical background music, soft synths and bells, dreamy floating melodies",
-                    "weight": 1.0,
-                    "bpm": 60,
-                    "temperature": 1.0
-                },
-                "playful": {
-                    "primary": "playful bouncy background music, xylophone and light drums, fun energetic melodies",
-                    "weight": 1.0,
-                    "bpm": 130,
-                    "temperature": 1.1
-                },
-                "adventure": {
-                    "primary": "adventurous epic background music, orchestral strings and brass, heroic uplifting melodies",
-                    "weight": 1.0,
-                    "bpm": 110,
-                    "temperature": 0.9
-                },
-                "bedtime": {
-                    "primary": "soothing lullaby background music, soft music box and gentle humming, sleepy calming melodies",
-                    "weight": 1.0,
-                    "bpm": 50,
-                    "temperature": 0.7
-                }
-            }
-
-            prompt_config = mood_prompts.get(mood, mood_prompts["calm"])
+            if mood not in self.MOOD_PROMPTS:
+                mood = "calm"
 
             # Set default output path
             if output_path is None:
@@ -89,82 +112,11 @@ class MusicService:
 
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-            # Generate music using Lyria RealTime
-            audio_chunks = []
-
-            async def receive_audio(session, target_duration):
-                """Receive and collect audio chunks until target duration is reached"""
-                try:
-                    start_time = asyncio.get_event_loop().time()
-
-                    async for message in session.receive():
-                        if hasattr(message, 'server_content') and message.server_content:
-                            if hasattr(message.server_content, 'audio_chunks'):
-                                for audio_chunk in message.server_content.audio_chunks:
-                                    if hasattr(audio_chunk, 'data'):
-                                        audio_chunks.append(audio_chunk.data)
-                                        logger.debug(f"Received audio chunk: {len(audio_chunk.data)} bytes")
-
-                        # Check if we've reached target duration (approximate)
-                        elapsed = asyncio.get_event_loop().time() - start_time
-                        if elapsed >= target_duration:
-                            logger.info(f"Target duration reached: {elapsed:.2f}s")
-                            break
-
-                except Exception as e:
-                    logger.error(f"Error receiving audio: {str(e)}")
-
-            # Connect to Lyria RealTime and generate music
-            async with (
-                self.client.aio.live.music.connect(model=self.model) as session,
-                asyncio.TaskGroup() as tg,
-            ):
-                # Set up task to receive audio chunks
-                receive_task = tg.create_task(receive_audio(session, duration))
-
-                # Configure music generation
-                await session.set_weighted_prompts(
-                    prompts=[
-                        types.WeightedPrompt(
-                            text=prompt_config["primary"],
-                            weight=prompt_config["weight"]
-                        ),
-                    ]
-                )
-
-                await session.set_music_generation_config(
-                    config=types.LiveMusicGenerationConfig(
-                        bpm=prompt_config["bpm"],
-                        temperature=prompt_config["temperature"]
-                    )
-                )
-
-                # Start streaming music
-                await session.play()
-
-                # Wait for audio collection to complete
-                logger.info("Collecting audio chunks...")
-                await receive_task
-
-            # Save collected audio chunks to WAV file
-            if not audio_chunks:
-                raise Exception("No audio data received from Lyria")
-
-            logger.info(f"Collected {len(audio_chunks)} audio chunks, saving to {output_path}")
-
-            # Combine all audio chunks
-            combined_audio = b''.join(audio_chunks)
-
-            # Save as WAV file (Lyria outputs PCM audio at 48kHz, 16-bit, stereo)
-            sample_rate = 48000  # Lyria's output sample rate
-            sample_width = 2     # 16-bit audio = 2 bytes
-            channels = 2         # Stereo
-
-            with wave.open(output_path, 'wb') as wav_file:
-                wav_file.setnchannels(channels)
-                wav_file.setsampwidth(sample_width)
-                wav_file.setframerate(sample_rate)
-                wav_file.writeframes(combined_audio)
+            # Lease a playing Lyria RealTime session (reused from the pool when possible)
+            async with self.sessions.session(mood) as session:
+                # Stream audio into the WAV file until exactly `duration` seconds are captured
+                logger.info("Capturing audio...")
+                await self.capture_audio(session, duration, output_path)
 
             logger.info(f"Music generated and saved: {output_path}")
             return output_path
@@ -173,6 +125,102 @@ class MusicService:
             logger.error(f"Error generating music: {str(e)}")
             raise Exception(f"Failed to generate music: {str(e)}")
 
+    async def _configure_mood(self, session, mood: str):
+        """Point a Lyria session at a mood's prompt and config"""
+        await self._configure_session(session, self.MOOD_PROMPTS[mood])
+
+    async def _configure_session(self, session, prompt_config: dict):
+        """Set the prompt and generation config on a Lyria session"""
+        await session.set_weighted_prompts(
+            prompts=[
+                types.WeightedPrompt(
+                    text=prompt_config["primary"],
+                    weight=prompt_config["weight"]
+                ),
+            ]
+        )
+
+        await session.set_music_generation_config(
+            config=types.LiveMusicGenerationConfig(
+                bpm=prompt_config["bpm"],
+                temperature=prompt_config["temperature"]
+            )
+        )
+
+    async def capture_audio(self, session, duration: float, output_path: str) -> int:
+        """
+        Stream Lyria audio into a WAV file until exactly `duration` seconds are written
+
+        Length is counted in PCM frames rather than wall-clock time, so the
+        file is sample-accurate and capture ends as soon as enough audio has
+        arrived, even if Lyria streams faster than real time. Chunks are
+        written as they arrive (no in-memory buffer) to `<output_path>.part`,
+        which is renamed into place when complete.
+
+        Args:
+            session: A playing Lyria RealTime session (or PooledSession)
+            duration: Seconds of audio to capture
+            output_path: Where to save the WAV file
+
+        Returns:
+            Number of frames written
+
+        Raises:
+            Exception: If Lyria sends no audio or stalls past the capture deadline
+        """
+        target_bytes = int(duration * self.SAMPLE_RATE) * self.FRAME_BYTES
+        deadline = duration * self.CAPTURE_TIMEOUT_FACTOR + self.CAPTURE_TIMEOUT_GRACE_SECONDS
+        partial_path = f"{output_path}.part"
+        written = 0
+
+        async def receive(wav_file):
+            nonlocal written
+            async for message in session.receive():
+                server_content = getattr(message, 'server_content', None)
+                for audio_chunk in getattr(server_content, 'audio_chunks', None) or []:
+                    data = getattr(audio_chunk, 'data', None)
+                    if not data:
+                        continue
+                    data = data[:target_bytes - written]
+                    wav_file.writeframesraw(data)
+                    written += len(data)
+                    if written >= target_bytes:
+                        return
+
+        try:
+            with wave.open(partial_path, 'wb') as wav_file:
+                wav_file.setnchannels(self.CHANNELS)
+                wav_file.setsampwidth(self.SAMPLE_WIDTH)
+                wav_file.setframerate(self.SAMPLE_RATE)
+
+                # wait_for rather than asyncio.timeout(), which needs Python 3.11
+                await asyncio.wait_for(receive(wav_file), timeout=deadline)
+
+            if written == 0:
+                raise Exception("No audio data received from Lyria")
+            if written < target_bytes:
+                # Stream ended early: keep what arrived, the mixer loops it
+                logger.warning(f"Lyria stream ended after {written / self.FRAME_BYTES / self.SAMPLE_RATE:.2f}s of {duration}s")
+
+            os.replace(partial_path, output_path)
+
+        except asyncio.TimeoutError:
+            raise Exception(f"Lyria did not deliver {duration}s of audio within {deadline:.0f}s")
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        frames = written // self.FRAME_BYTES
+        logger.info(f"Captured {frames} frames ({frames / self.SAMPLE_RATE:.2f}s) to {output_path}")
+        return frames
+
+    async def aclose(self):
+        """Close pooled Lyria sessions and the Gemini client's connections"""
+        await self.sessions.aclose()
+        aclose = getattr(self.client.aio, "aclose", None)
+        if aclose:
+            await aclose()
+
     def get_story_mood(self, story_text: str) -> str:
         """
         Analyze story text to determine appropriate mood for music
@@ -201,22 +249,22 @@ class MusicService:
 
     async def get_royalty_free_music(self, duration: int, mood: str = "calm") -> str:
         """
-        Fallback method using royalty-free music library
-        (In case Lyria is not available)
+        Pick a pre-rendered bed from the music library
+        (In case Lyria is not available or should not be waited for)
 
         Args:
-            duration: Duration needed
+            duration: Duration needed (the mixer loops the bed to fit)
             mood: Mood/style
 
         Returns:
-            Path to music file from library
-        """
-        # This would return a path to pre-selected royalty-free music
-        # For now, we'll just return a placeholder
-        logger.warning("Using fallback royalty-free music (Lyria not available)")
+            Path to a music file from the library
 
-        # In production, this would select from a curated library
-        music_library_path = os.path.join(settings.STORIES_DIR, "music_library")
-        os.makedirs(music_library_path, exist_ok=True)
+        Raises:
+            Exception: If the library has no bed for this mood yet
+        """
+        bed = self.library.pick_bed(mood)
+        if bed is None:
+            raise Exception(f"No '{mood}' music in the library yet")
 
-        return os.path.join(music_library_path, f"default_{mood}.mp3")
+        logger.info(f"Using library music bed {bed['id']} ({mood}, {bed['duration']:.0f}s) for {duration}s story")
+        return bed["path"]
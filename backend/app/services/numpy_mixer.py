@@ -0,0 +1,193 @@
+"""
+NumPy mixing engine
+
+Decodes narration and music once into float32 buffers and does looping,
+gain, fades, summing and peak normalization in place, instead of pydub's
+one-full-length-copy-per-step pipeline.
+"""
+
+import logging
+import wave
+from pydub import AudioSegment
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# pydub.effects.normalize leaves 0.1 dB of headroom; match it
+NORMALIZE_HEADROOM_DB = 0.1
+
+RESAMPLE_BLOCK_FRAMES = 1 << 16
+
+
+def load_pcm(path: str) -> tuple["np.ndarray", int]:
+    """
+    Decode an audio file to float32 samples in [-1, 1]
+
+    16-bit WAV files are read straight from disk; anything else goes
+    through pydub (ffmpeg) once.
+
+    Returns:
+        Tuple of (samples shaped (frames, channels), sample_rate)
+    """
+    try:
+        with wave.open(path, 'rb') as wav_file:
+            if wav_file.getsampwidth() == 2 and wav_file.getcomptype() == "NONE":
+                channels = wav_file.getnchannels()
+                rate = wav_file.getframerate()
+                raw = wav_file.readframes(wav_file.getnframes())
+                samples = np.frombuffer(raw, dtype="<i2").reshape(-1, channels)
+                return _to_float(samples), rate
+    except (wave.Error, EOFError):
+        pass
+
+    segment = AudioSegment.from_file(path)
+    if segment.sample_width != 2:
+        segment = segment.set_sample_width(2)
+    samples = np.frombuffer(segment.raw_data, dtype="<i2").reshape(-1, segment.channels)
+    return _to_float(samples), segment.frame_rate
+
+
+def _to_float(samples: "np.ndarray") -> "np.ndarray":
+    out = samples.astype(np.float32)
+    out *= 1.0 / 32768.0
+    return out
+
+
+def resample(samples: "np.ndarray", source_rate: int, target_rate: int) -> "np.ndarray":
+    """Linear-interpolation resample, in blocks to keep index arrays small"""
+    if source_rate == target_rate:
+        return samples
+
+    frames = int(len(samples) * target_rate / source_rate)
+    step = source_rate / target_rate
+    out = np.empty((frames, samples.shape[1]), dtype=np.float32)
+    last = len(samples) - 1
+
+    for start in range(0, frames, RESAMPLE_BLOCK_FRAMES):
+        stop = min(start + RESAMPLE_BLOCK_FRAMES, frames)
+        positions = np.arange(start, stop, dtype=np.float64) * step
+        left = positions.astype(np.int64)
+        right = np.minimum(left + 1, last)
+        fraction = (positions - left).astype(np.float32)[:, None]
+
+        block = out[start:stop]
+        np.subtract(samples[right], samples[left], out=block)
+        block *= fraction
+        block += samples[left]
+
+    return out
+
+
+def fit_to_length(music: "np.ndarray", frames: int, crossfade_frames: int) -> "np.ndarray":
+    """
+    Loop (with crossfaded seams) or trim music to exactly `frames` frames
+
+    Empty music (a truncated capture or library file) gives silence.
+
+    Returns:
+        A new buffer the caller may modify in place
+    """
+    out = np.empty((frames, music.shape[1]), dtype=np.float32)
+    if len(music) == 0:
+        out.fill(0.0)
+        return out
+    if len(music) >= frames:
+        out[:] = music[:frames]
+        return out
+
+    crossfade_frames = min(crossfade_frames, len(music) // 2)
+    if crossfade_frames:
+        ramp = np.linspace(0.0, 1.0, crossfade_frames, dtype=np.float32)[:, None]
+        # Head of the bed as it sounds right after a seam
+        faded_head = music[:crossfade_frames] * ramp
+        fade_out = 1.0 - ramp
+
+    out[:len(music)] = music
+    position = len(music)
+    while position < frames:
+        seam = position - crossfade_frames
+        if crossfade_frames:
+            out[seam:position] *= fade_out
+            out[seam:position] += faded_head[:min(crossfade_frames, frames - seam)]
+        remaining = min(len(music) - crossfade_frames, frames - position)
+        out[position:position + remaining] = music[crossfade_frames:crossfade_frames + remaining]
+        position += remaining
+
+    return out
+
+
+def apply_fades(samples: "np.ndarray", rate: int, fade_in_ms: int, fade_out_ms: int):
+    """Linear fade in/out, in place"""
+    fade_in = min(len(samples), int(rate * fade_in_ms / 1000))
+    if fade_in:
+        samples[:fade_in] *= np.linspace(0.0, 1.0, fade_in, dtype=np.float32)[:, None]
+
+    fade_out = min(len(samples), int(rate * fade_out_ms / 1000))
+    if fade_out:
+        samples[-fade_out:] *= np.linspace(1.0, 0.0, fade_out, dtype=np.float32)[:, None]
+
+
+def normalize_peak(samples: "np.ndarray", headroom_db: float = NORMALIZE_HEADROOM_DB):
+    """Scale so the loudest sample sits `headroom_db` below full scale, in place"""
+    # max/min instead of abs() avoids a full-length temporary
+    peak = max(float(samples.max()), -float(samples.min())) if len(samples) else 0.0
+    if peak > 0:
+        samples *= (10 ** (-headroom_db / 20)) / peak
+
+
+def to_segment(samples: "np.ndarray", rate: int) -> AudioSegment:
+    """Quantize float samples to a 16-bit AudioSegment for export"""
+    np.clip(samples, -1.0, 32767 / 32768, out=samples)
+    samples *= 32768.0
+    np.rint(samples, out=samples)
+    pcm = samples.astype("<i2")
+    return AudioSegment(
+        data=pcm.tobytes(),
+        sample_width=2,
+        frame_rate=rate,
+        channels=pcm.shape[1]
+    )
+
+
+def render_mix(
+    narration_path: str,
+    music_path: str,
+    music_gain_db: float,
+    crossfade_ms: int,
+    fade_in_ms: int,
+    fade_out_ms: int
+) -> tuple[AudioSegment, float]:
+    """
+    Mix narration over background music
+
+    The output keeps the narration's sample rate (music is resampled once
+    to match) and the larger channel count of the two inputs.
+
+    Returns:
+        Tuple of (mixed AudioSegment, narration duration in seconds)
+    """
+    narration, rate = load_pcm(narration_path)
+    music, music_rate = load_pcm(music_path)
+    music = resample(music, music_rate, rate)
+    if len(music) == 0:
+        logger.warning(f"Music file {music_path} has no audio, mixing narration only")
+
+    frames = len(narration)
+    mixed = fit_to_length(music, frames, int(rate * crossfade_ms / 1000))
+    del music
+
+    mixed *= 10 ** (music_gain_db / 20)
+    apply_fades(mixed, rate, fade_in_ms, fade_out_ms)
+
+    if mixed.shape[1] < narration.shape[1]:
+        mixed = np.repeat(mixed, narration.shape[1], axis=1)
+    # Mono narration broadcasts across the music's channels
+    mixed += narration
+    del narration
+
+    normalize_peak(mixed)
+    return to_segment(mixed, rate), frames / rate
@@ -0,0 +1,364 @@
+"""
+Audio renditions of a finished story
+
+The final mix is encoded into every configured format by a single ffmpeg
+run: the mixed PCM is decoded (or piped in) once and fed to all encoders,
+which ffmpeg runs side by side. MP3 is always produced and stays the
+story's primary file; AAC and Opus are smaller alternatives for clients on
+slow connections. serve_audio picks one with negotiate().
+
+Listing "hls" in AUDIO_RENDITIONS adds an HLS rendition to the same run:
+an AAC playlist cut into HLS_SEGMENT_SECONDS segments (fMP4 or MPEG-TS) in
+a directory named after the MP3, sharded under STORIES_DIR/hls. The
+playlist is written as an EVENT playlist, so players can start on the
+first segments while the rest are encoded.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+from functools import lru_cache
+from pydub import AudioSegment
+from app.core.config import settings
+from app.utils.sharding import shard_path
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_FORMAT = "mp3"
+
+RENDITION_PROFILES = {
+    "mp3": {
+        "extension": ".mp3",
+        "media_type": "audio/mpeg",
+        "encoder": ["-c:a", "libmp3lame", "-q:a", "2"],
+        "muxer": ["-f", "mp3"]
+    },
+    "aac": {
+        "extension": ".m4a",
+        "media_type": "audio/mp4",
+        "encoder": ["-c:a", "aac"],
+        # moov atom up front so playback can start before the download ends
+        "muxer": ["-movflags", "+faststart", "-f", "ipod"]
+    },
+    "opus": {
+        "extension": ".opus",
+        "media_type": "audio/ogg; codecs=opus",
+        # Opus only runs at 48 kHz (and lower multiples)
+        "encoder": ["-c:a", "libopus", "-application", "audio", "-ar", "48000"],
+        "muxer": ["-f", "ogg"]
+    },
+    "hls": {
+        # A directory of segments named after the MP3, entered through its playlist
+        "extension": "_hls/index.m3u8",
+        "media_type": "application/vnd.apple.mpegurl",
+        "encoder": ["-c:a", "aac"],
+        "muxer": None,  # Depends on the output directory, see _hls_muxer
+        "segmented": True
+    }
+}
+
+HLS_PLAYLIST = "index.m3u8"
+HLS_INIT_SEGMENT = "init.mp4"
+HLS_DIR_SUFFIX = "_hls"
+
+# Content types of the files in an HLS rendition directory
+HLS_MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".mp4": "audio/mp4",
+    ".m4s": "audio/mp4",
+    ".ts": "video/mp2t"
+}
+
+# Media types clients may ask for in Accept, per rendition
+ACCEPT_MEDIA_TYPES = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/mp4": "aac",
+    "audio/aac": "aac",
+    "audio/x-m4a": "aac",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+}
+
+
+def _bitrate(audio_format: str) -> str:
+    return {
+        "mp3": settings.AUDIO_BITRATE,
+        "aac": settings.AUDIO_AAC_BITRATE,
+        "opus": settings.AUDIO_OPUS_BITRATE,
+        "hls": settings.AUDIO_AAC_BITRATE
+    }[audio_format]
+
+
+def _hls_muxer(playlist_path: str) -> list[str]:
+    """HLS muxer options writing segments next to the playlist"""
+    segment_dir = os.path.dirname(playlist_path)
+    # ffmpeg does not create the segment directory itself
+    os.makedirs(segment_dir, exist_ok=True)
+
+    if settings.HLS_SEGMENT_TYPE == "mpegts":
+        segment_args = ["-hls_segment_type", "mpegts"]
+        segment_name = "segment_%05d.ts"
+    else:
+        segment_args = ["-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", HLS_INIT_SEGMENT]
+        segment_name = "segment_%05d.m4s"
+
+    return [
+        "-f", "hls",
+        "-hls_time", str(settings.HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "event",
+        "-hls_flags", "independent_segments",
+        *segment_args,
+        "-hls_segment_filename", os.path.join(segment_dir, segment_name)
+    ]
+
+
+def hls_directory(stories_dir: str, rendition: str) -> str:
+    """Sharded location of an HLS rendition directory (STORIES_DIR/hls/ab/cd/<rendition>)"""
+    return shard_path(os.path.join(stories_dir, "hls"), rendition)
+
+
+@lru_cache(maxsize=1)
+def available_encoders() -> frozenset[str] | None:
+    """Audio encoders the ffmpeg build supports, or None if it cannot be asked"""
+    try:
+        result = subprocess.run(
+            [AudioSegment.converter, "-hide_banner", "-encoders"],
+            stdin=subprocess.DEVNULL, capture_output=True, timeout=10
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+
+    # Lines after the "------" separator read " A....D libopus   description"
+    listing = result.stdout.decode(errors="replace").split(" ------", 1)[-1]
+    return frozenset(
+        fields[1] for fields in (line.split() for line in listing.splitlines())
+        if len(fields) > 1 and fields[0].startswith("A")
+    )
+
+
+def _encoder(audio_format: str) -> str:
+    encoder = RENDITION_PROFILES[audio_format]["encoder"]
+    return encoder[encoder.index("-c:a") + 1]
+
+
+def configured_formats() -> list[str]:
+    """
+    Formats listed in AUDIO_RENDITIONS, primary first
+
+    Unknown names are skipped, and so are the optional formats whose encoder
+    this ffmpeg build lacks: a missing libopus costs that rendition, not
+    the story.
+    """
+    encoders = available_encoders()
+    formats = [PRIMARY_FORMAT]
+    for name in settings.AUDIO_RENDITIONS.split(","):
+        name = name.strip().lower()
+        if not name or name in formats:
+            continue
+        if name not in RENDITION_PROFILES:
+            logger.warning(f"Unknown audio rendition '{name}' in AUDIO_RENDITIONS, skipping")
+            continue
+        if encoders is not None and _encoder(name) not in encoders:
+            logger.warning(f"ffmpeg has no {_encoder(name)} encoder, skipping the '{name}' rendition")
+            continue
+        formats.append(name)
+    return formats
+
+
+def rendition_paths(output_path: str, formats: list[str] | None = None) -> dict[str, str]:
+    """
+    Output file for each rendition
+
+    The primary rendition is written to output_path itself; the others
+    share its base name with their own extension. Segmented renditions get
+    a sharded directory of that name instead.
+    """
+    base, _ = os.path.splitext(output_path)
+    paths = {}
+    for audio_format in formats or configured_formats():
+        if audio_format == PRIMARY_FORMAT:
+            paths[audio_format] = output_path
+        elif RENDITION_PROFILES[audio_format].get("segmented"):
+            rendition = os.path.basename(base) + HLS_DIR_SUFFIX
+            paths[audio_format] = os.path.join(hls_directory(os.path.dirname(output_path), rendition), HLS_PLAYLIST)
+        else:
+            paths[audio_format] = base + RENDITION_PROFILES[audio_format]["extension"]
+    return paths
+
+
+def output_args(paths: dict[str, str], labels: list[str] | None = None) -> list[str]:
+    """
+    ffmpeg output options writing one file per rendition
+
+    Args:
+        paths: Rendition format -> output file
+        labels: Filter graph output pad to map for each rendition (None maps
+            the only input)
+    """
+    args = []
+    for i, (audio_format, path) in enumerate(paths.items()):
+        profile = RENDITION_PROFILES[audio_format]
+        if labels:
+            args += ["-map", labels[i]]
+        muxer = profile["muxer"] if profile["muxer"] is not None else _hls_muxer(path)
+        args += profile["encoder"] + ["-b:a", _bitrate(audio_format)] + muxer + [path]
+    return args
+
+
+def split_outputs(graph: str, output_pad: str, count: int) -> tuple[str, list[str]]:
+    """
+    Split a filter graph's output pad so each rendition can map its own copy
+
+    Returns:
+        Tuple of (filter graph, output labels)
+    """
+    if count == 1:
+        return graph, [f"[{output_pad}]"]
+    labels = [f"[{output_pad}{i}]" for i in range(count)]
+    return f"{graph};[{output_pad}]asplit={count}{''.join(labels)}", labels
+
+
+def _run_encoder(command: list[str], pcm: bytes | None = None):
+    result = subprocess.run(
+        command,
+        input=pcm,
+        stdin=None if pcm is not None else subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg encode failed: {result.stderr.decode(errors='replace').strip()}")
+
+
+def encode_segment(segment: AudioSegment, output_path: str) -> dict[str, str]:
+    """
+    Encode a decoded mix into every configured rendition
+
+    Returns:
+        Rendition format -> file path
+    """
+    paths = rendition_paths(output_path)
+    _run_encoder(
+        [AudioSegment.converter, "-y", "-loglevel", "error",
+         "-f", f"s{segment.sample_width * 8}le", "-ar", str(segment.frame_rate),
+         "-ac", str(segment.channels), "-i", "pipe:0"] + output_args(paths),
+        pcm=segment.raw_data
+    )
+    return paths
+
+
+def encode_file(source_path: str, output_path: str) -> dict[str, str]:
+    """
+    Encode an existing audio file into every configured rendition
+
+    Returns:
+        Rendition format -> file path
+    """
+    paths = rendition_paths(output_path)
+    _run_encoder(
+        [AudioSegment.converter, "-y", "-loglevel", "error", "-nostdin",
+         "-i", source_path] + output_args(paths)
+    )
+    return paths
+
+
+def negotiate(accept: str | None, available: dict[str, str], requested: str | None = None) -> str | None:
+    """
+    Pick the rendition to serve
+
+    An explicit format (query parameter) wins if that rendition exists;
+    otherwise the Accept header's media types are tried by q-value, with
+    ties broken by rendition size (Opus, then AAC, then MP3).
+
+    Args:
+        accept: Accept header value
+        available: Rendition format -> file path of what exists for the story
+        requested: Format named by the client (e.g. ?format=opus)
+
+    Returns:
+        Rendition format, or None to fall back to the primary file
+    """
+    if requested:
+        requested = requested.lower()
+        return requested if requested in available else None
+
+    if not accept:
+        return None
+
+    preference = ("opus", "aac", "mp3")
+    candidates = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality <= 0:
+            continue
+
+        media_type = media_type.lower()
+        if media_type == "*/*":
+            # Clients that don't name a type get the universally playable MP3
+            formats = [PRIMARY_FORMAT]
+        elif media_type == "audio/*":
+            formats = list(preference)
+        else:
+            audio_format = ACCEPT_MEDIA_TYPES.get(media_type)
+            formats = [audio_format] if audio_format else []
+
+        for audio_format in formats:
+            if audio_format in available:
+                candidates.append((-quality, preference.index(audio_format), position, audio_format))
+
+    if not candidates:
+        return None
+    return min(candidates)[3]
+
+
+def available_renditions(primary_path: str) -> dict[str, str]:
+    """
+    Single-file renditions of a primary file that exist on disk (format -> path)
+
+    HLS is left out: it is served through its own playlist routes.
+    """
+    formats = [name for name, profile in RENDITION_PROFILES.items() if not profile.get("segmented")]
+    return {
+        audio_format: path
+        for audio_format, path in rendition_paths(primary_path, formats).items()
+        if os.path.exists(path)
+    }
+
+
+def single_file_renditions(renditions: dict[str, str]) -> dict[str, str]:
+    """The renditions that are one file each (everything but HLS)"""
+    return {
+        audio_format: path
+        for audio_format, path in renditions.items()
+        if not RENDITION_PROFILES.get(audio_format, {}).get("segmented")
+    }
+
+
+def delete_renditions(renditions: dict[str, str]):
+    """Remove rendition files (and HLS segment directories) from disk"""
+    for audio_format, path in renditions.items():
+        if RENDITION_PROFILES.get(audio_format, {}).get("segmented"):
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def media_type_for(path: str) -> str:
+    """Content type of a rendition file, by extension"""
+    extension = os.path.splitext(path)[1].lower()
+    for profile in RENDITION_PROFILES.values():
+        if profile["extension"] == extension:
+            return profile["media_type"]
+    return RENDITION_PROFILES[PRIMARY_FORMAT]["media_type"]
@@ -0,0 +1,269 @@
+"""
+Storage backends for finished audio
+
+Generation always works on local files (TTS, Lyria capture, the mixers and
+ffmpeg need paths), but where finished audio lives is pluggable:
+
+- "local" keeps blobs in BLOB_STORE_DIR, as before. It is an identity
+  backend: a blob's key is its path under the store.
+- "s3" uploads blobs (and HLS directories) to an S3-compatible bucket (AWS,
+  MinIO, ...) with multipart transfers streamed from disk. BLOB_STORE_DIR
+  then becomes a bounded read-through cache, and serve_audio can redirect
+  players to presigned URLs. Any API or worker node can serve any story.
+
+boto3 is only needed for the S3 backend.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from app.core.config import settings
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+    BOTO3_AVAILABLE = True
+except ImportError:
+    BOTO3_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class StorageBackend(ABC):
+    """Stores objects by key; keys are relative paths using '/'"""
+
+    # Whether objects live somewhere other than this node's disk
+    remote = False
+
+    @abstractmethod
+    def upload(self, local_path: str, key: str, content_type: str | None = None):
+        """Store a local file under key"""
+
+    @abstractmethod
+    def download(self, key: str, local_path: str):
+        """Write the object at key to local_path (atomically)"""
+
+    @abstractmethod
+    def copy(self, source_key: str, key: str):
+        """Copy an object within the backend"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether an object is stored under key"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove an object (missing objects are ignored)"""
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str):
+        """Remove every object whose key starts with prefix"""
+
+    def url_for(
+        self,
+        key: str,
+        content_type: str | None = None,
+        download_name: str | None = None
+    ) -> str | None:
+        """Time-limited URL clients can fetch the object from (None if unsupported)"""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    """Objects are files under a root directory on this node"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def upload(self, local_path: str, key: str, content_type: str | None = None):
+        target = self.path_for(key)
+        if os.path.abspath(local_path) == os.path.abspath(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(local_path, target)
+
+    def download(self, key: str, local_path: str):
+        source = self.path_for(key)
+        if os.path.abspath(source) == os.path.abspath(local_path):
+            return
+        if not os.path.exists(source):
+            raise FileNotFoundError(key)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        shutil.copyfile(source, local_path)
+
+    def copy(self, source_key: str, key: str):
+        target = self.path_for(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(self.path_for(source_key), target)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self.path_for(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix: str):
+        path = self.path_for(prefix.rstrip("/"))
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class S3Storage(StorageBackend):
+    """Objects in an S3-compatible bucket"""
+
+    remote = True
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: str | None = None,
+        region: str | None = None,
+        access_key_id: str | None = None,
+        secret_access_key: str | None = None,
+        multipart_threshold_mb: int = 8,
+        multipart_chunk_mb: int = 8,
+        max_concurrency: int = 4,
+        presign_expires_seconds: int = 3600,
+        client=None
+    ):
+        """
+        Args:
+            bucket: Bucket name
+            prefix: Key prefix for everything this app stores
+            endpoint_url: Custom endpoint (MinIO, moto server, ...)
+            region: Bucket region
+            access_key_id: Credentials (None uses boto3's default chain)
+            secret_access_key: Credentials
+            multipart_threshold_mb: Files at least this large upload in parts
+            multipart_chunk_mb: Size of each part
+            max_concurrency: Parts transferred in parallel
+            presign_expires_seconds: Lifetime of presigned URLs
+            client: Ready-made boto3 S3 client (tests)
+        """
+        if not BOTO3_AVAILABLE:
+            raise Exception("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.presign_expires_seconds = presign_expires_seconds
+        self.client = client or boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key_id or None,
+            aws_secret_access_key=secret_access_key or None,
+            # Path-style addressing works with MinIO and other self-hosted stores
+            config=BotoConfig(s3={"addressing_style": "path" if endpoint_url else "auto"})
+        )
+        # upload_file reads the file part by part, so large renditions are
+        # never held in memory
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold_mb * 1024 * 1024,
+            multipart_chunksize=multipart_chunk_mb * 1024 * 1024,
+            max_concurrency=max_concurrency
+        )
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def upload(self, local_path: str, key: str, content_type: str | None = None):
+        extra_args = {}
+        if content_type:
+            extra_args["ContentType"] = content_type
+        self.client.upload_file(
+            local_path, self.bucket, self._key(key),
+            ExtraArgs=extra_args or None,
+            Config=self.transfer_config
+        )
+
+    def download(self, key: str, local_path: str):
+        directory = os.path.dirname(local_path)
+        os.makedirs(directory, exist_ok=True)
+        # Download beside the target and rename, so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._key(key), temp_path, Config=self.transfer_config)
+            os.replace(temp_path, local_path)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(key) from e
+            raise
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def copy(self, source_key: str, key: str):
+        # Server-side copy (multipart for large objects); nothing passes through this node
+        self.client.copy(
+            {"Bucket": self.bucket, "Key": self._key(source_key)}, self.bucket, self._key(key),
+            Config=self.transfer_config
+        )
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_prefix(self, prefix: str):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if objects:
+                self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True})
+
+    def url_for(
+        self,
+        key: str,
+        content_type: str | None = None,
+        download_name: str | None = None
+    ) -> str | None:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if content_type:
+            params["ResponseContentType"] = content_type
+        if download_name:
+            params["ResponseContentDisposition"] = f'attachment; filename="{download_name}"'
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=self.presign_expires_seconds
+        )
+
+
+def create_storage() -> StorageBackend:
+    """Backend selected by STORAGE_BACKEND"""
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage(
+            bucket=settings.STORAGE_S3_BUCKET,
+            prefix=settings.STORAGE_S3_PREFIX,
+            endpoint_url=settings.STORAGE_S3_ENDPOINT_URL,
+            region=settings.STORAGE_S3_REGION,
+            access_key_id=settings.STORAGE_S3_ACCESS_KEY_ID,
+            secret_access_key=settings.STORAGE_S3_SECRET_ACCESS_KEY,
+            multipart_threshold_mb=settings.STORAGE_MULTIPART_THRESHOLD_MB,
+            multipart_chunk_mb=settings.STORAGE_MULTIPART_CHUNK_MB,
+            max_concurrency=settings.STORAGE_MAX_CONCURRENCY,
+            presign_expires_seconds=settings.STORAGE_PRESIGN_EXPIRES_SECONDS
+        )
+    if settings.STORAGE_BACKEND != "local":
+        logger.warning(f"Unknown STORAGE_BACKEND '{settings.STORAGE_BACKEND}', using local storage")
+    return LocalStorage(settings.BLOB_STORE_DIR)
+
+
+# Global backend used by the blob store and the audio routes
+storage = create_storage()
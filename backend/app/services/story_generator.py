@@ -1,9 +1,61 @@
 import google.generativeai as genai
+from pydantic import BaseModel, Field, ValidationError, field_validator
 from app.core.config import settings
+from app.services.music_service import MusicService
+from app.services.tts_service import TTSService
+from typing import AsyncIterator, Optional
+import json
 import logging
+import re
 
 logger = logging.getLogger(__name__)
 
+# Length of stories.story_title
+TITLE_MAX_LENGTH = 200
+
+# A JSON string field, possibly cut off before its closing quote
+PARTIAL_JSON_FIELD = r'"{}"\s*:\s*"((?:[^"\\]|\\.)*)(")?'
+
+
+class GeneratedStory(BaseModel):
+    """Structured story returned by the model in a single request"""
+    title: str = Field(..., min_length=1, max_length=TITLE_MAX_LENGTH)
+    story: str = Field(..., min_length=1)
+    mood: Optional[str] = None
+    emotion: Optional[str] = None
+
+    @field_validator("title", "story", mode="before")
+    @classmethod
+    def strip_text(cls, v):
+        """Trim whitespace and stray quotes"""
+        if isinstance(v, str):
+            return v.strip().strip('"').strip()
+        return v
+
+    @field_validator("title", mode="before")
+    @classmethod
+    def shorten_title(cls, v):
+        """Cut an over-long title to fit the column instead of rejecting the story"""
+        if isinstance(v, str) and len(v) > TITLE_MAX_LENGTH:
+            return v[:TITLE_MAX_LENGTH].rsplit(" ", 1)[0].rstrip(" ,;:-") or v[:TITLE_MAX_LENGTH]
+        return v
+
+    @field_validator("mood", mode="before")
+    @classmethod
+    def known_mood(cls, v):
+        """Drop moods the music service has no prompt for"""
+        if isinstance(v, str) and v.strip().lower() in MusicService.MOOD_PROMPTS:
+            return v.strip().lower()
+        return None
+
+    @field_validator("emotion", mode="before")
+    @classmethod
+    def known_emotion(cls, v):
+        """Drop emotions the TTS service does not use"""
+        if isinstance(v, str) and v.strip().lower() in TTSService.EMOTIONS:
+            return v.strip().lower()
+        return None
+
 
 class StoryGeneratorService:
     """Service for generating children's stories using Gemini AI"""
@@ -17,9 +69,15 @@ class StoryGeneratorService:
         self,
         theme: str,
         character_name: str | None,
-        age_group: str
+        age_group: str,
+        structured: bool = True
     ) -> str:
-        """Create optimized prompt for story generation based on research"""
+        """
+        Create optimized prompt for story generation based on research
+
+        With structured=True the model is asked for a JSON object holding the
+        title, story text and mood/emotion hints; otherwise for plain story text.
+        """
 
         # Age-specific adjustments
         age_config = {
@@ -65,6 +123,20 @@ Style Guidelines:
 - Keep the tone warm, gentle, and engaging
 - Make it suitable for reading aloud as bedtime stories
 
+"""
+        if structured:
+            moods = ", ".join(MusicService.MOOD_PROMPTS)
+            emotions = ", ".join(TTSService.EMOTIONS)
+            prompt += f"""
+Format:
+Respond with ONLY a JSON object (no markdown, no code fences) with these keys:
+- "title": a short, catchy title (max 10 words)
+- "story": the story text, paragraphs separated by blank lines, without the title
+- "mood": the background music mood that fits best, one of: {moods}
+- "emotion": the narrator's voice emotion that fits best, one of: {emotions}
+"""
+        else:
+            prompt += """
 Format:
 Provide ONLY the story text, without any title, metadata, or formatting markers.
 Start directly with the story narrative.
@@ -86,7 +158,8 @@ Start directly with the story narrative.
             age_group: Target age group (3-5, 5-7, 7-10)
 
         Returns:
-            dict with story_text, title, and word_count
+            dict with story_text, story_title, word_count and the model's
+            mood/emotion hints (None when it gave no usable hint)
         """
         try:
             logger.info(f"Generating story with theme: {theme}, age_group: {age_group}")
@@ -94,14 +167,30 @@ Start directly with the story narrative.
             # Create optimized prompt
             prompt = self.create_story_prompt(theme, character_name, age_group)
 
-            # Generate story
-            response = self.model.generate_content(prompt)
-            story_text = response.text.strip()
+            # One request returns title, story and hints (async API, so the
+            # event loop keeps serving requests)
+            response = await self.model.generate_content_async(prompt)
+            generated = self.parse_story_response(response.text)
+
+            if generated is None:
+                # Usually JSON cut off at the output token limit; a second
+                # sample is likely to be complete
+                logger.warning("Model returned malformed story JSON, retrying once")
+                response = await self.model.generate_content_async(prompt)
+                generated = self.parse_story_response(response.text)
+
+            if generated is None:
+                generated = self.salvage_story_response(response.text)
+                if generated is not None:
+                    logger.warning("Model returned malformed story JSON again, using the fields it contained")
+
+            if generated is None:
+                # Not JSON at all: treat the reply as plain story text
+                logger.warning("Model returned no story JSON, falling back to plain text")
+                generated = await self.parse_plain_story(response.text)
 
-            # Generate title separately
-            title_prompt = f"Create a short, catchy title (max 10 words) for this children's story:\n\n{story_text[:500]}...\n\nProvide ONLY the title, nothing else."
-            title_response = self.model.generate_content(title_prompt)
-            story_title = title_response.text.strip().replace('"', '').replace("'", "")
+            story_text = generated.story
+            story_title = generated.title
 
             # Calculate word count
             word_count = len(story_text.split())
@@ -111,9 +200,140 @@ Start directly with the story narrative.
             return {
                 "story_text": story_text,
                 "story_title": story_title,
-                "word_count": word_count
+                "word_count": word_count,
+                "mood": generated.mood,
+                "emotion": generated.emotion
             }
 
         except Exception as e:
             logger.error(f"Error generating story: {str(e)}")
             raise Exception(f"Failed to generate story: {str(e)}")
+
+    async def stream_story(
+        self,
+        theme: str,
+        character_name: str | None = None,
+        age_group: str = "5-7"
+    ) -> AsyncIterator[str]:
+        """
+        Stream story text from Gemini as it is generated
+
+        Args:
+            theme: Story theme or idea
+            character_name: Optional main character name
+            age_group: Target age group (3-5, 5-7, 7-10)
+
+        Yields:
+            Successive pieces of story text
+        """
+        try:
+            logger.info(f"Streaming story with theme: {theme}, age_group: {age_group}")
+
+            prompt = self.create_story_prompt(theme, character_name, age_group, structured=False)
+            response = await self.model.generate_content_async(prompt, stream=True)
+
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+
+        except Exception as e:
+            logger.error(f"Error streaming story: {str(e)}")
+            raise Exception(f"Failed to generate story: {str(e)}")
+
+    def parse_story_response(self, text: str) -> GeneratedStory | None:
+        """
+        Parse and validate the model's JSON reply
+
+        Tolerates markdown code fences and text around the JSON object.
+
+        Returns:
+            The validated story, or None if no valid JSON object was found
+        """
+        cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+        candidates = [cleaned]
+        match = re.search(r"\{.*\}", cleaned, re.DOTALL)
+        if match and match.group(0) != cleaned:
+            candidates.append(match.group(0))
+
+        for candidate in candidates:
+            try:
+                data = json.loads(candidate)
+                if isinstance(data, dict):
+                    return GeneratedStory(**data)
+            except (ValueError, ValidationError):
+                continue
+        return None
+
+    def salvage_story_response(self, text: str) -> GeneratedStory | None:
+        """
+        Recover the title and story from JSON that does not parse
+
+        A reply cut off at the output token limit still holds the "title"
+        and most of the "story" string; a cut-off story is trimmed back to
+        its last complete sentence.
+
+        Returns:
+            The recovered story, or None without a title and story
+        """
+        fields = {}
+        for name in ("title", "story", "mood", "emotion"):
+            match = re.search(PARTIAL_JSON_FIELD.format(name), text)
+            if not match:
+                continue
+            raw, closed = match.groups()
+            if not closed:
+                # Cut off inside a \uXXXX escape
+                raw = re.sub(r"\\u[0-9a-fA-F]{0,3}$", "", raw)
+            try:
+                value = json.loads(f'"{raw}"')
+            except ValueError:
+                continue
+            if name == "story" and not closed:
+                sentences = re.match(r".*[.!?][\"\u201d']?", value, re.DOTALL)
+                value = sentences.group(0) if sentences else ""
+            fields[name] = value
+
+        if not fields.get("title", "").strip() or not fields.get("story", "").strip():
+            return None
+        try:
+            return GeneratedStory(**fields)
+        except ValidationError:
+            return None
+
+    async def parse_plain_story(self, text: str) -> GeneratedStory:
+        """
+        Fallback for replies that are not valid JSON
+
+        Uses a leading "Title: ..." line if present, otherwise asks the
+        model for a title in a second request.
+
+        Raises:
+            Exception: If the reply is JSON after all (it must not be narrated)
+        """
+        story_text = re.sub(r"^```\w*\s*|\s*```$", "", text.strip())
+        if story_text.startswith("{") or re.search(r'"story"\s*:', story_text):
+            raise Exception("Model returned story JSON that could not be read")
+        lines = story_text.split("\n", 1)
+        title_match = re.match(r"^\W*title\W*:\s*(.+)$", lines[0], re.IGNORECASE)
+
+        if title_match and len(lines) > 1:
+            title = title_match.group(1)
+            story_text = lines[1].strip()
+        else:
+            title = await self.generate_title(story_text)
+
+        return GeneratedStory(title=title.replace('"', '').replace("'", ""), story=story_text)
+
+    async def generate_title(self, story_text: str) -> str:
+        """
+        Create a short title for a finished story
+
+        Args:
+            story_text: The story text
+
+        Returns:
+            Title without quotes
+        """
+        title_prompt = f"Create a short, catchy title (max 10 words) for this children's story:\n\n{story_text[:500]}...\n\nProvide ONLY the title, nothing else."
+        title_response = await self.model.generate_content_async(title_prompt)
+        return title_response.text.strip().replace('"', '').replace("'", "")
@@ -13,8 +13,15 @@ try:
     FALLBACK_MUSIC_AVAILABLE = True
 except ImportError:
     FALLBACK_MUSIC_AVAILABLE = False
+from app.services.audio_etags import digest_etag
 from app.services.audio_mixer import AudioMixerService
+from app.services.audio_workers import AudioWorkerPool
+from app.services.checkpoint_store import CheckpointStore
+from app.services.renditions import single_file_renditions
+from app.services.tts_cache import TTSCache
 from app.core.config import settings
+import asyncio
+import httpx
 import logging
 import os
 from datetime import datetime
@@ -41,12 +48,16 @@ class StoryState(TypedDict):
     narration_path: str | None
     music_path: str | None
     final_audio_path: str | None
+    audio_renditions: dict[str, str] | None  # Encoded format -> file
+    audio_etags: dict[str, str] | None  # File name -> content hash ETag
 
     # Metadata
     duration_seconds: float | None
     mood: str | None
+    emotion: str | None
 
     # Status
+    lease_owner: str | None  # Checkpoints are only written while the story is leased to it
     current_step: str
     error: str | None
 
@@ -54,13 +65,57 @@ class StoryState(TypedDict):
 class StoryOrchestrator:
     """
     Orchestrates the entire story generation workflow using LangGraph
-    Story → Speech → Music → Final Mix
+    Story → (Speech ∥ Music) → Final Mix
+
+    Each stage checkpoints its output, and a resumed run skips stages whose
+    output is already checkpointed (and, for audio, still on disk).
     """
 
-    def __init__(self):
-        """Initialize services"""
+    # State fields restored from a checkpoint when a story is resumed
+    CHECKPOINT_FIELDS = (
+        "story_text",
+        "story_text_html",
+        "story_title",
+        "word_count",
+        "narration_path",
+        "music_path",
+        "mood",
+        "emotion",
+        "final_audio_path",
+        "audio_renditions",
+        "audio_etags",
+        "duration_seconds"
+    )
+
+    # Approximate read-aloud pace (words per minute at speed 1.0) per age group,
+    # used to size the music bed before the narration exists
+    NARRATION_WORDS_PER_MINUTE = {
+        "3-5": 130,
+        "5-7": 145,
+        "7-10": 160
+    }
+
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient | None = None,
+        audio_workers: AudioWorkerPool | None = None
+    ):
+        """
+        Initialize services
+
+        Args:
+            http_client: Shared connection pool for provider APIs; build the
+                orchestrator once per process and reuse it across stories
+            audio_workers: Process pool for mixing and other CPU-bound audio work
+        """
         self.story_generator = StoryGeneratorService()
 
+        # Content-addressed narration cache shared by every story in this process
+        self.tts_cache = TTSCache(
+            settings.TTS_CACHE_DIR,
+            settings.TTS_CACHE_MAX_MB * 1024 * 1024
+        ) if settings.TTS_CACHE_ENABLED else None
+
         # Choose TTS service based on configuration or fallback
         if getattr(settings, 'USE_FALLBACK_TTS', False) and FALLBACK_TTS_AVAILABLE:
             logger.warning("Using fallback TTS service (gTTS)")
@@ -68,15 +123,17 @@ class StoryOrchestrator:
             self.use_cartesia_tts = False
         elif getattr(settings, 'USE_CARTESIA_TTS', False) and settings.CARTESIA_API_KEY:
             logger.info("Using Cartesia TTS service")
-            self.tts_service = TTSService()
+            self.tts_service = TTSService(http_client=http_client, cache=self.tts_cache)
             self.use_cartesia_tts = True
         else:
             logger.warning("No TTS service configured, using fallback")
-            self.tts_service = TTSServiceFallback() if FALLBACK_TTS_AVAILABLE else TTSService()
+            self.tts_service = TTSServiceFallback() if FALLBACK_TTS_AVAILABLE else TTSService(http_client=http_client, cache=self.tts_cache)
             self.use_cartesia_tts = False
 
         self.music_service = MusicService()
-        self.audio_mixer = AudioMixerService()
+        self.fallback_music_service = MusicServiceFallback() if FALLBACK_MUSIC_AVAILABLE else None
+        self.audio_mixer = AudioMixerService(workers=audio_workers)
+        self.checkpoints = CheckpointStore()
         self.workflow = self._build_workflow()
 
     def _build_workflow(self) -> StateGraph:
@@ -85,21 +142,25 @@ class StoryOrchestrator:
         # Create the graph
         workflow = StateGraph(StoryState)
 
-        # Add nodes for each step
+        # Add nodes for each step. Speech and music only depend on the story
+        # text, so they run as one fan-out/fan-in node (the pinned LangGraph
+        # release has no join edges for parallel branches).
         workflow.add_node("generate_story", self.generate_story_node)
-        workflow.add_node("generate_speech", self.generate_speech_node)
-        workflow.add_node("generate_music", self.generate_music_node)
+        workflow.add_node("generate_audio_tracks", self.generate_audio_tracks_node)
         workflow.add_node("mix_audio", self.mix_audio_node)
 
         # Define the flow
         workflow.set_entry_point("generate_story")
-        workflow.add_edge("generate_story", "generate_speech")
-        workflow.add_edge("generate_speech", "generate_music")
-        workflow.add_edge("generate_music", "mix_audio")
+        workflow.add_edge("generate_story", "generate_audio_tracks")
+        workflow.add_edge("generate_audio_tracks", "mix_audio")
         workflow.add_edge("mix_audio", END)
 
         return workflow.compile()
 
+    async def aclose(self):
+        """Release provider clients held by the services"""
+        await self.music_service.aclose()
+
     def format_story_as_html(self, text: str) -> str:
         """Format story text with HTML markup for better display"""
         # Split into paragraphs (by double newlines or single newlines)
@@ -119,9 +180,42 @@ class StoryOrchestrator:
 
         return '\n'.join(html_paragraphs)
 
+    def estimate_narration_duration(self, word_count: int, age_group: str, speed: float = 1.0) -> float:
+        """
+        Estimate narration length in seconds from the story text alone
+
+        Args:
+            word_count: Number of words in the story
+            age_group: Target age group (3-5, 5-7, 7-10)
+            speed: TTS speed multiplier
+
+        Returns:
+            Estimated duration in seconds
+        """
+        words_per_minute = self.NARRATION_WORDS_PER_MINUTE.get(
+            age_group, self.NARRATION_WORDS_PER_MINUTE["5-7"]
+        )
+        return word_count / (words_per_minute * max(speed, 0.1)) * 60.0
+
+    def save_checkpoint(self, state: StoryState, *fields: str):
+        """Persist the given state fields after a stage completes"""
+        try:
+            saved = self.checkpoints.save(
+                state["story_id"], {field: state[field] for field in fields}, state.get("lease_owner")
+            )
+            if not saved:
+                logger.warning(f"[Story {state['story_id']}] No longer owned by this run, checkpoint not saved")
+        except Exception as e:
+            # A lost checkpoint only costs a re-render on retry; never fail the story for it
+            logger.warning(f"[Story {state['story_id']}] Could not save checkpoint: {str(e)}")
+
     async def generate_story_node(self, state: StoryState) -> StoryState:
         """Node: Generate story text"""
         try:
+            if state.get("story_text"):
+                logger.info(f"[Story {state['story_id']}] Reusing checkpointed story text")
+                return state
+
             logger.info(f"[Story {state['story_id']}] Generating story text...")
             state["current_step"] = "generating_text"
 
@@ -138,6 +232,13 @@ class StoryOrchestrator:
             state["story_title"] = result["story_title"]
             state["word_count"] = result["word_count"]
 
+            # Mood/emotion hints from the model replace the keyword scans when present
+            state["mood"] = result.get("mood")
+            state["emotion"] = result.get("emotion")
+            self.save_checkpoint(
+                state, "story_text", "story_text_html", "story_title", "word_count", "mood", "emotion"
+            )
+
             logger.info(f"[Story {state['story_id']}] Story generated: {result['story_title']}")
             return state
 
@@ -152,6 +253,10 @@ class StoryOrchestrator:
             if state.get("error"):
                 return state
 
+            if state.get("narration_path"):
+                logger.info(f"[Story {state['story_id']}] Reusing checkpointed narration")
+                return state
+
             logger.info(f"[Story {state['story_id']}] Generating speech...")
             state["current_step"] = "generating_audio"
 
@@ -164,12 +269,30 @@ class StoryOrchestrator:
             # Generate speech with appropriate parameters
             if self.use_cartesia_tts:
                 # Cartesia TTS uses emotion-based generation
-                emotion = await self.tts_service.get_emotion_for_story(state["story_text"])
+                emotion = state.get("emotion") or await self.tts_service.get_emotion_for_story(state["story_text"])
+                render_params = self.tts_service.get_render_params(
+                    emotion=emotion,
+                    speed=settings.TTS_SPEED
+                )
+            else:
+                render_params = self.tts_service.get_render_params()
+
+            # Identical text with identical voice settings was already rendered
+            cache_key = None
+            if self.tts_cache:
+                cache_key = self.tts_cache.make_key(state["story_text"], **render_params)
+                if self.tts_cache.copy_to(cache_key, extension, narration_path):
+                    logger.info(f"[Story {state['story_id']}] Narration served from TTS cache")
+                    state["narration_path"] = narration_path
+                    self.save_checkpoint(state, "narration_path")
+                    return state
+
+            if self.use_cartesia_tts:
                 await self.tts_service.generate_speech(
                     story_text=state["story_text"],
                     output_path=narration_path,
                     emotion=emotion,
-                    speed=1.0
+                    speed=settings.TTS_SPEED
                 )
             else:
                 # Fallback TTS (gTTS or Azure with SSML)
@@ -179,8 +302,11 @@ class StoryOrchestrator:
                     use_ssml=True
                 )
 
+            if cache_key:
+                self.tts_cache.put_file(cache_key, extension, narration_path)
 
             state["narration_path"] = narration_path
+            self.save_checkpoint(state, "narration_path")
 
             logger.info(f"[Story {state['story_id']}] Speech generated")
             return state
@@ -196,14 +322,24 @@ class StoryOrchestrator:
             if state.get("error"):
                 return state
 
+            if state.get("music_path"):
+                logger.info(f"[Story {state['story_id']}] Reusing checkpointed music")
+                return state
+
             logger.info(f"[Story {state['story_id']}] Generating background music...")
             state["current_step"] = "adding_music"
 
-            # Get narration duration
-            narration_duration = self.audio_mixer.get_audio_duration(state["narration_path"])
+            # Size the bed from an estimate so music does not wait for the narration;
+            # the mixer trims or loops it to the real narration length
+            speed = settings.TTS_SPEED if self.use_cartesia_tts else 1.0
+            narration_duration = self.estimate_narration_duration(
+                state["word_count"] or len(state["story_text"].split()),
+                state["age_group"],
+                speed
+            ) * settings.MUSIC_DURATION_MARGIN
 
             # Determine mood from story
-            mood = self.music_service.get_story_mood(state["story_text"])
+            mood = state.get("mood") or self.music_service.get_story_mood(state["story_text"])
             state["mood"] = mood
 
             # Create unique filename
@@ -211,21 +347,36 @@ class StoryOrchestrator:
             music_filename = f"story_{state['story_id']}_{timestamp}_music.wav"
             music_path = os.path.join(settings.STORIES_DIR, music_filename)
 
+            policy = settings.MUSIC_SOURCE_POLICY
+            library_music_path = None
+            if policy != "live_only":
+                # Pre-rendered beds are available instantly; the mixer loops them to fit
+                try:
+                    library_music_path = await self.music_service.get_royalty_free_music(
+                        duration=int(narration_duration), mood=mood
+                    )
+                except Exception as library_error:
+                    logger.info(f"[Story {state['story_id']}] {str(library_error)}")
+
             # Try to generate music, fall back to silent audio if it fails
             try:
-                await self.music_service.generate_music(
-                    duration=int(narration_duration) + 5,  # Add 5s buffer
-                    mood=mood,
-                    output_path=music_path
-                )
+                if library_music_path:
+                    music_path = library_music_path
+                elif policy == "library_only":
+                    raise Exception("Music library has no bed for this mood and live generation is disabled")
+                else:
+                    await self.music_service.generate_music(
+                        duration=int(narration_duration) + 5,  # Add 5s buffer
+                        mood=mood,
+                        output_path=music_path
+                    )
             except Exception as music_error:
                 logger.warning(f"[Story {state['story_id']}] Music generation failed: {str(music_error)}")
                 logger.info(f"[Story {state['story_id']}] Using silent audio as fallback")
 
                 # Use fallback music service (silent audio)
-                if FALLBACK_MUSIC_AVAILABLE:
-                    fallback_music = MusicServiceFallback()
-                    await fallback_music.generate_music(
+                if self.fallback_music_service:
+                    await self.fallback_music_service.generate_music(
                         duration=int(narration_duration) + 5,
                         mood=mood,
                         output_path=music_path
@@ -234,6 +385,7 @@ class StoryOrchestrator:
                     raise music_error
 
             state["music_path"] = music_path
+            self.save_checkpoint(state, "music_path", "mood")
 
             logger.info(f"[Story {state['story_id']}] Music generated with mood: {mood}")
             return state
@@ -245,12 +397,47 @@ class StoryOrchestrator:
             state["music_path"] = None
             return state
 
+    async def generate_audio_tracks_node(self, state: StoryState) -> StoryState:
+        """Node: Generate narration and background music concurrently"""
+        if state.get("error") or state.get("final_audio_path"):
+            return state
+
+        # Each branch works on its own copy so their step bookkeeping does not interleave
+        speech_task = asyncio.create_task(self.generate_speech_node(dict(state)))
+        music_task = asyncio.create_task(self.generate_music_node(dict(state)))
+        try:
+            speech_state = await speech_task
+            if speech_state.get("error"):
+                # The story has failed: give the Lyria session back instead of
+                # capturing music nobody will hear
+                music_task.cancel()
+                await asyncio.gather(music_task, return_exceptions=True)
+                music_state = {}
+            else:
+                music_state = await music_task
+        finally:
+            for task in (speech_task, music_task):
+                task.cancel()
+
+        state["narration_path"] = speech_state.get("narration_path")
+        state["music_path"] = music_state.get("music_path")
+        if music_state.get("mood"):
+            state["mood"] = music_state["mood"]
+        state["error"] = speech_state.get("error")
+        state["current_step"] = speech_state["current_step"]
+        return state
+
     async def mix_audio_node(self, state: StoryState) -> StoryState:
         """Node: Mix narration and music into final audio"""
         try:
             if state.get("error"):
                 return state
 
+            if state.get("final_audio_path"):
+                logger.info(f"[Story {state['story_id']}] Reusing checkpointed final audio")
+                state["current_step"] = "completed"
+                return state
+
             logger.info(f"[Story {state['story_id']}] Mixing final audio...")
             state["current_step"] = "finalizing"
 
@@ -261,7 +448,7 @@ class StoryOrchestrator:
 
             if state.get("music_path"):
                 # Mix narration with music
-                final_audio_path, duration = await self.audio_mixer.mix_audio(
+                final_audio_path, duration, renditions = await self.audio_mixer.mix_audio(
                     narration_path=state["narration_path"],
                     music_path=state["music_path"],
                     output_path=final_path,
@@ -271,11 +458,52 @@ class StoryOrchestrator:
                 # Use narration only if music generation failed
                 logger.warning(f"[Story {state['story_id']}] No music available, using narration only")
                 final_audio_path = state["narration_path"]
-                duration = self.audio_mixer.get_audio_duration(final_audio_path)
+                duration = await self.audio_mixer.measure_duration(final_audio_path)
+                try:
+                    renditions = await self.audio_mixer.encode_renditions(final_audio_path, final_path)
+                    final_audio_path = renditions["mp3"]
+                except Exception as e:
+                    # The narration alone is still a playable story
+                    logger.warning(f"[Story {state['story_id']}] Serving narration without renditions: {str(e)}")
+                    renditions = None
+
+            # Move the finished audio into the blob store; identical renders
+            # share one file, and the content hash doubles as the ETag
+            files = single_file_renditions(renditions) if renditions else {}
+            stored = await self.audio_mixer.store_audio([final_audio_path, *files.values()])
+            final_audio_path = stored[final_audio_path][0]
+            if renditions:
+                renditions = {
+                    audio_format: stored[path][0] if path in stored else path
+                    for audio_format, path in renditions.items()
+                }
+            if renditions and renditions.get("hls"):
+                # Segments are not blobs; other nodes read them from remote storage
+                await self.audio_mixer.publish_hls(renditions["hls"])
+            etags = {
+                os.path.basename(path): digest_etag(digest)
+                for path, digest in stored.values() if digest
+            }
+
+            # The narration and music WAVs are only inputs to the mix: once the
+            # final audio is checkpointed nothing needs them again
+            scratch = [
+                state.get(field) for field in ("narration_path", "music_path")
+                if state.get(field) and state[field] not in stored
+            ]
+            state["narration_path"] = None
+            state["music_path"] = None
 
             state["final_audio_path"] = final_audio_path
+            state["audio_renditions"] = renditions
+            state["audio_etags"] = etags
             state["duration_seconds"] = duration
             state["current_step"] = "completed"
+            self.save_checkpoint(
+                state, "narration_path", "music_path", "final_audio_path",
+                "audio_renditions", "audio_etags", "duration_seconds"
+            )
+            self.remove_scratch_audio(scratch)
 
             logger.info(f"[Story {state['story_id']}] Final audio created: {final_audio_path}")
             return state
@@ -285,21 +513,39 @@ class StoryOrchestrator:
             state["error"] = str(e)
             return state
 
+    @staticmethod
+    def remove_scratch_audio(paths: list[str]):
+        """Delete intermediate files written to STORIES_DIR (library beds are left alone)"""
+        stories_dir = os.path.abspath(settings.STORIES_DIR)
+        for path in paths:
+            if os.path.dirname(os.path.abspath(path)) != stories_dir:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
     async def generate_complete_story(
         self,
         story_id: int,
         theme: str,
         character_name: str | None,
-        age_group: str
+        age_group: str,
+        lease_owner: str | None = None
     ) -> StoryState:
         """
         Execute the complete story generation workflow
 
+        Stages checkpointed by an earlier, interrupted run of the same story
+        are skipped.
+
         Args:
             story_id: Database ID of the story
             theme: Story theme
             character_name: Optional character name
             age_group: Target age group
+            lease_owner: Lease the run holds on the story; checkpoints are
+                only saved while it still does
 
         Returns:
             Final state with all generated content
@@ -320,12 +566,26 @@ class StoryOrchestrator:
                 "narration_path": None,
                 "music_path": None,
                 "final_audio_path": None,
+                "audio_renditions": None,
+                "audio_etags": None,
                 "duration_seconds": None,
                 "mood": None,
+                "emotion": None,
+                "lease_owner": lease_owner,
                 "current_step": "starting",
                 "error": None
             }
 
+            # Resume from the last checkpoint, if any
+            checkpoint = self.checkpoints.load(story_id)
+            if checkpoint:
+                logger.info(
+                    f"[Story {story_id}] Resuming from checkpoint: {', '.join(sorted(checkpoint))}"
+                )
+                for field in self.CHECKPOINT_FIELDS:
+                    if checkpoint.get(field) is not None:
+                        initial_state[field] = checkpoint[field]
+
             # Execute workflow
             final_state = await self.workflow.ainvoke(initial_state)
 
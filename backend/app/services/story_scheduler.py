@@ -0,0 +1,491 @@
+"""
+Bounded in-process scheduler for story generation jobs
+
+Jobs are queued in memory and processed by a fixed pool of asyncio workers,
+so a burst of requests cannot start more pipelines than the providers can take.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from sqlalchemy import func, update
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.story import IN_PROGRESS_STATUSES, Story, StoryStatus
+from app.services.blob_store import blob_store, referenced_paths
+from app.services.container import services
+
+logger = logging.getLogger(__name__)
+
+class SchedulerFullError(Exception):
+    """Raised when the generation queue has no room for another job"""
+
+
+@dataclass
+class GenerationJob:
+    """A queued story generation request"""
+    story_id: int
+    theme: str
+    character_name: str | None
+    age_group: str
+
+
+async def run_generation_job(job: GenerationJob, worker_id: str):
+    """
+    Generate a claimed story and store the result
+
+    The job opens and closes its own database session, so it never shares
+    a session with the request that queued it. Stages checkpointed by an
+    earlier attempt are not repeated.
+
+    The result and checkpoints are only written while this run still owns
+    the story: it must still be in progress and still leased to worker_id.
+    A run whose lease expired and was reclaimed, or whose story was
+    regenerated meanwhile, drops its result instead of overwriting the new
+    run's.
+
+    Args:
+        job: Story to generate (already moved to GENERATING_TEXT by the caller)
+        worker_id: Lease owner, unique to this run
+    """
+    db = SessionLocal()
+    try:
+        # Get story from database
+        story = db.query(Story).filter(Story.id == job.story_id).first()
+        if not story:
+            logger.error(f"Story {job.story_id} not found")
+            return
+        db.commit()  # No transaction stays open while generating
+
+        # Reuse the process-wide orchestrator and provider clients
+        orchestrator = services.get_orchestrator()
+
+        # Generate complete story
+        result = await orchestrator.generate_complete_story(
+            story_id=job.story_id,
+            theme=job.theme,
+            character_name=job.character_name,
+            age_group=job.age_group,
+            lease_owner=worker_id
+        )
+
+        # Update database with results
+        story = lock_owned_story(db, job.story_id, worker_id)
+        if story is None:
+            db.rollback()
+            # Blobs stored by this run were never acquired; the garbage
+            # collector removes any that nothing else took up
+            logger.warning(f"Story {job.story_id} is no longer owned by this run, discarding its result")
+            return
+
+        released = []
+        if result.get("error"):
+            story.status = StoryStatus.FAILED
+            story.error_message = result["error"]
+        else:
+            previous_paths = referenced_paths(story)
+            story.status = StoryStatus.COMPLETED
+            story.story_text = result["story_text"]
+            story.story_text_html = result.get("story_text_html", result["story_text"])
+            story.story_title = result["story_title"]
+            story.word_count = result["word_count"]
+            story.audio_file_path = result.get("narration_path")
+            story.music_file_path = result.get("music_path")
+            story.final_audio_path = result["final_audio_path"]
+            story.audio_renditions = json.dumps(result["audio_renditions"]) if result.get("audio_renditions") else None
+            story.audio_etags = json.dumps(result["audio_etags"]) if result.get("audio_etags") else None
+            story.duration_seconds = result["duration_seconds"]
+            story.completed_at = datetime.now()
+            story.generation_checkpoint = None
+
+            # Generate URL for frontend
+            filename = os.path.basename(result["final_audio_path"])
+            story.audio_url = f"/api/v1/stories/audio/{filename}"
+
+            # Swap the story's blob references to the new audio in the same
+            # transaction (a regenerated story's old audio stays referenced
+            # by its saved version)
+            blob_store.acquire(db, referenced_paths(story))
+            released = blob_store.release(db, previous_paths)
+
+        db.commit()
+        blob_store.delete_files(released)
+        logger.info(f"Story {job.story_id} generation completed: {story.status}")
+
+    except Exception as e:
+        logger.error(f"Error in background story generation: {str(e)}")
+        db.rollback()
+        story = lock_owned_story(db, job.story_id, worker_id)
+        if story:
+            story.status = StoryStatus.FAILED
+            story.error_message = str(e)
+        db.commit()
+
+    finally:
+        db.close()
+
+
+def lock_owned_story(db, story_id: int, worker_id: str) -> Story | None:
+    """
+    Lock a story row for writing a result, if this run still owns it
+
+    The conditional UPDATE both checks ownership and takes the row's write
+    lock, so the owner cannot change before the caller commits.
+
+    Returns:
+        The story, or None if it is no longer in progress or leased to worker_id
+    """
+    owned = db.query(Story).filter(
+        Story.id == story_id,
+        Story.status.in_(IN_PROGRESS_STATUSES),
+        Story.lease_owner == worker_id
+    ).update(
+        {Story.updated_at: func.now()}, synchronize_session=False
+    )
+    if not owned:
+        return None
+    return db.query(Story).filter(Story.id == story_id).populate_existing().one()
+
+
+def pending_jobs() -> list[GenerationJob]:
+    """Jobs for every PENDING story, oldest first"""
+    db = SessionLocal()
+    try:
+        pending = (
+            db.query(Story)
+            .filter(Story.status == StoryStatus.PENDING)
+            .order_by(Story.queued_at, Story.id)
+            .all()
+        )
+        return [
+            GenerationJob(
+                story_id=story.id,
+                theme=story.theme,
+                character_name=story.character_name,
+                age_group=story.age_group
+            )
+            for story in pending
+        ]
+    finally:
+        db.close()
+
+
+def recover_stories(max_attempts: int) -> list[GenerationJob]:
+    """
+    Pick up the stories a stopped process left behind
+
+    Only stories whose lease has expired go back to PENDING (their
+    checkpoints keep finished stages), or to FAILED once they have been
+    interrupted max_attempts times; stories another live process is still
+    generating keep their lease. In-progress stories without any lease were
+    claimed before the in-process scheduler took leases and are requeued too.
+
+    Returns:
+        Jobs for every PENDING story, oldest first
+    """
+    db = SessionLocal()
+    try:
+        unleased = db.query(Story).filter(
+            Story.status.in_(IN_PROGRESS_STATUSES), Story.lease_expires_at.is_(None)
+        ).all()
+        for story in unleased:
+            story.attempts = (story.attempts or 0) + 1
+            if story.attempts >= max_attempts:
+                story.status = StoryStatus.FAILED
+                story.error_message = "Story generation was interrupted too many times"
+            else:
+                story.status = StoryStatus.PENDING
+                story.queued_at = story.queued_at or datetime.utcnow()
+        db.commit()
+        if unleased:
+            logger.warning(f"Recovered {len(unleased)} stories interrupted without a lease")
+    finally:
+        db.close()
+
+    requeue_expired_leases(max_attempts)
+    return pending_jobs()
+
+
+def claim_story(story_id: int, owner: str, lease_seconds: int) -> bool:
+    """
+    Move a PENDING story to GENERATING_TEXT under a lease held by owner
+
+    Every API process requeues PENDING stories on startup, so only the
+    first to claim a story generates it. The lease must be renewed while
+    the story is generated; once it expires, recover_stories() requeues it.
+
+    Returns:
+        False if the story is no longer PENDING
+    """
+    db = SessionLocal()
+    try:
+        claimed = db.query(Story).filter(
+            Story.id == story_id, Story.status == StoryStatus.PENDING
+        ).update({
+            Story.status: StoryStatus.GENERATING_TEXT,
+            Story.lease_owner: owner,
+            Story.lease_expires_at: datetime.utcnow() + timedelta(seconds=lease_seconds),
+            Story.attempts: func.coalesce(Story.attempts, 0) + 1
+        }, synchronize_session=False)
+        db.commit()
+        return claimed == 1
+    finally:
+        db.close()
+
+
+def renew_lease(story_id: int, worker_id: str, lease_seconds: int) -> bool:
+    """Extend a lease; returns False if this worker no longer holds it"""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(Story)
+            .where(Story.id == story_id, Story.lease_owner == worker_id)
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        )
+        db.commit()
+        return result.rowcount == 1
+    finally:
+        db.close()
+
+
+def release_lease(story_id: int, worker_id: str, requeue: bool = False):
+    """
+    Drop a lease held by this worker
+
+    Args:
+        story_id: Story the lease is on
+        worker_id: Lease owner
+        requeue: Put the story back to PENDING (e.g. on worker shutdown)
+    """
+    db = SessionLocal()
+    try:
+        values = {"lease_owner": None, "lease_expires_at": None}
+        query = update(Story).where(Story.id == story_id, Story.lease_owner == worker_id)
+        if requeue:
+            values.update(status=StoryStatus.PENDING, queued_at=datetime.utcnow())
+            query = query.where(Story.status.in_(IN_PROGRESS_STATUSES))
+        db.execute(query.values(**values))
+        db.commit()
+    finally:
+        db.close()
+
+
+def requeue_expired_leases(max_attempts: int) -> int:
+    """
+    Return stories whose worker stopped heartbeating to the queue
+
+    Stories that already used up max_attempts are marked FAILED instead.
+
+    Returns:
+        Number of stories requeued or failed
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        expired = (
+            Story.status.in_(IN_PROGRESS_STATUSES),
+            Story.lease_expires_at.isnot(None),
+            Story.lease_expires_at < now,
+        )
+        failed = db.execute(
+            update(Story)
+            .where(*expired, Story.attempts >= max_attempts)
+            .values(
+                status=StoryStatus.FAILED,
+                error_message="Story generation was interrupted too many times",
+                lease_owner=None,
+                lease_expires_at=None
+            )
+        ).rowcount
+        requeued = db.execute(
+            update(Story)
+            .where(*expired)
+            .values(
+                status=StoryStatus.PENDING,
+                queued_at=now,
+                lease_owner=None,
+                lease_expires_at=None
+            )
+        ).rowcount
+        db.commit()
+
+        if failed or requeued:
+            logger.warning(f"Expired leases: {requeued} stories requeued, {failed} failed")
+        return failed + requeued
+
+    finally:
+        db.close()
+
+
+class StoryScheduler:
+    """Fixed-size worker pool fed by a bounded FIFO queue"""
+
+    def __init__(self, max_concurrency: int, max_queue_size: int, lease_seconds: int):
+        """
+        Args:
+            max_concurrency: Number of stories generated at the same time
+            max_queue_size: Number of stories allowed to wait for a worker
+            lease_seconds: How long a claimed story stays leased without a heartbeat
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._queue: asyncio.Queue[GenerationJob] | None = None
+        self._waiting: OrderedDict[int, GenerationJob] = OrderedDict()
+        self._workers: list[asyncio.Task] = []
+        self._active = 0
+
+    async def start(self):
+        """Start the worker tasks and requeue stories left over from the last run"""
+        if self._workers:
+            return
+
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"story-worker-{i}")
+            for i in range(self.max_concurrency)
+        ]
+        self._workers.append(asyncio.create_task(self._reaper(), name="story-lease-reaper"))
+
+        # Already accepted, so they are queued even past the limit
+        recovered = await asyncio.to_thread(recover_stories, settings.WORKER_MAX_ATTEMPTS)
+        for job in recovered:
+            if job.story_id not in self._waiting:
+                self._enqueue(job)
+
+        logger.info(
+            f"Story scheduler {self.worker_id} started: {self.max_concurrency} workers, "
+            f"queue limit {self.max_queue_size}, {len(recovered)} stories requeued"
+        )
+
+    async def stop(self):
+        """Stop the worker tasks; queued and running stories go back to PENDING in the database"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._waiting.clear()
+        logger.info("Story scheduler stopped")
+
+    def has_capacity(self) -> bool:
+        """Whether another job can be queued right now"""
+        return self._queue is not None and len(self._waiting) < self.max_queue_size
+
+    def submit(self, job: GenerationJob) -> int:
+        """
+        Queue a job for generation
+
+        Returns:
+            1-based position of the job in the queue
+
+        Raises:
+            SchedulerFullError: If the scheduler is stopped or the queue is full
+        """
+        if job.story_id in self._waiting:
+            # Already queued (e.g. regenerated while still waiting)
+            return self.get_queue_position(job.story_id)
+
+        if not self.has_capacity():
+            raise SchedulerFullError("Story generation queue is full")
+
+        self._enqueue(job)
+        logger.info(f"Story {job.story_id} queued at position {len(self._waiting)}")
+        return len(self._waiting)
+
+    def _enqueue(self, job: GenerationJob):
+        self._waiting[job.story_id] = job
+        self._queue.put_nowait(job)
+
+    def get_queue_position(self, story_id: int) -> int | None:
+        """1-based queue position of a waiting story, None if not waiting"""
+        for position, waiting_id in enumerate(self._waiting, start=1):
+            if waiting_id == story_id:
+                return position
+        return None
+
+    def stats(self) -> dict:
+        """Current queue depth and worker utilisation"""
+        return {
+            "queued": len(self._waiting),
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "max_queue_size": self.max_queue_size
+        }
+
+    async def _worker(self, index: int):
+        """Pull jobs off the queue until cancelled"""
+        while True:
+            job = await self._queue.get()
+            self._waiting.pop(job.story_id, None)
+            self._active += 1
+            # A fresh owner per run, so a run superseded by a regeneration of
+            # the same story cannot pass for the one that replaced it
+            owner = f"{self.worker_id}:{index}:{uuid.uuid4().hex[:8]}"
+            try:
+                claimed = await asyncio.to_thread(claim_story, job.story_id, owner, self.lease_seconds)
+                if not claimed:
+                    logger.info(f"Story {job.story_id} is no longer pending, skipping it")
+                    continue
+                await self._run(job, owner)
+            except Exception as e:
+                logger.error(f"Worker {index} failed on story {job.story_id}: {str(e)}")
+            finally:
+                self._active -= 1
+                self._queue.task_done()
+
+    async def _run(self, job: GenerationJob, owner: str):
+        """Generate one claimed story while renewing its lease"""
+        generation = asyncio.create_task(run_generation_job(job, worker_id=owner))
+        requeue = False
+        try:
+            while not generation.done():
+                done, _ = await asyncio.wait({generation}, timeout=self.lease_seconds / 3)
+                if generation in done:
+                    break
+
+                renewed = await asyncio.to_thread(renew_lease, job.story_id, owner, self.lease_seconds)
+                if not renewed:
+                    logger.warning(f"[{owner}] Lost lease on story {job.story_id}, abandoning it")
+                    generation.cancel()
+                    break
+
+            await asyncio.gather(generation, return_exceptions=True)
+
+        except asyncio.CancelledError:
+            # The scheduler is stopping: hand the story back to the queue
+            logger.warning(f"[{owner}] Shutting down, requeueing story {job.story_id}")
+            generation.cancel()
+            await asyncio.gather(generation, return_exceptions=True)
+            requeue = True
+            raise
+
+        finally:
+            await asyncio.to_thread(release_lease, job.story_id, owner, requeue)
+
+    async def _reaper(self):
+        """Periodically requeue stories whose process stopped renewing their lease"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 2)
+            try:
+                requeued = await asyncio.to_thread(requeue_expired_leases, settings.WORKER_MAX_ATTEMPTS)
+                if requeued:
+                    for job in await asyncio.to_thread(pending_jobs):
+                        if job.story_id not in self._waiting:
+                            self._enqueue(job)
+            except Exception as e:
+                logger.error(f"Error requeueing expired leases: {str(e)}")
+
+
+story_scheduler = StoryScheduler(
+    max_concurrency=settings.GENERATION_MAX_CONCURRENCY,
+    max_queue_size=settings.GENERATION_QUEUE_MAX_SIZE,
+    lease_seconds=settings.WORKER_LEASE_SECONDS
+)
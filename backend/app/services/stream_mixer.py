@@ -0,0 +1,306 @@
+"""
+Block-streaming mixing engine
+
+Mixes narration and music in fixed-size blocks read from memory-mapped
+16-bit WAV files and pipes the result straight into ffmpeg's encoders,
+so peak memory per mix stays constant however long the story is. Inputs
+in other formats are first decoded to a temporary WAV on disk.
+
+Peak normalization needs the loudest sample before anything is written,
+so the mix is computed twice: once to find the peak, once to encode.
+"""
+
+import logging
+import os
+import subprocess
+import tempfile
+from pydub import AudioSegment
+from app.services.numpy_mixer import NORMALIZE_HEADROOM_DB
+from app.services.renditions import output_args, rendition_paths
+from app.utils.audio_probe import WAVE_FORMAT_EXTENSIBLE, WAVE_FORMAT_PCM, read_wav_header
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+BLOCK_FRAMES = 1 << 16  # ~1.5 s at 44.1 kHz
+
+
+def read_wav_layout(path: str) -> dict | None:
+    """
+    Locate the PCM data of a 16-bit WAV file
+
+    Returns:
+        Dict with 'offset', 'frames', 'channels' and 'rate', or None if the
+        file is not 16-bit PCM WAV
+    """
+    header = read_wav_header(path)
+    if (
+        header is None
+        or header["format"] not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE)
+        or header["bits"] != 16
+    ):
+        return None
+
+    return {
+        "offset": header["offset"],
+        "frames": header["data_size"] // header["block_align"],
+        "channels": header["channels"],
+        "rate": header["rate"]
+    }
+
+
+class PCMSource:
+    """Memory-mapped int16 frames of a WAV file (decoded to a temp WAV if needed)"""
+
+    def __init__(self, path: str, temp_dir: str):
+        layout = read_wav_layout(path)
+        if layout is None:
+            path = self._decode_to_wav(path, temp_dir)
+            layout = read_wav_layout(path)
+            if layout is None:
+                raise Exception(f"Could not decode {path} to PCM")
+
+        self.rate = layout["rate"]
+        self.channels = layout["channels"]
+        self.frames = layout["frames"]
+        # Plain ndarray view: blocks taken from it should not be memmap instances
+        self.samples = np.memmap(
+            path, dtype="<i2", mode="r", offset=layout["offset"],
+            shape=(self.frames, self.channels)
+        ).view(np.ndarray)
+
+    @staticmethod
+    def _decode_to_wav(path: str, temp_dir: str) -> str:
+        wav_path = os.path.join(temp_dir, f"{os.path.basename(path)}.wav")
+        subprocess.run(
+            [AudioSegment.converter, "-y", "-loglevel", "error", "-i", path,
+             "-acodec", "pcm_s16le", "-f", "wav", wav_path],
+            check=True, stdin=subprocess.DEVNULL, capture_output=True
+        )
+        return wav_path
+
+    def take(self, index: "np.ndarray") -> "np.ndarray":
+        """float32 frames at the given indices"""
+        out = np.take(self.samples, index, axis=0).astype(np.float32)
+        out *= 1.0 / 32768.0
+        return out
+
+
+class LoopedMusic:
+    """
+    Music looped with crossfaded seams, resampled to the output rate
+
+    Computes any output frame directly from the source file, matching
+    numpy_mixer.fit_to_length: copies start every (length - crossfade)
+    source frames and each seam blends the previous tail into the next head.
+    Empty music (a truncated capture or library file) gives silence.
+    """
+
+    def __init__(self, source: PCMSource, output_rate: int, output_frames: int, crossfade_ms: int):
+        self.source = source
+        self.step = source.rate / output_rate
+        self.silent = source.frames == 0
+        needed = int(output_frames * self.step) + 2
+
+        if self.silent:
+            logger.warning("Music file has no audio, mixing narration only")
+            self.crossfade = 0
+            self.period = 1
+        elif source.frames >= needed:
+            # Long enough already: no looping
+            self.crossfade = 0
+            self.period = source.frames
+        else:
+            self.crossfade = min(int(source.rate * crossfade_ms / 1000), source.frames // 2)
+            self.period = source.frames - self.crossfade
+
+    def _looped(self, index: "np.ndarray") -> "np.ndarray":
+        copy = index // self.period
+        offset = index - copy * self.period
+        out = self.source.take(offset)
+
+        if self.crossfade:
+            seam = (copy > 0) & (offset < self.crossfade)
+            if seam.any():
+                head = offset[seam]
+                ramp = (head / max(self.crossfade - 1, 1)).astype(np.float32)[:, None]
+                tail = self.source.take(head + self.period)
+                out[seam] = out[seam] * ramp + tail * (1.0 - ramp)
+
+        return out
+
+    def _looped_range(self, first: int, stop: int) -> "np.ndarray":
+        """Looped frames [first, stop), sliced straight from the map when no seam is involved"""
+        copy = first // self.period
+        offset = first - copy * self.period
+        if stop <= (copy + 1) * self.period and (copy == 0 or offset >= self.crossfade):
+            out = self.source.samples[offset:offset + stop - first].astype(np.float32)
+            out *= 1.0 / 32768.0
+            return out
+        return self._looped(np.arange(first, stop, dtype=np.int64))
+
+    def block(self, start: int, stop: int) -> "np.ndarray":
+        """Output frames [start, stop) as float32"""
+        if self.silent:
+            return np.zeros((stop - start, self.source.channels), dtype=np.float32)
+        if self.step == 1.0:
+            return self._looped_range(start, stop)
+
+        positions = np.arange(start, stop, dtype=np.float64) * self.step
+        left = positions.astype(np.int64)
+        fraction = (positions - left).astype(np.float32)[:, None]
+
+        # One read covers both interpolation neighbours
+        first = int(left[0])
+        span = self._looped_range(first, int(left[-1]) + 2)
+        left -= first
+        # np.take is much faster than fancy indexing along axis 0
+        out = np.take(span, left, axis=0)
+        right = np.take(span, left + 1, axis=0)
+        right -= out
+        right *= fraction
+        out += right
+        return out
+
+
+def _fade_gain(start: int, stop: int, frames: int, fade_in: int, fade_out: int) -> "np.ndarray | None":
+    """Per-frame fade gain for a block, or None if the block is outside both fades"""
+    if start >= fade_in and stop <= frames - fade_out:
+        return None
+
+    index = np.arange(start, stop, dtype=np.float32)
+    gain = np.ones(stop - start, dtype=np.float32)
+    if fade_in:
+        gain *= np.minimum(index / max(fade_in - 1, 1), 1.0)
+    if fade_out:
+        gain *= np.minimum((frames - 1 - index) / max(fade_out - 1, 1), 1.0)
+    return gain[:, None]
+
+
+def iter_mix_blocks(
+    narration: PCMSource,
+    music: LoopedMusic,
+    music_gain_db: float,
+    fade_in_ms: int,
+    fade_out_ms: int,
+    scale: float = 1.0
+):
+    """
+    Yield mixed float32 blocks at the narration's rate
+
+    Args:
+        scale: Gain applied to the final mix (normalization)
+    """
+    frames = narration.frames
+    rate = narration.rate
+    channels = max(narration.channels, music.source.channels)
+    music_gain = 10 ** (music_gain_db / 20)
+    fade_in = min(frames, int(rate * fade_in_ms / 1000))
+    fade_out = min(frames, int(rate * fade_out_ms / 1000))
+
+    for start in range(0, frames, BLOCK_FRAMES):
+        stop = min(start + BLOCK_FRAMES, frames)
+
+        block = music.block(start, stop)
+        if block.shape[1] < channels:
+            block = np.repeat(block, channels, axis=1)
+        block *= music_gain
+        gain = _fade_gain(start, stop, frames, fade_in, fade_out)
+        if gain is not None:
+            block *= gain
+
+        # Mono narration broadcasts across the music's channels
+        voice = narration.samples[start:stop].astype(np.float32)
+        voice *= 1.0 / 32768.0
+        block += voice
+
+        if scale != 1.0:
+            block *= scale
+        yield block
+
+
+def iter_normalized_pcm(
+    narration: PCMSource,
+    music: LoopedMusic,
+    music_gain_db: float,
+    fade_in_ms: int,
+    fade_out_ms: int
+):
+    """
+    Yield the peak-normalized mix as interleaved 16-bit PCM bytes
+
+    Runs the mix once to find the peak, then again to scale and quantize.
+    """
+    peak = 0.0
+    for block in iter_mix_blocks(narration, music, music_gain_db, fade_in_ms, fade_out_ms):
+        peak = max(peak, float(block.max()), -float(block.min()))
+    scale = (10 ** (-NORMALIZE_HEADROOM_DB / 20)) / peak if peak > 0 else 1.0
+
+    for block in iter_mix_blocks(narration, music, music_gain_db, fade_in_ms, fade_out_ms, scale):
+        np.clip(block, -1.0, 32767 / 32768, out=block)
+        block *= 32768.0
+        np.rint(block, out=block)
+        yield block.astype("<i2").tobytes()
+
+
+def open_inputs(narration_path: str, music_path: str, temp_dir: str, crossfade_ms: int) -> tuple[PCMSource, LoopedMusic]:
+    """Map the narration and set up the looped, resampled music under it"""
+    narration = PCMSource(narration_path, temp_dir)
+    music = LoopedMusic(PCMSource(music_path, temp_dir), narration.rate, narration.frames, crossfade_ms)
+    return narration, music
+
+
+def render_mix_streaming(
+    narration_path: str,
+    music_path: str,
+    output_path: str,
+    music_gain_db: float,
+    crossfade_ms: int,
+    fade_in_ms: int,
+    fade_out_ms: int,
+    renditions: dict[str, str] | None = None
+) -> float:
+    """
+    Mix narration over looped background music straight into the encoders
+
+    Args:
+        renditions: Rendition format -> output file (defaults to every
+            configured rendition next to output_path)
+
+    Returns:
+        Narration duration in seconds
+    """
+    renditions = renditions or rendition_paths(output_path)
+
+    with tempfile.TemporaryDirectory(prefix="mix_") as temp_dir:
+        narration, music = open_inputs(narration_path, music_path, temp_dir, crossfade_ms)
+        channels = max(narration.channels, music.source.channels)
+
+        with tempfile.TemporaryFile() as stderr:
+            encoder = subprocess.Popen(
+                [AudioSegment.converter, "-y", "-loglevel", "error",
+                 "-f", "s16le", "-ar", str(narration.rate), "-ac", str(channels), "-i", "pipe:0"]
+                + output_args(renditions),
+                stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr
+            )
+            try:
+                for pcm in iter_normalized_pcm(narration, music, music_gain_db, fade_in_ms, fade_out_ms):
+                    encoder.stdin.write(pcm)
+                encoder.stdin.close()
+            except BrokenPipeError:
+                # ffmpeg exited early; its exit code and stderr explain why
+                pass
+            except BaseException:
+                encoder.kill()
+                encoder.wait()
+                raise
+
+            if encoder.wait() != 0:
+                stderr.seek(0)
+                raise Exception(f"ffmpeg encode failed: {stderr.read().decode(errors='replace').strip()}")
+
+        return narration.frames / narration.rate
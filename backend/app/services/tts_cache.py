@@ -0,0 +1,203 @@
+"""
+Content-addressed cache for TTS renders
+
+Renders are stored under a hash of everything that affects the audio
+(text, provider, voice, model, emotion, speed, sample rate), so identical
+narration is only paid for once. Entries are evicted least-recently-used
+once the cache grows past its size cap.
+
+The cache size is kept as a running total, counted once at startup, so
+writes and metrics do not walk the cache tree; only eviction does.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Eviction goes this far below the cap, so the next writes do not evict again
+EVICT_TO_FRACTION = 0.9
+
+
+class TTSCache:
+    """On-disk LRU cache of rendered narration"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        Args:
+            cache_dir: Directory holding cached renders
+            max_bytes: Size cap; least recently used entries are evicted beyond it
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        entries = self._entries()
+        self._size_bytes = sum(size for _, size, _ in entries)
+        self._entry_count = len(entries)
+
+    @staticmethod
+    def make_key(text: str, **params) -> str:
+        """Hash the text together with every parameter that changes the audio"""
+        material = json.dumps({"text": text, **params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, extension: str) -> str:
+        """Cache file path, fanned out by key prefix to keep directories small"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{extension}")
+
+    def get(self, key: str, extension: str) -> str | None:
+        """
+        Look up a cached render
+
+        Returns:
+            Path to the cached file, or None on a miss
+        """
+        path = self._path(key, extension)
+        try:
+            # Bump mtime so eviction sees this entry as recently used
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return path
+
+    def get_bytes(self, key: str, extension: str) -> bytes | None:
+        """Cached render contents, or None on a miss"""
+        path = self.get(key, extension)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def copy_to(self, key: str, extension: str, output_path: str) -> bool:
+        """
+        Materialize a cached render at output_path
+
+        Hard-links when possible so a hit costs no extra disk space.
+
+        Returns:
+            True on a hit
+        """
+        path = self.get(key, extension)
+        if path is None:
+            return False
+
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        try:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            os.link(path, output_path)
+        except OSError:
+            shutil.copyfile(path, output_path)
+        return True
+
+    def put_file(self, key: str, extension: str, source_path: str):
+        """Store a copy of a finished render"""
+        self._atomic_write(key, extension, lambda f: self._copy_into(source_path, f))
+
+    def put_bytes(self, key: str, extension: str, data: bytes):
+        """Store raw render bytes"""
+        self._atomic_write(key, extension, lambda f: f.write(data))
+
+    @staticmethod
+    def _copy_into(source_path: str, target):
+        with open(source_path, "rb") as source:
+            shutil.copyfileobj(source, target)
+
+    def _atomic_write(self, key: str, extension: str, write):
+        """Write to a temp file in the cache and rename it into place"""
+        path = self._path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            size = os.path.getsize(tmp_path)
+            with self._lock:
+                try:
+                    replaced = os.path.getsize(path)
+                except OSError:
+                    replaced = None
+                os.replace(tmp_path, path)
+                self._size_bytes += size - (replaced or 0)
+                self._entry_count += replaced is None
+                over_cap = self._size_bytes > self.max_bytes
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if over_cap:
+            self._evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        """(mtime, size, path) for every cached render"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        """
+        Delete least recently used entries until the cache is back under its cap
+
+        Walks the cache, which also corrects the running totals for entries
+        other processes added or removed.
+        """
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            count = len(entries)
+
+            if total > self.max_bytes:
+                for _, size, path in sorted(entries):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    count -= 1
+                    self.evictions += 1
+                    if total <= self.max_bytes * EVICT_TO_FRACTION:
+                        break
+                logger.info(f"TTS cache evicted down to {total / 1024 / 1024:.1f} MB")
+
+            self._size_bytes = total
+            self._entry_count = count
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": self._entry_count,
+            "size_bytes": self._size_bytes,
+            "max_bytes": self.max_bytes
+        }
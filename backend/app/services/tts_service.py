@@ -1,8 +1,13 @@
 import httpx
+import array
+import asyncio
 import base64
+import contextlib
 from app.core.config import settings
 import logging
 import os
+import re
+import sys
 import wave
 import struct
 
@@ -12,8 +17,23 @@ logger = logging.getLogger(__name__)
 class TTSService:
     """Service for Text-to-Speech using Cartesia AI"""
 
-    def __init__(self):
-        """Initialize Cartesia TTS client"""
+    # Voice emotions used for story narration
+    EMOTIONS = ("happy", "sad", "excited", "calm", "fearful")
+
+    SAMPLE_RATE = 44100
+    CHUNK_FADE_MS = 5  # Fade at each chunk edge to avoid clicks at the joins
+
+    def __init__(self, http_client: httpx.AsyncClient | None = None, cache=None):
+        """
+        Initialize Cartesia TTS client
+
+        Args:
+            http_client: Shared keep-alive client; a short-lived client is
+                opened per request when omitted
+            cache: Optional TTSCache consulted per chunk in chunked mode
+        """
+        self.http_client = http_client
+        self.cache = cache
         self.api_key = settings.CARTESIA_API_KEY
         self.model_id = settings.CARTESIA_MODEL_ID
         self.voice_id = settings.CARTESIA_VOICE_ID
@@ -26,7 +46,9 @@ class TTSService:
         output_path: str,
         voice_id: str = None,
         speed: float = 1.0,
-        emotion: str = "happy"
+        emotion: str = "happy",
+        chunked: bool | None = None,
+        streaming: bool | None = None
     ) -> str:
         """
         Generate speech audio from story text using Cartesia TTS
@@ -37,6 +59,11 @@ class TTSService:
             voice_id: Optional voice ID override
             speed: Speech speed (0.6-1.5)
             emotion: Emotion for the voice (neutral, happy, sad, angry, etc.)
+            chunked: Synthesize sentence/paragraph chunks concurrently and join
+                them in order (defaults to settings.TTS_CHUNKED)
+            streaming: Write PCM to the WAV file as it arrives instead of
+                buffering the whole render (defaults to settings.TTS_STREAMING;
+                applies to single-request renders)
 
         Returns:
             Path to the generated audio file
@@ -50,60 +77,272 @@ class TTSService:
             # Use provided voice or default
             voice = voice_id or self.voice_id
 
-            # Prepare request payload
-            payload = {
-                "model_id": self.model_id,
-                "transcript": story_text,
-                "voice": {
-                    "mode": "id",
-                    "id": voice
-                },
-                "output_format": {
-                    "container": "raw",
-                    "encoding": "pcm_s16le",
-                    "sample_rate": 44100
-                },
-                "language": "en"
-            }
+            if chunked is None:
+                chunked = settings.TTS_CHUNKED
+            chunks = self.split_into_chunks(story_text, settings.TTS_CHUNK_MAX_CHARS) if chunked else []
+
+            if streaming is None:
+                streaming = settings.TTS_STREAMING
+
+            if len(chunks) > 1:
+                audio_data = await self._synthesize_chunks(chunks, voice, speed, emotion)
+                self._save_as_wav(audio_data, output_path, sample_rate=self.SAMPLE_RATE, channels=1)
+            elif streaming:
+                # Constant memory: frames go straight into the WAV file
+                await self._synthesize_to_file(story_text, voice, speed, emotion, output_path)
+            else:
+                audio_data = await self._synthesize(story_text, voice, speed, emotion)
+
+                # Convert raw PCM to WAV format
+                self._save_as_wav(audio_data, output_path, sample_rate=self.SAMPLE_RATE, channels=1)
+
+            logger.info(f"Speech generated successfully: {output_path}")
+            return output_path
+
+        except Exception as e:
+            logger.error(f"Error generating speech: {str(e)}")
+            raise Exception(f"Failed to generate speech: {str(e)}")
 
-            # Add generation config for Sonic-3 models
-            if "sonic" in self.model_id.lower():
-                payload["generation_config"] = {
-                    "speed": speed,
-                    "emotion": emotion
-                }
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Cartesia-Version": self.api_version,
-                "Content-Type": "application/json"
+    def get_render_params(self, voice_id: str = None, speed: float = 1.0, emotion: str = "happy") -> dict:
+        """Everything besides the text that changes the rendered audio (cache key material)"""
+        return {
+            "provider": "cartesia",
+            "voice_id": voice_id or self.voice_id,
+            "model_id": self.model_id,
+            "emotion": emotion,
+            "speed": speed,
+            "sample_rate": self.SAMPLE_RATE
+        }
+
+    def _build_request(self, text: str, voice: str, speed: float, emotion: str) -> tuple[dict, dict]:
+        """Build the Cartesia /tts/bytes payload and headers"""
+        payload = {
+            "model_id": self.model_id,
+            "transcript": text,
+            "voice": {
+                "mode": "id",
+                "id": voice
+            },
+            "output_format": {
+                "container": "raw",
+                "encoding": "pcm_s16le",
+                "sample_rate": self.SAMPLE_RATE
+            },
+            "language": "en"
+        }
+
+        # Add generation config for Sonic-3 models
+        if "sonic" in self.model_id.lower():
+            payload["generation_config"] = {
+                "speed": speed,
+                "emotion": emotion
             }
 
-            # Make API request
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/tts/bytes",
-                    json=payload,
-                    headers=headers
-                )
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Cartesia-Version": self.api_version,
+            "Content-Type": "application/json"
+        }
+        return payload, headers
+
+    async def _synthesize(self, text: str, voice: str, speed: float, emotion: str) -> bytes:
+        """Render text in a single request and return raw 16-bit mono PCM"""
+        payload, headers = self._build_request(text, voice, speed, emotion)
+
+        async with self._client() as client:
+            response = await client.post(
+                f"{self.base_url}/tts/bytes",
+                json=payload,
+                headers=headers,
+                timeout=60.0
+            )
+
+            if response.status_code != 200:
+                error_msg = f"Cartesia API error: {response.status_code} - {response.text}"
+                logger.error(error_msg)
+                raise Exception(error_msg)
+
+            return response.content
+
+    async def _synthesize_to_file(
+        self,
+        text: str,
+        voice: str,
+        speed: float,
+        emotion: str,
+        output_path: str
+    ) -> int:
+        """
+        Stream a render from Cartesia straight into a WAV file
+
+        PCM is appended to `<output_path>.part` as it arrives (the wave
+        module patches the header sizes when the file is closed) and the
+        file is renamed into place once complete, so readers never see a
+        truncated WAV under the final name.
+
+        Returns:
+            Number of PCM bytes written
+        """
+        payload, headers = self._build_request(text, voice, speed, emotion)
+        partial_path = f"{output_path}.part"
+        bytes_written = 0
 
+        async with self._client() as client:
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/tts/bytes",
+                json=payload,
+                headers=headers,
+                timeout=60.0
+            ) as response:
                 if response.status_code != 200:
-                    error_msg = f"Cartesia API error: {response.status_code} - {response.text}"
+                    body = await response.aread()
+                    error_msg = f"Cartesia API error: {response.status_code} - {body.decode(errors='replace')}"
                     logger.error(error_msg)
                     raise Exception(error_msg)
 
-                # Get audio data
-                audio_data = response.content
+                try:
+                    with wave.open(partial_path, 'wb') as wav_file:
+                        wav_file.setnchannels(1)
+                        wav_file.setsampwidth(2)  # 16-bit = 2 bytes
+                        wav_file.setframerate(self.SAMPLE_RATE)
 
-                # Convert raw PCM to WAV format
-                self._save_as_wav(audio_data, output_path, sample_rate=44100, channels=1)
+                        # Network chunks can split a sample; carry the odd byte over
+                        remainder = b""
+                        async for chunk in response.aiter_bytes():
+                            data = remainder + chunk
+                            usable = len(data) - len(data) % 2
+                            wav_file.writeframesraw(data[:usable])
+                            remainder = data[usable:]
+                            bytes_written += usable
 
-                logger.info(f"Speech generated successfully: {output_path}")
-                return output_path
+                    os.replace(partial_path, output_path)
+                except BaseException:
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+                    raise
 
-        except Exception as e:
-            logger.error(f"Error generating speech: {str(e)}")
-            raise Exception(f"Failed to generate speech: {str(e)}")
+        logger.info(f"Streamed {bytes_written} bytes of narration to {output_path}")
+        return bytes_written
+
+    async def _synthesize_chunks(
+        self,
+        chunks: list[tuple[str, bool]],
+        voice: str,
+        speed: float,
+        emotion: str
+    ) -> bytes:
+        """
+        Render chunks concurrently and join them in their original order
+
+        Each chunk is retried on its own, so one failed request does not
+        re-render the whole story.
+        """
+        semaphore = asyncio.Semaphore(settings.TTS_CHUNK_CONCURRENCY)
+
+        render_params = self.get_render_params(voice, speed, emotion)
+
+        async def render(index: int, text: str) -> bytes:
+            # Sentence-level cache: an edited story only re-renders changed chunks
+            cache_key = self.cache.make_key(text, **render_params) if self.cache else None
+            if cache_key:
+                cached = self.cache.get_bytes(cache_key, "pcm")
+                if cached is not None:
+                    return cached
+
+            for attempt in range(settings.TTS_CHUNK_RETRIES + 1):
+                try:
+                    async with semaphore:
+                        pcm = await self._synthesize(text, voice, speed, emotion)
+                    if cache_key:
+                        self.cache.put_bytes(cache_key, "pcm", pcm)
+                    return pcm
+                except Exception as e:
+                    if attempt == settings.TTS_CHUNK_RETRIES:
+                        raise Exception(f"Chunk {index + 1}/{len(chunks)} failed: {str(e)}")
+                    logger.warning(f"Chunk {index + 1}/{len(chunks)} failed (attempt {attempt + 1}), retrying: {str(e)}")
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+
+        logger.info(f"Synthesizing {len(chunks)} chunks (concurrency {settings.TTS_CHUNK_CONCURRENCY})")
+        rendered = await asyncio.gather(*(render(i, text) for i, (text, _) in enumerate(chunks)))
+
+        return self._join_pcm(rendered, [paragraph_end for _, paragraph_end in chunks])
+
+    def _join_pcm(self, segments: list[bytes], paragraph_ends: list[bool]) -> bytes:
+        """
+        Join PCM segments with short fades and silence at each boundary
+
+        Sentence joins get TTS_CHUNK_GAP_MS of silence, paragraph joins twice
+        that, so the seams sound like natural pauses rather than clicks.
+        """
+        gap = self._silence(settings.TTS_CHUNK_GAP_MS)
+        fade_samples = int(self.SAMPLE_RATE * self.CHUNK_FADE_MS / 1000)
+
+        parts = []
+        for index, segment in enumerate(segments):
+            parts.append(self._fade_edges(segment, fade_samples))
+            if index < len(segments) - 1:
+                parts.append(gap * 2 if paragraph_ends[index] else gap)
+        return b"".join(parts)
+
+    def _silence(self, duration_ms: int) -> bytes:
+        """16-bit mono silence"""
+        return b"\x00\x00" * int(self.SAMPLE_RATE * duration_ms / 1000)
+
+    @staticmethod
+    def _fade_edges(pcm: bytes, fade_samples: int) -> bytes:
+        """Apply a linear fade-in/out of fade_samples to 16-bit mono PCM"""
+        samples = array.array("h")
+        samples.frombytes(pcm[:len(pcm) - len(pcm) % 2])
+        if sys.byteorder != "little":
+            samples.byteswap()
+
+        fade = min(fade_samples, len(samples) // 2)
+        for i in range(fade):
+            gain = i / fade
+            samples[i] = int(samples[i] * gain)
+            samples[-1 - i] = int(samples[-1 - i] * gain)
+
+        if sys.byteorder != "little":
+            samples.byteswap()
+        return samples.tobytes()
+
+    @staticmethod
+    def split_into_chunks(text: str, max_chars: int) -> list[tuple[str, bool]]:
+        """
+        Split text at paragraph and sentence boundaries
+
+        Sentences are packed into chunks of up to max_chars; a chunk never
+        spans a paragraph break. A single sentence longer than max_chars
+        becomes its own chunk.
+
+        Returns:
+            List of (chunk_text, ends_paragraph)
+        """
+        chunks = []
+        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+        for paragraph in paragraphs:
+            sentences = re.split(r"(?<=[.!?…])\s+|(?<=[.!?…][\"'”’)])\s+", paragraph)
+            current = ""
+            for sentence in (s.strip() for s in sentences):
+                if not sentence:
+                    continue
+                if current and len(current) + 1 + len(sentence) > max_chars:
+                    chunks.append((current, False))
+                    current = sentence
+                else:
+                    current = f"{current} {sentence}" if current else sentence
+            if current:
+                chunks.append((current, True))
+
+        return chunks
+
+    def _client(self):
+        """Shared client (left open on exit) or a fresh per-request client"""
+        if self.http_client is not None and not self.http_client.is_closed:
+            return contextlib.nullcontext(self.http_client)
+        return httpx.AsyncClient(timeout=60.0)
 
     def _save_as_wav(self, pcm_data: bytes, output_path: str, sample_rate: int = 44100, channels: int = 1):
         """
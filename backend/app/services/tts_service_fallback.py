@@ -18,6 +18,14 @@ class TTSServiceFallback:
         """Initialize fallback TTS service"""
         logger.warning("Using FALLBACK TTS service (gTTS). Install Azure credentials for production quality.")
 
+    def get_render_params(self) -> dict:
+        """Everything besides the text that changes the rendered audio (cache key material)"""
+        return {
+            "provider": "gtts",
+            "lang": "en",
+            "slow": False
+        }
+
     async def generate_speech(
         self,
         story_text: str,
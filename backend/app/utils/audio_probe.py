@@ -0,0 +1,231 @@
+"""
+Audio duration from file headers
+
+Reads WAV headers and MP3 frame headers (with Xing/Info/VBRI frame counts)
+instead of decoding the whole file, and only falls back to a full pydub
+decode for formats it does not understand. Results are cached by path,
+modification time and size, so repeated lookups are free and a rewritten
+file is probed again.
+"""
+
+import logging
+import mmap
+import os
+import struct
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# MPEG audio tables, indexed by [version][layer] where version is 1 (MPEG-1)
+# or 2 (MPEG-2 and 2.5) and layer is 1-3
+MP3_BITRATES_KBPS = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {
+    "1": (44100, 48000, 32000),
+    "2": (22050, 24000, 16000),
+    "2.5": (11025, 12000, 8000),
+}
+
+# Give up looking for the first frame after this much junk
+MP3_SYNC_SEARCH_BYTES = 64 * 1024
+
+
+def read_wav_header(path: str) -> dict | None:
+    """
+    Parse the RIFF/WAVE header
+
+    Returns:
+        Dict with 'format', 'channels', 'rate', 'bits', 'block_align',
+        'byte_rate', 'offset' (start of the PCM data) and 'data_size',
+        or None if the file is not a readable WAV
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(12)
+            if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+                return None
+
+            fmt = None
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    return None
+                chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+
+                if chunk_id == b"fmt ":
+                    fmt = struct.unpack("<HHIIHH", f.read(16))
+                    f.seek(size - 16 + (size & 1), os.SEEK_CUR)
+                elif chunk_id == b"data":
+                    if fmt is None:
+                        return None
+                    audio_format, channels, rate, byte_rate, block_align, bits = fmt
+                    offset = f.tell()
+                    # Streamed writers may leave a placeholder size; trust the file length
+                    data_size = min(size, os.path.getsize(path) - offset)
+                    return {
+                        "format": audio_format,
+                        "channels": channels,
+                        "rate": rate,
+                        "bits": bits,
+                        "block_align": block_align,
+                        "byte_rate": byte_rate,
+                        "offset": offset,
+                        "data_size": data_size
+                    }
+                else:
+                    f.seek(size + (size & 1), os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+
+def _wav_duration(path: str) -> float | None:
+    header = read_wav_header(path)
+    if header is None or not header["byte_rate"]:
+        return None
+    return header["data_size"] / header["byte_rate"]
+
+
+def _parse_mp3_header(word: int) -> dict | None:
+    """Decode a 32-bit MPEG audio frame header, or None if it is not one"""
+    if word >> 21 != 0x7FF:
+        return None
+
+    version_bits = (word >> 19) & 0x3
+    layer_bits = (word >> 17) & 0x3
+    bitrate_index = (word >> 12) & 0xF
+    rate_index = (word >> 10) & 0x3
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    version = {0: "2.5", 2: "2", 3: "1"}[version_bits]
+    layer = 4 - layer_bits
+    family = 1 if version == "1" else 2
+    bitrate = MP3_BITRATES_KBPS[(family, layer)][bitrate_index] * 1000
+    rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (word >> 9) & 0x1
+    mono = ((word >> 6) & 0x3) == 3
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or family == 1) else 576
+        length = (samples // 8) * bitrate // rate + padding
+
+    return {
+        "family": family,
+        "layer": layer,
+        "rate": rate,
+        "samples": samples,
+        "length": length,
+        "mono": mono
+    }
+
+
+def _id3v2_size(data) -> int:
+    """Bytes taken by a leading ID3v2 tag (0 if there is none)"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _mp3_duration(path: str) -> float | None:
+    size = os.path.getsize(path)
+    if size < 4:
+        return None
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        end = size - 128 if data[size - 128:size - 125] == b"TAG" else size
+
+        # Find the first frame whose successor also parses (rules out false syncs)
+        position = _id3v2_size(data)
+        limit = min(end - 4, position + MP3_SYNC_SEARCH_BYTES)
+        first = None
+        while position < limit:
+            frame = _parse_mp3_header(struct.unpack_from(">I", data, position)[0])
+            if frame and frame["length"]:
+                following = position + frame["length"]
+                if following + 4 > end or _parse_mp3_header(struct.unpack_from(">I", data, following)[0]):
+                    first = frame
+                    break
+            position += 1
+        if first is None:
+            return None
+
+        # Xing/Info (LAME, ffmpeg) or VBRI (Fraunhofer) headers carry the frame count
+        side_info = (32 if not first["mono"] else 17) if first["family"] == 1 else (17 if not first["mono"] else 9)
+        xing = position + 4 + side_info
+        if data[xing:xing + 4] in (b"Xing", b"Info"):
+            flags = struct.unpack_from(">I", data, xing + 4)[0]
+            if flags & 0x1:
+                frames = struct.unpack_from(">I", data, xing + 8)[0]
+                return frames * first["samples"] / first["rate"]
+
+        vbri = position + 4 + 32
+        if data[vbri:vbri + 4] == b"VBRI":
+            frames = struct.unpack_from(">I", data, vbri + 14)[0]
+            return frames * first["samples"] / first["rate"]
+
+        # No summary header: walk the frame headers
+        samples = 0
+        while position + 4 <= end:
+            frame = _parse_mp3_header(struct.unpack_from(">I", data, position)[0])
+            if frame is None or not frame["length"]:
+                break
+            samples += frame["samples"]
+            position += frame["length"]
+
+        return samples / first["rate"]
+
+
+def _decode_duration(path: str) -> float:
+    from pydub import AudioSegment
+
+    return len(AudioSegment.from_file(path)) / 1000.0
+
+
+@lru_cache(maxsize=1024)
+def _probe(path: str, mtime_ns: int, size: int, decode_fallback: bool) -> float | None:
+    with open(path, "rb") as f:
+        magic = f.read(4)
+
+    if magic == b"RIFF":
+        duration = _wav_duration(path)
+    else:
+        duration = _mp3_duration(path)
+
+    if duration is None and decode_fallback:
+        logger.info(f"No header duration for {os.path.basename(path)}, decoding")
+        duration = _decode_duration(path)
+
+    return duration
+
+
+def probe_duration(path: str, decode_fallback: bool = True) -> float | None:
+    """
+    Duration of an audio file in seconds
+
+    Args:
+        path: Audio file
+        decode_fallback: Decode the whole file with pydub when the headers
+            are not understood (otherwise return None)
+
+    Returns:
+        Duration in seconds, or None if unknown and decode_fallback is off
+
+    Raises:
+        OSError: If the file cannot be read
+    """
+    stat = os.stat(path)
+    return _probe(path, stat.st_mtime_ns, stat.st_size, decode_fallback)
@@ -0,0 +1,215 @@
+"""
+File responses with HTTP caching and byte ranges
+
+Starlette's FileResponse always sends the whole file with a weak
+mtime/size ETag. RangeFileResponse adds what players and CDNs rely on:
+conditional requests (If-None-Match / If-Modified-Since -> 304), single
+and multi-range requests (206, multipart/byteranges), If-Range and 416
+for unsatisfiable ranges.
+"""
+
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+# More ranges than this in one request is treated as abuse and answered whole
+MAX_RANGES = 16
+
+# Headers a 304 may repeat (RFC 9110 section 15.4.5)
+NOT_MODIFIED_HEADERS = (b"cache-control", b"content-location", b"date", b"etag", b"expires", b"last-modified", b"vary")
+
+
+def _etag_matches(header: str, etag: str, weak: bool = True) -> bool:
+    """Whether an If-None-Match / If-Range list contains the ETag"""
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if not weak and candidate.startswith("W/"):
+            continue
+        if candidate.removeprefix("W/") == etag.removeprefix("W/"):
+            return True
+    return False
+
+
+def parse_ranges(header: str, size: int) -> list[tuple[int, int]] | None:
+    """
+    Parse a Range header against a file size
+
+    Returns:
+        Sorted, coalesced (start, end) byte ranges with inclusive ends, an
+        empty list if none is satisfiable, or None if the header should be
+        ignored (not bytes, malformed or too many ranges)
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    parts = spec.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+
+    for part in parts:
+        first, dash, last = part.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+            else:
+                # Suffix range: the last N bytes
+                suffix = int(last)
+                if suffix == 0:
+                    continue
+                start, end = max(0, size - suffix), size - 1
+        except ValueError:
+            return None
+
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse that answers conditional and Range requests"""
+
+    def __init__(
+        self,
+        path: str,
+        etag: str | None = None,
+        cache_control: str | None = None,
+        headers: dict | None = None,
+        **kwargs
+    ):
+        """
+        Args:
+            path: File to send
+            etag: Strong ETag (quoted); defaults to Starlette's mtime/size tag
+            cache_control: Cache-Control header value
+            headers: Extra response headers
+            **kwargs: Passed to FileResponse (media_type, filename, ...)
+        """
+        headers = dict(headers or {})
+        headers["Accept-Ranges"] = "bytes"
+        if etag:
+            headers["ETag"] = etag
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        super().__init__(path, headers=headers, stat_result=os.stat(path), **kwargs)
+
+    def _not_modified(self, request_headers: Headers) -> bool:
+        etag = self.headers.get("etag")
+        if "if-none-match" in request_headers:
+            # If-Modified-Since is ignored when If-None-Match is present
+            return bool(etag) and _etag_matches(request_headers["if-none-match"], etag)
+
+        if "if-modified-since" in request_headers:
+            try:
+                since = parsedate_to_datetime(request_headers["if-modified-since"]).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(self.stat_result.st_mtime) <= since
+
+        return False
+
+    def _if_range_allows(self, request_headers: Headers) -> bool:
+        """Honour Range only if the client's copy is still the current file"""
+        if_range = request_headers.get("if-range")
+        if if_range is None:
+            return True
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            etag = self.headers.get("etag")
+            return bool(etag) and not etag.startswith("W/") and _etag_matches(if_range, etag, weak=False)
+        return if_range == formatdate(self.stat_result.st_mtime, usegmt=True)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        method = scope["method"].upper()
+        size = self.stat_result.st_size
+
+        if method in ("GET", "HEAD") and self._not_modified(request_headers):
+            headers = [(key, value) for key, value in self.raw_headers if key in NOT_MODIFIED_HEADERS]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        ranges = None
+        if method == "GET" and "range" in request_headers and self._if_range_allows(request_headers):
+            ranges = parse_ranges(request_headers["range"], size)
+
+        if ranges is None:
+            await super().__call__(scope, receive, send)
+            return
+
+        if not ranges:
+            headers = [(key, value) for key, value in self.raw_headers if key not in (b"content-length", b"content-type")]
+            headers += [(b"content-range", f"bytes */{size}".encode()), (b"content-length", b"0")]
+            await send({"type": "http.response.start", "status": 416, "headers": headers})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        headers = [(key, value) for key, value in self.raw_headers if key not in (b"content-length", b"content-type")]
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers += [
+                (b"content-type", self.media_type.encode()),
+                (b"content-range", f"bytes {start}-{end}/{size}".encode()),
+                (b"content-length", str(end - start + 1).encode())
+            ]
+            parts = [(b"", start, end)]
+            closing = b""
+        else:
+            boundary = secrets.token_hex(16)
+            parts = [
+                (
+                    f"--{boundary}\r\nContent-Type: {self.media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n".encode(),
+                    start,
+                    end
+                )
+                for start, end in ranges
+            ]
+            closing = f"--{boundary}--\r\n".encode()
+            # Each part's data is followed by CRLF before the next boundary
+            length = sum(len(preamble) + end - start + 1 + 2 for preamble, start, end in parts) + len(closing)
+            headers += [
+                (b"content-type", f"multipart/byteranges; boundary={boundary}".encode()),
+                (b"content-length", str(length).encode())
+            ]
+
+        await send({"type": "http.response.start", "status": 206, "headers": headers})
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for preamble, start, end in parts:
+                if preamble:
+                    await send({"type": "http.response.body", "body": preamble, "more_body": True})
+                await file.seek(start)
+                remaining = end - start + 1
+                while remaining:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                if closing:
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,38 @@
+"""
+Hashed two-level directory layout
+
+Keeping every file in one directory makes listings, inode lookups and
+backups slow once it holds hundreds of thousands of entries. Sharded paths
+spread files over 65,536 directories named after the first two bytes of a
+hash: root/3f/a9/<name>. Content-addressed files use their own digest;
+anything else the SHA-256 of its name, so a path can be computed from the
+name alone.
+"""
+
+import hashlib
+import os
+import re
+
+# Two levels of two hex characters: 256 * 256 directories
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+HEX_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def shard_dirs(name: str, digest: str | None = None) -> list[str]:
+    """
+    Directory names a file is sharded into
+
+    Args:
+        name: File or directory name
+        digest: Hex digest to shard by (SHA-256 of name by default)
+    """
+    if digest is None or not HEX_DIGEST.match(digest):
+        digest = hashlib.sha256(name.encode()).hexdigest()
+    return [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+
+
+def shard_path(root: str, name: str, digest: str | None = None) -> str:
+    """Path of name under root in the sharded layout"""
+    return os.path.join(root, *shard_dirs(name, digest), name)
@@ -0,0 +1,247 @@
+"""
+Standalone story generation worker
+
+Claims PENDING stories from the database with a renewable lease, so any
+number of worker processes on any number of machines can share the queue:
+
+    python -m app.worker --concurrency 4
+
+Set GENERATION_BACKEND=worker on the API nodes so they only enqueue stories.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import func, update
+from app.core.config import settings
+from app.core.database import SessionLocal, init_db
+from app.models.story import Story, StoryStatus
+from app.services.container import services
+from app.services.story_scheduler import (
+    GenerationJob, release_lease, renew_lease, requeue_expired_leases, run_generation_job
+)
+
+logger = logging.getLogger(__name__)
+
+
+def claim_next_story(worker_id: str, lease_seconds: int) -> GenerationJob | None:
+    """
+    Claim the oldest PENDING story for this worker
+
+    Uses SELECT ... FOR UPDATE SKIP LOCKED on PostgreSQL. Other databases
+    (SQLite) get a compare-and-set UPDATE that only succeeds while the row
+    is still PENDING, which is safe because their writes are serialized.
+
+    Returns:
+        The claimed job, or None if the queue is empty
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        lease_expires_at = now + timedelta(seconds=lease_seconds)
+        pending = (
+            db.query(Story)
+            .filter(Story.status == StoryStatus.PENDING)
+            .order_by(Story.queued_at, Story.id)
+        )
+
+        if db.bind.dialect.name == "postgresql":
+            story = pending.with_for_update(skip_locked=True).first()
+            if not story:
+                db.rollback()
+                return None
+            story.status = StoryStatus.GENERATING_TEXT
+            story.lease_owner = worker_id
+            story.lease_expires_at = lease_expires_at
+            story.attempts = (story.attempts or 0) + 1
+            db.commit()
+        else:
+            # Another worker may win the race for a candidate; try the next one
+            story = None
+            for candidate in pending.limit(5).all():
+                result = db.execute(
+                    update(Story)
+                    .where(Story.id == candidate.id, Story.status == StoryStatus.PENDING)
+                    .values(
+                        status=StoryStatus.GENERATING_TEXT,
+                        lease_owner=worker_id,
+                        lease_expires_at=lease_expires_at,
+                        attempts=func.coalesce(Story.attempts, 0) + 1
+                    )
+                )
+                db.commit()
+                if result.rowcount == 1:
+                    story = candidate
+                    db.refresh(story)
+                    break
+            if not story:
+                return None
+
+        logger.info(f"[{worker_id}] Claimed story {story.id} (attempt {story.attempts})")
+        return GenerationJob(
+            story_id=story.id,
+            theme=story.theme,
+            character_name=story.character_name,
+            age_group=story.age_group
+        )
+
+    finally:
+        db.close()
+
+
+class StoryWorker:
+    """Runs claim → generate → release loops until stopped"""
+
+    def __init__(
+        self,
+        concurrency: int,
+        lease_seconds: int,
+        poll_interval: float,
+        max_attempts: int
+    ):
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Ask all loops to finish"""
+        logger.info(f"[{self.worker_id}] Stopping worker...")
+        self._stopping.set()
+
+    async def run(self):
+        """Run the slot loops and the lease reaper until stopped"""
+        logger.info(
+            f"[{self.worker_id}] Worker started: concurrency {self.concurrency}, "
+            f"lease {self.lease_seconds}s"
+        )
+        await asyncio.gather(
+            self._reaper(),
+            *(self._slot(i) for i in range(self.concurrency))
+        )
+        logger.info(f"[{self.worker_id}] Worker stopped")
+
+    async def _sleep(self, seconds: float):
+        """Sleep unless the worker is asked to stop first"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _reaper(self):
+        """Periodically requeue stories abandoned by dead workers"""
+        while not self._stopping.is_set():
+            try:
+                await asyncio.to_thread(requeue_expired_leases, self.max_attempts)
+            except Exception as e:
+                logger.error(f"[{self.worker_id}] Error requeueing expired leases: {str(e)}")
+            await self._sleep(self.lease_seconds / 2)
+
+    async def _slot(self, index: int):
+        """Claim and process stories one at a time"""
+        slot_id = f"{self.worker_id}:{index}"
+
+        while not self._stopping.is_set():
+            try:
+                job = await asyncio.to_thread(claim_next_story, slot_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"[{slot_id}] Error claiming story: {str(e)}")
+                job = None
+
+            if job is None:
+                await self._sleep(self.poll_interval)
+                continue
+
+            await self._process(slot_id, job)
+
+    async def _process(self, slot_id: str, job: GenerationJob):
+        """Generate one story while heartbeating its lease"""
+        generation = asyncio.create_task(run_generation_job(job, worker_id=slot_id))
+        stopping = asyncio.create_task(self._stopping.wait())
+        requeue = False
+
+        try:
+            while not generation.done():
+                done, _ = await asyncio.wait(
+                    {generation, stopping},
+                    timeout=self.lease_seconds / 3,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if generation in done:
+                    break
+
+                if stopping in done:
+                    # Hand the story back so another worker can pick it up now
+                    logger.warning(f"[{slot_id}] Shutting down, requeueing story {job.story_id}")
+                    generation.cancel()
+                    requeue = True
+                    break
+
+                renewed = await asyncio.to_thread(
+                    renew_lease, job.story_id, slot_id, self.lease_seconds
+                )
+                if not renewed:
+                    logger.warning(f"[{slot_id}] Lost lease on story {job.story_id}, abandoning it")
+                    generation.cancel()
+                    break
+
+            await asyncio.gather(generation, return_exceptions=True)
+
+        finally:
+            stopping.cancel()
+            await asyncio.to_thread(release_lease, job.story_id, slot_id, requeue)
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="StoryMagic story generation worker")
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.GENERATION_MAX_CONCURRENCY,
+        help="Stories generated at the same time by this process"
+    )
+    parser.add_argument(
+        "--lease-seconds", type=int, default=settings.WORKER_LEASE_SECONDS,
+        help="How long a claim stays valid without a heartbeat"
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=settings.WORKER_POLL_INTERVAL_SECONDS,
+        help="Seconds to wait when the queue is empty"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=getattr(logging, settings.LOG_LEVEL),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    os.makedirs(settings.STORIES_DIR, exist_ok=True)
+    init_db()
+
+    worker = StoryWorker(
+        concurrency=args.concurrency,
+        lease_seconds=args.lease_seconds,
+        poll_interval=args.poll_interval,
+        max_attempts=settings.WORKER_MAX_ATTEMPTS
+    )
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        await services.start()
+        try:
+            await worker.run()
+        finally:
+            await services.aclose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
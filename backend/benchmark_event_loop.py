@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark event-loop latency while stories are generated concurrently
+
+A probe task sleeps for a fixed interval and records how late it wakes up.
+With the async Gemini API the lag stays flat as N grows; with blocking
+calls every story stalls the loop (and every other request) for seconds.
+
+Usage:
+    python benchmark_event_loop.py --stories 4 --mode async
+    python benchmark_event_loop.py --stories 4 --mode blocking
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.story_generator import StoryGeneratorService
+from app.core.config import settings
+
+
+PROBE_INTERVAL = 0.01  # seconds
+
+
+async def probe_loop_lag(samples: list, stop: asyncio.Event):
+    """Record how late the loop wakes a 10 ms sleeper"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def generate_blocking(service: StoryGeneratorService, theme: str):
+    """The previous behaviour: synchronous calls inside a coroutine"""
+    prompt = service.create_story_prompt(theme, None, "5-7")
+    response = service.model.generate_content(prompt)
+    service.model.generate_content(f"Create a short title for:\n\n{response.text[:500]}")
+
+
+async def run(stories: int, mode: str):
+    service = StoryGeneratorService()
+    samples: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(samples, stop))
+
+    themes = [f"A curious fox who finds lost thing number {i}" for i in range(stories)]
+    start = time.perf_counter()
+    if mode == "async":
+        await asyncio.gather(*(service.generate_story(theme) for theme in themes))
+    else:
+        await asyncio.gather(*(generate_blocking(service, theme) for theme in themes))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe
+
+    lags_ms = sorted(lag * 1000 for lag in samples) or [0.0]
+    p99 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))]
+    print(f"mode={mode} stories={stories} wall={elapsed:.2f}s probes={len(samples)}")
+    print(
+        f"loop lag ms: p50={statistics.median(lags_ms):.2f} "
+        f"p99={p99:.2f} max={lags_ms[-1]:.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stories", type=int, default=4, help="Stories generated concurrently")
+    parser.add_argument("--mode", choices=["async", "blocking"], default="async")
+    args = parser.parse_args()
+
+    if not settings.GEMINI_API_KEY:
+        print("❌ ERROR: GEMINI_API_KEY not found in environment")
+        return 1
+
+    asyncio.run(run(args.stories, args.mode))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark Lyria music capture: length accuracy, memory and latency
+
+Compares the previous wall-clock capture (stop after N seconds of elapsed
+time, buffer every chunk in a list, join at the end) with the byte-counted
+capture in MusicService.capture_audio (stop after N seconds of PCM frames,
+stream chunks straight to the WAV file).
+
+By default a simulated session streams 2 s chunks at --speed x real time,
+so the benchmark runs offline and is repeatable. --live uses a real Lyria
+RealTime session instead (needs GEMINI_API_KEY).
+
+Usage:
+    python benchmark_lyria_capture.py --durations 10 30 60 --speed 4
+    python benchmark_lyria_capture.py --durations 15 --live
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.music_service import MusicService
+from app.core.config import settings
+
+
+CHUNK_SECONDS = 2.0
+
+
+class SimulatedSession:
+    """Yields Lyria-shaped messages carrying silent PCM at a fixed rate"""
+
+    def __init__(self, speed: float):
+        self.speed = speed
+
+    async def receive(self):
+        chunk = bytes(int(CHUNK_SECONDS * MusicService.SAMPLE_RATE) * MusicService.FRAME_BYTES)
+        while True:
+            await asyncio.sleep(CHUNK_SECONDS / self.speed)
+            yield SimpleNamespace(server_content=SimpleNamespace(
+                audio_chunks=[SimpleNamespace(data=chunk)]
+            ))
+
+
+async def capture_wallclock(session, duration: float, output_path: str):
+    """The previous behaviour: elapsed time decides when to stop"""
+    audio_chunks = []
+    start_time = asyncio.get_event_loop().time()
+    async for message in session.receive():
+        if message.server_content and message.server_content.audio_chunks:
+            for audio_chunk in message.server_content.audio_chunks:
+                audio_chunks.append(audio_chunk.data)
+        if asyncio.get_event_loop().time() - start_time >= duration:
+            break
+
+    with wave.open(output_path, 'wb') as wav_file:
+        wav_file.setnchannels(MusicService.CHANNELS)
+        wav_file.setsampwidth(MusicService.SAMPLE_WIDTH)
+        wav_file.setframerate(MusicService.SAMPLE_RATE)
+        wav_file.writeframes(b''.join(audio_chunks))
+
+
+async def open_session(service: MusicService, live: bool, speed: float):
+    """Async context manager yielding a playing session"""
+    if not live:
+        class _Simulated:
+            async def __aenter__(self):
+                return SimulatedSession(speed)
+
+            async def __aexit__(self, *exc):
+                return False
+        return _Simulated()
+
+    class _Live:
+        async def __aenter__(self):
+            self._cm = service.client.aio.live.music.connect(model=service.model)
+            session = await self._cm.__aenter__()
+            await service._configure_session(session, service.MOOD_PROMPTS["calm"])
+            await session.play()
+            return session
+
+        async def __aexit__(self, *exc):
+            return await self._cm.__aexit__(*exc)
+    return _Live()
+
+
+async def measure(service: MusicService, mode: str, duration: float, live: bool, speed: float, work_dir: str):
+    output_path = os.path.join(work_dir, f"{mode}_{duration:g}s.wav")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    async with await open_session(service, live, speed) as session:
+        if mode == "wallclock":
+            await capture_wallclock(session, duration, output_path)
+        else:
+            await service.capture_audio(session, duration, output_path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with wave.open(output_path, 'rb') as wav_file:
+        captured = wav_file.getnframes() / wav_file.getframerate()
+
+    print(
+        f"{mode:<9} requested={duration:>6.1f}s captured={captured:>7.2f}s "
+        f"error={captured - duration:>+7.2f}s wall={elapsed:>6.2f}s "
+        f"peak_mem={peak / 1024 / 1024:>7.1f} MB"
+    )
+
+
+async def run(durations: list[float], live: bool, speed: float):
+    service = MusicService()
+    source = "live Lyria" if live else f"simulated stream at {speed:g}x real time"
+    print(f"Source: {source}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for duration in durations:
+            for mode in ("wallclock", "bytes"):
+                await measure(service, mode, duration, live, speed, work_dir)
+
+    await service.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[10, 30, 60], help="Seconds of music to capture")
+    parser.add_argument("--speed", type=float, default=4.0, help="Simulated stream speed relative to real time")
+    parser.add_argument("--live", action="store_true", help="Capture from a real Lyria RealTime session")
+    args = parser.parse_args()
+
+    if not settings.GEMINI_API_KEY:
+        print("❌ ERROR: GEMINI_API_KEY not found in environment")
+        return 1
+
+    asyncio.run(run(args.durations, args.live, args.speed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
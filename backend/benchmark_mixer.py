@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark the mixing engines on 1-, 4- and 15-minute stories
+
+Synthesizes a 44.1 kHz mono narration of each length and a 90 s 48 kHz
+stereo music bed (the shapes TTS and Lyria produce), then mixes them with
+the pydub, NumPy and block-streaming engines, reporting wall time,
+throughput and peak traced memory.
+
+By default only decode + DSP is timed, since MP3 encoding is identical for
+those engines; --encode times complete renders to MP3 and adds the ffmpeg
+filter-graph engine (needs ffmpeg).
+
+Usage:
+    python benchmark_mixer.py --minutes 1 4 15
+    python benchmark_mixer.py --minutes 4 --encode
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.audio_mixer import AudioMixerService
+from app.services import numpy_mixer, stream_mixer
+from app.core.config import settings
+
+
+MUSIC_BED_SECONDS = 90
+
+
+def write_wav(path: str, samples: np.ndarray, rate: int):
+    with wave.open(path, 'wb') as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(samples.astype("<i2").tobytes())
+
+
+def make_inputs(work_dir: str, minutes: float) -> tuple[str, str]:
+    """Speech-like bursts for narration, a chord for music"""
+    rng = np.random.default_rng(0)
+
+    rate = 44100
+    t = np.arange(int(minutes * 60 * rate)) / rate
+    envelope = (np.sin(2 * np.pi * 0.7 * t) > -0.3).astype(np.float32)
+    narration = (envelope * (6000 * np.sin(2 * np.pi * 180 * t) + rng.normal(0, 800, t.size)))[:, None]
+    narration_path = os.path.join(work_dir, f"narration_{minutes:g}m.wav")
+    write_wav(narration_path, narration, rate)
+
+    rate = 48000
+    t = np.arange(MUSIC_BED_SECONDS * rate) / rate
+    chord = sum(np.sin(2 * np.pi * f * t) for f in (220.0, 277.2, 329.6)) * 6000
+    music = np.stack([chord, np.roll(chord, 240)], axis=1)
+    music_path = os.path.join(work_dir, "music_bed.wav")
+    if not os.path.exists(music_path):
+        write_wav(music_path, music, rate)
+
+    return narration_path, music_path
+
+
+def measure(label: str, render, audio_seconds: float):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = render()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"  {label:<6} wall={elapsed:>7.2f}s throughput={audio_seconds / elapsed:>6.1f}x realtime "
+        f"peak_mem={peak / 1024 / 1024:>8.1f} MB"
+    )
+    return result
+
+
+def run(minutes_list: list[float], encode: bool):
+    mixer = AudioMixerService()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for minutes in minutes_list:
+            narration_path, music_path = make_inputs(work_dir, minutes)
+            print(f"{minutes:g}-minute story")
+            audio_seconds = minutes * 60
+
+            if encode:
+                for engine in ("pydub", "numpy", "stream", "ffmpeg"):
+                    settings.MIX_ENGINE = engine
+                    output_path = os.path.join(work_dir, f"mix_{engine}.mp3")
+                    measure(engine, lambda: mixer.mix_audio_sync(narration_path, music_path, output_path), audio_seconds)
+                continue
+
+            pydub_mix, _ = measure("pydub", lambda: mixer._render_pydub(narration_path, music_path, 20), audio_seconds)
+            numpy_mix, _ = measure("numpy", lambda: numpy_mixer.render_mix(
+                narration_path, music_path,
+                music_gain_db=-20,
+                crossfade_ms=mixer.LOOP_CROSSFADE_MS,
+                fade_in_ms=mixer.MUSIC_FADE_IN_MS,
+                fade_out_ms=mixer.MUSIC_FADE_OUT_MS
+            ), audio_seconds)
+            with tempfile.TemporaryDirectory() as temp_dir:
+                narration, music = stream_mixer.open_inputs(narration_path, music_path, temp_dir, mixer.LOOP_CROSSFADE_MS)
+                measure("stream", lambda: sum(len(pcm) for pcm in stream_mixer.iter_normalized_pcm(
+                    narration, music, -20, mixer.MUSIC_FADE_IN_MS, mixer.MUSIC_FADE_OUT_MS
+                )), audio_seconds)
+                del narration, music
+
+            print(
+                f"  output pydub={pydub_mix.frame_rate}Hz/{pydub_mix.channels}ch "
+                f"numpy={numpy_mix.frame_rate}Hz/{numpy_mix.channels}ch, "
+                f"duration {len(pydub_mix) / 1000:.2f}s vs {len(numpy_mix) / 1000:.2f}s"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 4, 15], help="Story lengths to mix")
+    parser.add_argument("--encode", action="store_true", help="Time full renders to MP3, including the ffmpeg engine (needs ffmpeg)")
+    args = parser.parse_args()
+
+    if not numpy_mixer.NUMPY_AVAILABLE:
+        print("❌ ERROR: numpy is not installed")
+        return 1
+
+    run(args.minutes, args.encode)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
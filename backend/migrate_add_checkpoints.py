@@ -0,0 +1,33 @@
+"""
+Migration script to add workflow checkpoints to stories table
+Run this once to update existing database
+"""
+from sqlalchemy import text
+from app.core.database import engine
+
+
+def migrate():
+    """Add generation_checkpoint column"""
+    print("Starting migration...")
+
+    with engine.connect() as connection:
+        # Check if generation_checkpoint column exists
+        try:
+            result = connection.execute(text("SELECT generation_checkpoint FROM stories LIMIT 1"))
+            result.close()
+            print("✓ generation_checkpoint column already exists")
+        except Exception:
+            connection.rollback()
+            print("Adding generation_checkpoint column to stories table...")
+            connection.execute(text(
+                "ALTER TABLE stories ADD COLUMN generation_checkpoint TEXT"
+            ))
+            connection.commit()
+            print("✓ Added generation_checkpoint column")
+
+    print("\n✅ Migration completed successfully!")
+    print("Interrupted and failed stories can now resume from their last completed stage.")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,71 @@
+"""
+Migration script to add the audio_etags column to stories and story_versions,
+backfill it from the audio files already on disk, and index final_audio_path
+(the audio routes find a file's recorded ETag through it)
+Run this once to update existing database
+"""
+import json
+import os
+from sqlalchemy import text
+from app.core.database import engine
+from app.services.audio_etags import compute_etags
+
+
+TABLES = ("stories", "story_versions")
+
+
+def migrate():
+    """Add audio_etags column (JSON: file name -> strong ETag) and fill it in"""
+    print("Starting migration...")
+
+    with engine.connect() as connection:
+        for table in TABLES:
+            try:
+                result = connection.execute(text(f"SELECT audio_etags FROM {table} LIMIT 1"))
+                result.close()
+                print(f"✓ {table}.audio_etags column already exists")
+            except Exception:
+                connection.rollback()
+                print(f"Adding audio_etags column to {table} table...")
+                connection.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN audio_etags TEXT"
+                ))
+                connection.commit()
+                print(f"✓ Added {table}.audio_etags column")
+
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_final_audio_path ON {table} (final_audio_path)"
+            ))
+            connection.commit()
+            print(f"✓ {table}.final_audio_path is indexed")
+
+        for table in TABLES:
+            rows = connection.execute(text(
+                f"SELECT id, final_audio_path, audio_renditions FROM {table} "
+                "WHERE audio_etags IS NULL AND final_audio_path IS NOT NULL"
+            )).fetchall()
+
+            filled = 0
+            for row_id, final_audio_path, audio_renditions in rows:
+                paths = set(json.loads(audio_renditions).values()) if audio_renditions else set()
+                paths.add(final_audio_path)
+                # HLS playlists change while written; their segments are hashed on request
+                paths = [path for path in paths if os.path.isfile(path) and not path.endswith(".m3u8")]
+                if not paths:
+                    continue
+
+                connection.execute(
+                    text(f"UPDATE {table} SET audio_etags = :etags WHERE id = :id"),
+                    {"etags": json.dumps(compute_etags(paths)), "id": row_id}
+                )
+                connection.commit()
+                filled += 1
+
+            print(f"✓ Backfilled ETags for {filled} of {len(rows)} rows in {table}")
+
+    print("\n✅ Migration completed successfully!")
+    print("Audio responses now carry the stored ETags.")
+
+
+if __name__ == "__main__":
+    migrate()
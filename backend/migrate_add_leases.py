@@ -0,0 +1,47 @@
+"""
+Migration script to add job queue/lease columns to stories table
+Run this once to update existing database
+"""
+from sqlalchemy import text
+from app.core.database import engine
+
+
+LEASE_COLUMNS = {
+    "queued_at": "DATETIME",
+    "lease_owner": "VARCHAR(100)",
+    "lease_expires_at": "DATETIME",
+    "attempts": "INTEGER DEFAULT 0",
+}
+
+
+def migrate():
+    """Add queued_at, lease_owner, lease_expires_at and attempts columns"""
+    print("Starting migration...")
+
+    with engine.connect() as connection:
+        for column, column_type in LEASE_COLUMNS.items():
+            try:
+                result = connection.execute(text(f"SELECT {column} FROM stories LIMIT 1"))
+                result.close()
+                print(f"✓ {column} column already exists")
+            except Exception:
+                connection.rollback()
+                print(f"Adding {column} column to stories table...")
+                connection.execute(text(
+                    f"ALTER TABLE stories ADD COLUMN {column} {column_type}"
+                ))
+                connection.commit()
+                print(f"✓ Added {column} column")
+
+        # Existing pending stories keep their creation order in the queue
+        connection.execute(text(
+            "UPDATE stories SET queued_at = created_at WHERE queued_at IS NULL AND status = 'PENDING'"
+        ))
+        connection.commit()
+
+    print("\n✅ Migration completed successfully!")
+    print("Stories can now be claimed by `python -m app.worker`.")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,36 @@
+"""
+Migration script to add the audio_renditions column to stories and story_versions
+Run this once to update existing database
+"""
+from sqlalchemy import text
+from app.core.database import engine
+
+
+TABLES = ("stories", "story_versions")
+
+
+def migrate():
+    """Add audio_renditions column (JSON: encoded format -> file path)"""
+    print("Starting migration...")
+
+    with engine.connect() as connection:
+        for table in TABLES:
+            try:
+                result = connection.execute(text(f"SELECT audio_renditions FROM {table} LIMIT 1"))
+                result.close()
+                print(f"✓ {table}.audio_renditions column already exists")
+            except Exception:
+                connection.rollback()
+                print(f"Adding audio_renditions column to {table} table...")
+                connection.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN audio_renditions TEXT"
+                ))
+                connection.commit()
+                print(f"✓ Added {table}.audio_renditions column")
+
+    print("\n✅ Migration completed successfully!")
+    print("Existing stories keep serving their MP3; new stories are encoded into every AUDIO_RENDITIONS format.")
+
+
+if __name__ == "__main__":
+    migrate()
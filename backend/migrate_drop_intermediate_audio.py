@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Drop the narration and music WAVs finished stories still reference
+
+Stories completed before intermediate files were deleted after the mix keep
+their narration and music in audio_file_path / music_file_path, with blob
+references on the story and on every saved version. This releases those
+references (deleting blobs nothing else uses) and clears the fields, in
+batches of one transaction each. Files still loose in STORIES_DIR are left
+to the garbage collector (python -m app.gc).
+
+The narration-only fallback, where the narration is the final audio, is kept.
+
+Usage:
+    python migrate_drop_intermediate_audio.py --dry-run
+    python migrate_drop_intermediate_audio.py --batch-size 500
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.database import SessionLocal, init_db
+from app.models.story import Story, StoryVersion
+from app.services.blob_store import blob_store
+
+FIELDS = ("audio_file_path", "music_file_path")
+
+
+def intermediate_paths(row) -> set[str]:
+    """Paths in FIELDS that are not also the row's final audio or a rendition"""
+    kept = {row.final_audio_path}
+    if row.audio_renditions:
+        kept.update(json.loads(row.audio_renditions).values())
+    return {getattr(row, field) for field in FIELDS if getattr(row, field)} - kept
+
+
+def migrate_table(model, batch_size: int, dry_run: bool) -> dict:
+    stats = {"rows": 0, "blobs_deleted": 0, "bytes": 0}
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            batch = (
+                db.query(model)
+                .filter(model.id > last_id, (model.audio_file_path.isnot(None)) | (model.music_file_path.isnot(None)))
+                .order_by(model.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not batch:
+                return stats
+            last_id = batch[-1].id
+
+            released = []
+            for row in batch:
+                paths = intermediate_paths(row)
+                if not paths:
+                    continue
+                stats["rows"] += 1
+                if dry_run:
+                    continue
+                released += blob_store.release(db, paths)
+                for field in FIELDS:
+                    if getattr(row, field) in paths:
+                        setattr(row, field, None)
+
+            if dry_run:
+                continue
+            sizes = {blob_store.key_for(path): Path(path).stat().st_size for path in released if Path(path).exists()}
+            db.commit()
+        finally:
+            db.close()
+
+        blob_store.delete_files(released)
+        stats["blobs_deleted"] += len(released)
+        stats["bytes"] += sum(sizes.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Count affected rows without changing anything")
+    args = parser.parse_args()
+
+    print("Starting migration...")
+    init_db()
+
+    for model in (Story, StoryVersion):
+        stats = migrate_table(model, args.batch_size, args.dry_run)
+        if args.dry_run:
+            print(f"Dry run: {stats['rows']} {model.__tablename__} rows reference intermediate audio")
+        else:
+            print(
+                f"✓ {model.__tablename__}: {stats['rows']} rows cleared, {stats['blobs_deleted']} blobs deleted "
+                f"({stats['bytes'] / 1024 / 1024:.1f} MB on this node)"
+            )
+
+    if not args.dry_run:
+        print("\n✅ Migration completed successfully!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
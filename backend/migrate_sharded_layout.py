@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Move story audio out of the flat STORIES_DIR into the sharded layout
+
+- Finished audio, renditions, narration and music still loose in STORIES_DIR
+  (stories from before the blob store) become content-addressed blobs in
+  BLOB_STORE_DIR/ab/cd/<sha256>.<ext>, with reference counts and an alias so
+  their old audio URLs redirect to the new ones
+- Blobs in the earlier one-level layout (BLOB_STORE_DIR/ab/<sha256>.<ext>)
+  move one level down (also in remote storage)
+- Flat HLS directories (STORIES_DIR/story_*_hls) move to STORIES_DIR/hls/ab/cd/
+
+Stories are handled in batches, each with its saved versions. A batch first
+links or copies its files into the new layout, then updates final_audio_path,
+audio_url, audio_file_path, music_file_path, audio_renditions and audio_etags
+on stories and story_versions in one transaction, and only deletes the old
+copies after that commits. The old paths keep being served until then, so the
+migration can run while the API is up and can be interrupted at any point;
+a rerun resumes after the last committed batch (recorded in --state-file).
+
+Usage:
+    python migrate_sharded_layout.py --dry-run
+    python migrate_sharded_layout.py --batch-size 200
+    python migrate_sharded_layout.py --restart     # ignore recorded progress
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.core.config import settings
+from app.core.database import SessionLocal, init_db
+from app.models.audio_blob import AudioAlias, AudioBlob
+from app.models.story import Story, StoryVersion
+from app.services.audio_etags import digest_etag
+from app.services.blob_store import blob_store
+from app.services.renditions import RENDITION_PROFILES, hls_directory
+
+PATH_FIELDS = ("final_audio_path", "audio_file_path", "music_file_path")
+
+
+def row_paths(row) -> dict[str, str]:
+    """Every audio path on a row: field or rendition format -> path"""
+    paths = {field: getattr(row, field) for field in PATH_FIELDS if getattr(row, field)}
+    if row.audio_renditions:
+        for audio_format, path in json.loads(row.audio_renditions).items():
+            paths[f"rendition:{audio_format}"] = path
+    return paths
+
+
+def is_segmented(name: str) -> bool:
+    audio_format = name.partition(":")[2]
+    return bool(RENDITION_PROFILES.get(audio_format, {}).get("segmented"))
+
+
+def in_stories_dir(path: str) -> bool:
+    return os.path.dirname(os.path.abspath(path)) == os.path.abspath(settings.STORIES_DIR)
+
+
+class LayoutMigration:
+    """Moves one batch of stories at a time into the sharded layout"""
+
+    def __init__(self, batch_size: int, dry_run: bool, state_file: str):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.state_file = state_file
+        self.stats = {"stories": 0, "rows_updated": 0, "files": 0, "bytes": 0, "blobs_relocated": 0, "hls_dirs": 0}
+
+    def load_state(self) -> dict:
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                return json.load(f)
+        return {"last_story_id": 0, "blobs_done": False}
+
+    def save_state(self, state: dict):
+        if self.dry_run:
+            return
+        temp_path = f"{self.state_file}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_file)
+
+    def plan(self, path: str, name: str) -> str | None:
+        """What kind of move a path needs: "hls", "relocate", "store" or None"""
+        if is_segmented(name):
+            directory = os.path.dirname(path)
+            if in_stories_dir(directory) and os.path.isdir(directory):
+                return "hls"
+            return None
+        if blob_store.is_blob(path):
+            return None if blob_store.is_current(path) else "relocate"
+        if in_stories_dir(path) and os.path.isfile(path):
+            return "store"
+        return None
+
+    def stage(self, path: str, kind: str) -> tuple[str, str | None]:
+        """
+        Put a file (or HLS directory) into the new layout, keeping the old one
+
+        Returns:
+            Tuple of (new path, content digest if it became a blob)
+        """
+        if kind == "hls":
+            directory = os.path.dirname(path)
+            target_dir = hls_directory(settings.STORIES_DIR, os.path.basename(directory))
+            if not os.path.isdir(target_dir):
+                os.makedirs(os.path.dirname(target_dir), exist_ok=True)
+                try:
+                    shutil.copytree(directory, target_dir, copy_function=os.link)
+                except OSError:
+                    shutil.rmtree(target_dir, ignore_errors=True)
+                    shutil.copytree(directory, target_dir)
+            return os.path.join(target_dir, os.path.basename(path)), None
+        return blob_store.put(path, keep_source=True)
+
+    def migrate_batch(self, story_ids: list[int]) -> list:
+        """
+        Migrate a batch of stories and their versions
+
+        Returns:
+            Old files and directories to delete now that the batch committed
+        """
+        # Step 1: copy into the new layout, outside any transaction
+        db = SessionLocal()
+        try:
+            snapshot, moves = {}, {}
+            for story in db.query(Story).filter(Story.id.in_(story_ids)):
+                for row in (story, *story.versions):
+                    paths = row_paths(row)
+                    snapshot[(type(row), row.id)] = paths
+                    for name, path in paths.items():
+                        kind = self.plan(path, name)
+                        if kind and path not in moves:
+                            moves[path] = kind
+        finally:
+            db.close()
+
+        if self.dry_run:
+            for path, kind in moves.items():
+                self.stats["files"] += 1
+                if kind == "store":
+                    self.stats["bytes"] += os.path.getsize(path)
+            return []
+
+        staged = {path: self.stage(path, kind) for path, kind in moves.items() if kind != "relocate"}
+
+        # Step 2: point the rows at the new layout in one transaction
+        db = SessionLocal()
+        obsolete, in_use = [], set()
+        try:
+            for path, kind in moves.items():
+                if kind == "relocate":
+                    staged[path] = (blob_store.relocate(db, path), None)
+                    obsolete.append(("blob", path))
+                    self.stats["blobs_relocated"] += 1
+            for path, (new_path, digest) in staged.items():
+                # Deduplicated into a blob that is still in the one-level layout
+                if digest and not blob_store.is_current(new_path):
+                    staged[path] = (blob_store.relocate(db, new_path), digest)
+                    obsolete.append(("blob", new_path))
+                    self.stats["blobs_relocated"] += 1
+
+            for (model, row_id), paths in snapshot.items():
+                row = db.query(model).filter(model.id == row_id).with_for_update().first()
+                # Regenerated since step 1: its new audio is already in the blob store,
+                # but its old files stay until the garbage collector finds them unused
+                if row is None or row_paths(row) != paths:
+                    in_use.update(paths.values())
+                    continue
+                self.update_row(db, row, staged)
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        for path, kind in moves.items():
+            if path in in_use:
+                continue
+            if kind == "store":
+                obsolete.append(("file", path))
+                self.stats["files"] += 1
+                self.stats["bytes"] += os.path.getsize(path) if os.path.exists(path) else 0
+            elif kind == "hls":
+                obsolete.append(("dir", os.path.dirname(path)))
+                self.stats["hls_dirs"] += 1
+        return obsolete
+
+    def update_row(self, db, row, staged: dict[str, tuple[str, str | None]]):
+        """Rewrite a row's paths, URL and ETags, and count its new blob references"""
+        changed = False
+        new_blobs = set()
+        etags = json.loads(row.audio_etags) if row.audio_etags else {}
+
+        def remap(path: str | None) -> str | None:
+            nonlocal changed
+            if path not in staged:
+                return path
+            new_path, digest = staged[path]
+            changed = True
+            etag = etags.pop(os.path.basename(path), None)
+            if digest:
+                etag = digest_etag(digest)
+                new_blobs.add(new_path)
+            if etag:
+                etags[os.path.basename(new_path)] = etag
+            return new_path
+
+        old_final = row.final_audio_path
+        for field in PATH_FIELDS:
+            setattr(row, field, remap(getattr(row, field)))
+        if row.audio_renditions:
+            renditions = json.loads(row.audio_renditions)
+            old_renditions = dict(renditions)
+            renditions = {audio_format: remap(path) for audio_format, path in renditions.items()}
+            row.audio_renditions = json.dumps(renditions)
+        else:
+            old_renditions = {}
+        if not changed:
+            return
+
+        row.audio_etags = json.dumps(etags) if etags else None
+        if row.final_audio_path != old_final and row.audio_url:
+            row.audio_url = f"/api/v1/stories/audio/{os.path.basename(row.final_audio_path)}"
+
+        # Files that were loose before count one reference per row, like new stories
+        blob_store.acquire(db, new_blobs)
+
+        # Old audio URLs (and ?format= variants) redirect to the blobs
+        for old_path in {old_final, *old_renditions.values()}:
+            if old_path in staged and staged[old_path][1] and not blob_store.is_blob(old_path):
+                name = os.path.basename(old_path)
+                if not db.query(AudioAlias.id).filter(AudioAlias.name == name).first():
+                    db.add(AudioAlias(name=name, target=os.path.basename(staged[old_path][0])))
+                    db.flush()
+        self.stats["rows_updated"] += 1
+
+    def remove_obsolete(self, obsolete: list):
+        blobs = list(dict.fromkeys(path for kind, path in obsolete if kind == "blob"))
+        for kind, path in obsolete:
+            if kind == "file" and os.path.exists(path):
+                os.remove(path)
+            elif kind == "dir":
+                shutil.rmtree(path, ignore_errors=True)
+        blob_store.discard(blobs)
+
+    def migrate_unreferenced_blobs(self):
+        """Blobs no story points at (awaiting collection) still move, so only one layout remains"""
+        last_id = 0
+        while True:
+            db = SessionLocal()
+            try:
+                batch = db.query(AudioBlob).filter(AudioBlob.id > last_id).order_by(AudioBlob.id).limit(self.batch_size).all()
+                if not batch:
+                    return
+                last_id = batch[-1].id
+                legacy = [blob.path for blob in batch if not blob_store.is_current(blob.path)]
+                if self.dry_run:
+                    self.stats["files"] += len(legacy)
+                    continue
+                for path in legacy:
+                    blob_store.relocate(db, path)
+                db.commit()
+            finally:
+                db.close()
+            blob_store.discard(legacy)
+            self.stats["blobs_relocated"] += len(legacy)
+
+    def run(self, restart: bool = False):
+        state = {"last_story_id": 0, "blobs_done": False} if restart else self.load_state()
+        if state["last_story_id"]:
+            print(f"Resuming after story {state['last_story_id']}")
+
+        while True:
+            db = SessionLocal()
+            try:
+                story_ids = [
+                    story_id for (story_id,) in db.query(Story.id)
+                    .filter(Story.id > state["last_story_id"])
+                    .order_by(Story.id).limit(self.batch_size)
+                ]
+            finally:
+                db.close()
+            if not story_ids:
+                break
+
+            obsolete = self.migrate_batch(story_ids)
+            self.remove_obsolete(obsolete)
+            # Old copies left by an interruption before this point are garbage
+            # collected (nothing references them once the batch committed)
+            state["last_story_id"] = story_ids[-1]
+            self.save_state(state)
+
+            self.stats["stories"] += len(story_ids)
+            print(
+                f"✓ Stories up to {story_ids[-1]}: {self.stats['rows_updated']} rows updated, "
+                f"{self.stats['files']} files ({self.stats['bytes'] / 1024 / 1024:.1f} MB), "
+                f"{self.stats['blobs_relocated']} blobs relocated, {self.stats['hls_dirs']} HLS directories"
+            )
+
+        if not state["blobs_done"]:
+            self.migrate_unreferenced_blobs()
+            state["blobs_done"] = True
+            self.save_state(state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=100, help="Stories (with their versions) per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would move without changing anything")
+    parser.add_argument(
+        "--state-file", default=os.path.join(settings.STORIES_DIR, ".sharded_layout_migration.json"),
+        help="Where progress is recorded between runs"
+    )
+    parser.add_argument("--restart", action="store_true", help="Start from the first story again")
+    args = parser.parse_args()
+
+    print("Starting migration...")
+    init_db()  # Creates audio_aliases on existing databases
+
+    migration = LayoutMigration(args.batch_size, args.dry_run, args.state_file)
+    migration.run(restart=args.restart)
+
+    stats = migration.stats
+    if args.dry_run:
+        print(f"\nDry run: {stats['files']} files or blobs would move ({stats['bytes'] / 1024 / 1024:.1f} MB loose in STORIES_DIR)")
+        return 0
+
+    print("\n✅ Migration completed successfully!")
+    print(
+        f"{stats['stories']} stories checked, {stats['rows_updated']} rows updated, "
+        f"{stats['files']} loose files stored as blobs, {stats['blobs_relocated']} blobs relocated, "
+        f"{stats['hls_dirs']} HLS directories sharded"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Parity test for the ffmpeg filter-graph mix engine
+
+Mixes the same synthetic narration and (looping) music bed with a reference
+engine and with MIX_ENGINE=ffmpeg, decodes both MP3s and compares them:
+duration, peak ceiling and how closely the waveforms match once the
+overall gain is aligned (the ffmpeg engine limits instead of normalizing).
+
+Needs ffmpeg on PATH.
+
+Usage:
+    python test_mix_parity.py
+    python test_mix_parity.py --reference pydub --seconds 120
+"""
+import argparse
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path for imports
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.audio_mixer import AudioMixerService
+from app.services.numpy_mixer import load_pcm, resample
+from app.core.config import settings
+
+
+MAX_DURATION_DIFF_SECONDS = 0.05  # MP3 frame padding
+MIN_SNR_DB = 20.0
+MUSIC_BED_SECONDS = 20  # Short enough to force crossfaded loops
+
+
+def write_wav(path: str, samples: np.ndarray, rate: int):
+    with wave.open(path, 'wb') as wav_file:
+        wav_file.setnchannels(samples.shape[1])
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(np.clip(samples, -32768, 32767).astype("<i2").tobytes())
+
+
+def make_inputs(work_dir: str, seconds: float) -> tuple[str, str]:
+    rng = np.random.default_rng(1)
+
+    t = np.arange(int(seconds * 44100)) / 44100
+    envelope = (np.sin(2 * np.pi * 0.5 * t) > -0.2).astype(np.float32)
+    narration = (envelope * (9000 * np.sin(2 * np.pi * 200 * t) + rng.normal(0, 1000, t.size)))[:, None]
+    narration_path = f"{work_dir}/narration.wav"
+    write_wav(narration_path, narration, 44100)
+
+    t = np.arange(MUSIC_BED_SECONDS * 48000) / 48000
+    chord = sum(np.sin(2 * np.pi * f * t) for f in (261.6, 329.6, 392.0)) * 7000
+    music_path = f"{work_dir}/music.wav"
+    write_wav(music_path, np.stack([chord, chord * 0.8], axis=1), 48000)
+
+    return narration_path, music_path
+
+
+def render(engine: str, narration_path: str, music_path: str, output_path: str) -> float:
+    settings.MIX_ENGINE = engine
+    start = time.perf_counter()
+    AudioMixerService().mix_audio_sync(narration_path, music_path, output_path)
+    elapsed = time.perf_counter() - start
+    print(f"✓ {engine:<6} rendered in {elapsed:.2f}s")
+    return elapsed
+
+
+def compare(reference_path: str, candidate_path: str) -> bool:
+    reference, reference_rate = load_pcm(reference_path)
+    candidate, candidate_rate = load_pcm(candidate_path)
+    reference = resample(reference, reference_rate, 44100)
+    candidate = resample(candidate, candidate_rate, 44100)
+
+    ok = True
+    duration_diff = abs(len(reference) - len(candidate)) / 44100
+    if duration_diff <= MAX_DURATION_DIFF_SECONDS:
+        print(f"✓ Duration matches ({len(candidate) / 44100:.3f}s, diff {duration_diff * 1000:.1f} ms)")
+    else:
+        print(f"❌ Duration differs by {duration_diff:.3f}s")
+        ok = False
+
+    peak = float(np.max(np.abs(candidate)))
+    if peak <= 1.0:
+        print(f"✓ Peak within ceiling ({20 * np.log10(max(peak, 1e-9)):.2f} dBFS)")
+    else:
+        print(f"❌ Output clips (peak {peak:.3f})")
+        ok = False
+
+    frames = min(len(reference), len(candidate))
+    a = reference[:frames].ravel().astype(np.float64)
+    b = candidate[:frames].ravel().astype(np.float64)
+    gain = float(a @ b) / float(b @ b) if b.any() else 0.0
+    residual = a - gain * b
+    snr = 10 * np.log10(float(a @ a) / max(float(residual @ residual), 1e-12))
+    if snr >= MIN_SNR_DB:
+        print(f"✓ Waveforms match: SNR {snr:.1f} dB after {20 * np.log10(abs(gain) or 1e-9):+.2f} dB gain alignment")
+    else:
+        print(f"❌ Waveforms differ: SNR {snr:.1f} dB (need {MIN_SNR_DB} dB)")
+        ok = False
+
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reference", choices=["numpy", "pydub", "stream"], default="numpy")
+    parser.add_argument("--seconds", type=float, default=75, help="Narration length")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Mix parity: ffmpeg filter graph vs. {args.reference}")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        narration_path, music_path = make_inputs(work_dir, args.seconds)
+        try:
+            render(args.reference, narration_path, music_path, f"{work_dir}/reference.mp3")
+            render("ffmpeg", narration_path, music_path, f"{work_dir}/ffmpeg.mp3")
+        except Exception as e:
+            print(f"❌ ERROR: {e}")
+            return 1
+
+        ok = compare(f"{work_dir}/reference.mp3", f"{work_dir}/ffmpeg.mp3")
+
+    print("=" * 60)
+    print("✅ PARITY TEST PASSED" if ok else "❌ PARITY TEST FAILED")
+    print("=" * 60)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())